@@ -0,0 +1,260 @@
+"""
+Benchmarks of the generation hot paths and of the database write strategies.
+
+  python -m benchmarks run [--save]            time every case, --save rewrites the baseline
+  python -m benchmarks compare [--threshold]   time every case and flag regressions vs the baseline
+  python -m benchmarks writes                  load a generated dataset with every write strategy
+  python -m benchmarks memory                  peak memory of the generation pipelines at growing
+                                               row counts, fails over the ceiling or when it grows
+  python -m benchmarks startup [--max-ms]      time a fresh interpreter loading every stage alone
+                                               and all of them, fails over --max-ms
+
+run, compare, memory and startup never connect to the database or MinIO, only config.<ENV>.yaml is read.
+writes needs the database of config.<ENV>.yaml with the schema applied, it loads into bench_*
+copies of the tables and drops them afterwards.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Callable
+
+from benchmarks.dataset import TABLES, build_dataset
+from benchmarks.generators import generator_cases
+from benchmarks.harness import (
+    DEFAULT_REPEAT,
+    DEFAULT_THRESHOLD,
+    compare,
+    load_results,
+    run_cases,
+    save_results,
+)
+from benchmarks.memory import (
+    DEFAULT_CEILING_MB,
+    DEFAULT_GROWTH,
+    DEFAULT_SCALES,
+    MIN_SCALE_RATIO,
+    PIPELINES,
+    check_memory,
+    run_memory,
+)
+from benchmarks.startup import DEFAULT_REPEAT as DEFAULT_STARTUP_REPEAT, run_startup
+from benchmarks.writes import DEFAULT_BATCH_SIZES, STRATEGIES, run_writes
+from general_utils.db import DatabasePool
+from seeders.cli import STAGE_NAMES, positive_float, positive_int, seed_generators
+from seeders.load import connect, load_config
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Fixed seed so every run generates the same values (title formats, attribute lengths, ...)
+BENCHMARK_SEED = 1234
+
+
+def names_of(allowed) -> Callable[[str], list[str]]:
+
+  def parse(value: str) -> list[str]:
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+      raise argparse.ArgumentTypeError(
+          f"unknown value(s) {', '.join(unknown)}, expected some of: {', '.join(allowed)}")
+    return names
+
+  return parse
+
+
+def batch_sizes(value: str) -> list[int]:
+  return [positive_int(size) for size in value.split(',') if size.strip()]
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                   description="offline generator micro-benchmarks")
+  commands = parser.add_subparsers(dest='command', required=True)
+
+  run = commands.add_parser('run', help="time the cases")
+  run.add_argument('--save', action='store_true', help=f"write the results to {BASELINE}")
+  run.add_argument('--output', metavar='FILE', help="write the results to FILE")
+
+  check = commands.add_parser('compare', help="time the cases and compare them to a baseline")
+  check.add_argument('--baseline', metavar='FILE', default=BASELINE)
+  check.add_argument('--current',
+                     metavar='FILE',
+                     help="compare the results saved in FILE instead of running the cases")
+  check.add_argument('--threshold',
+                     type=positive_float,
+                     default=DEFAULT_THRESHOLD,
+                     help=f"allowed slowdown as a fraction (default {DEFAULT_THRESHOLD})")
+
+  writes = commands.add_parser('writes',
+                               help="time every write strategy against the database")
+  writes.add_argument('--tables', type=names_of(TABLES), default=list(TABLES))
+  writes.add_argument('--strategies', type=names_of(STRATEGIES), default=list(STRATEGIES))
+  writes.add_argument('--batch-sizes',
+                      type=batch_sizes,
+                      default=list(DEFAULT_BATCH_SIZES),
+                      help="comma separated (default %(default)s)")
+  writes.add_argument('--rows',
+                      type=positive_int,
+                      default=2000,
+                      help="rows generated for every table (default %(default)s)")
+  writes.add_argument('--output', metavar='FILE', help="write the results to FILE as JSON")
+
+  memory = commands.add_parser('memory',
+                               help="check that peak memory stays flat as the rows grow")
+  memory.add_argument('--pipelines', type=names_of(PIPELINES), default=list(PIPELINES))
+  memory.add_argument('--scales',
+                      type=batch_sizes,
+                      default=list(DEFAULT_SCALES),
+                      help="comma separated row counts (default %(default)s)")
+  memory.add_argument('--ceiling-mb',
+                      type=positive_float,
+                      default=DEFAULT_CEILING_MB,
+                      help="peak allowed for any pipeline, in MiB (default %(default)s)")
+  memory.add_argument('--growth',
+                      type=positive_float,
+                      default=DEFAULT_GROWTH,
+                      help="peak growth allowed from the smallest to the largest scale, as a "
+                      "fraction (default %(default)s)")
+
+  startup = commands.add_parser('startup',
+                                help="time the imports a run pays before seeding anything")
+  startup.add_argument('--stages', type=names_of(STAGE_NAMES), default=list(STAGE_NAMES))
+  startup.add_argument('--repeat', type=positive_int, default=DEFAULT_STARTUP_REPEAT)
+  startup.add_argument('--max-ms',
+                       type=positive_float,
+                       help="startup allowed for a single stage (process, in ms)")
+  startup.add_argument('--output', metavar='FILE', help="write the results to FILE as JSON")
+
+  for command in (run, check):
+    command.add_argument('--filter', metavar='TEXT', help="only run the cases containing TEXT")
+    command.add_argument('--repeat', type=positive_int, default=DEFAULT_REPEAT)
+
+  return parser.parse_args(argv)
+
+
+def seeded_config():
+  config = load_config()
+  config.seeding.seed = BENCHMARK_SEED
+  seed_generators(config)
+  return config
+
+
+def collect(args: argparse.Namespace):
+  config = seeded_config()
+  cases = generator_cases(config)
+  if args.filter:
+    cases = {name: fn for name, fn in cases.items() if args.filter in name}
+  if not cases:
+    print(f"❌ No benchmark case matches '{args.filter}'", file=sys.stderr)
+    sys.exit(2)
+
+  print(f"Running {len(cases)} benchmark cases")
+  return run_cases(cases, args.repeat)
+
+
+def measure_writes(args: argparse.Namespace):
+  config = seeded_config()
+  print(f"Generating {args.rows} rows for {', '.join(args.tables)}")
+  dataset = build_dataset(config, args.rows, args.tables)
+
+  connect(config)
+  conn = DatabasePool.get_conn()
+  try:
+    conn.autocommit = False
+    results = run_writes(conn, dataset, args.strategies, args.batch_sizes)
+  finally:
+    DatabasePool.release_conn(conn)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
+      f.write('\n')
+    print(f"✅ Results written to {args.output}")
+
+
+def measure_memory(args: argparse.Namespace):
+  config = seeded_config()
+  if min(args.scales) < 2 * config.seeding.batch_size:
+    # A single partial batch is smaller than the full batches of the larger scales
+    print(f"❌ Scales must be at least 2 x batch_size ({2 * config.seeding.batch_size} rows)",
+          file=sys.stderr)
+    sys.exit(2)
+  if max(args.scales) < MIN_SCALE_RATIO * min(args.scales):
+    print(f"❌ The largest scale must be at least {MIN_SCALE_RATIO} x the smallest one",
+          file=sys.stderr)
+    sys.exit(2)
+  # Several windows even at the smallest scale, otherwise the whole catalog is one window
+  config.seeding.catalog_window = min(config.seeding.catalog_window, max(1, min(args.scales) // 4))
+  print(f"Measuring peak memory of {', '.join(args.pipelines)} "
+        f"(batch_size {config.seeding.batch_size}, catalog_window {config.seeding.catalog_window})")
+  results = run_memory(config, args.pipelines, sorted(args.scales))
+  failures = check_memory(results, args.ceiling_mb, args.growth)
+  if failures:
+    sys.exit(1)
+  print(f"✅ Peak memory flat and under {args.ceiling_mb} MiB")
+
+
+def measure_startup(args: argparse.Namespace):
+  cases = {stage: [stage] for stage in args.stages}
+  cases['all'] = list(args.stages)
+  print(f"Measuring startup of {', '.join(args.stages)} (median of {args.repeat} interpreters)")
+  results = run_startup(cases, args.repeat)
+
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2)
+      f.write('\n')
+    print(f"✅ Results written to {args.output}")
+
+  if args.max_ms:
+    slow = [stage for stage in args.stages if results[stage]['process_ms'] > args.max_ms]
+    if slow:
+      print(f"⚠️ Startup over {args.max_ms} ms: {', '.join(slow)}")
+      sys.exit(1)
+    print(f"✅ Every stage starts in under {args.max_ms} ms")
+
+
+def main(argv: list[str] | None = None):
+  args = parse_args(argv)
+
+  if args.command == 'writes':
+    measure_writes(args)
+    return
+
+  if args.command == 'memory':
+    measure_memory(args)
+    return
+
+  if args.command == 'startup':
+    measure_startup(args)
+    return
+
+  if args.command == 'run':
+    results = collect(args)
+    for path in filter(None, [BASELINE if args.save else None, args.output]):
+      save_results(path, results)
+      print(f"✅ Results written to {path}")
+    return
+
+  if not os.path.exists(args.baseline):
+    print(f"❌ Baseline {args.baseline} not found, record one with `run --save`", file=sys.stderr)
+    sys.exit(2)
+
+  baseline = load_results(args.baseline)
+  if args.filter:
+    baseline['results'] = {
+        name: result
+        for name, result in baseline['results'].items() if args.filter in name
+    }
+  current = load_results(args.current)['results'] if args.current else collect(args)
+  regressions = compare(baseline, current, args.threshold)
+  if regressions:
+    print(f"⚠️ {len(regressions)} case(s) slower than the baseline by more than "
+          f"{args.threshold:.0%}: {', '.join(regressions)}")
+    sys.exit(1)
+  print("✅ No regressions")
+
+
+if __name__ == "__main__":
+  main()
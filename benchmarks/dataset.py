@@ -0,0 +1,95 @@
+import contextlib
+import io
+
+import numpy as np
+from ulid import ULID
+
+from benchmarks.generators import load_subcategories
+from general_utils.general import password_hash
+from models.config import Config
+from seeders.catalog import ProductCatalog, price_order_batch
+from seeders.inventory_ledger import InventoryLedger
+from seeders.seed_orders import ORDER_TABLE_COLUMNS, order_line_item_row, order_line_items
+from seeders.seed_products import PRODUCT_COLUMNS, ProductGenerator, product_row
+from seeders.seed_users import USER_COLUMNS, UserType, user_row
+
+TABLES = ('users', 'products', 'order_line_items')
+
+# One supplier for every SUPPLIER_SHARE users, the rest are customers
+SUPPLIER_SHARE = 10
+
+
+def build_dataset(cfg: Config, rows: int, tables=TABLES) -> dict[str, tuple[tuple[str, ...], list[tuple]]]:
+  """
+    `rows` rows of every table, made by the same functions the seeding stages use, without a
+    database: products reference the generated suppliers and line items are priced and reserved
+    against a catalog and inventory built from the generated products.
+    Returns {table: (columns, rows)}.
+    """
+  dataset = {}
+  # The generators log every placeholder image and skipped attachment folder
+  with contextlib.redirect_stdout(io.StringIO()):
+    users = generate_users(max(rows, SUPPLIER_SHARE))
+    suppliers = [user[0] for user in users if user[5] == UserType.SUPPLIER.value]
+    if 'users' in tables:
+      dataset['users'] = (USER_COLUMNS, users[:rows])
+
+    if 'products' in tables or 'order_line_items' in tables:
+      products = generate_products(cfg, suppliers, rows)
+      if 'products' in tables:
+        dataset['products'] = (PRODUCT_COLUMNS, [args for args, _, _ in products])
+      if 'order_line_items' in tables:
+        dataset['order_line_items'] = (ORDER_TABLE_COLUMNS['order_line_items'],
+                                       generate_line_items(products, rows, cfg.seeding.seed))
+  return dataset
+
+
+def generate_users(count: int) -> list[tuple]:
+  password, err = password_hash("password")
+  if err:
+    raise RuntimeError("failed to hash a password, generate_users", err)
+
+  users = []
+  for number in range(1, count + 1):
+    user_type = UserType.SUPPLIER if number % SUPPLIER_SHARE == 1 else UserType.CUSTOMER
+    users.append(user_row(user_type, number, password))
+  return users
+
+
+def generate_products(cfg: Config, supplier_ids: list[str], count: int):
+  generator = ProductGenerator(cfg, connect_storage=False)
+  subcategories = load_subcategories()
+  return [
+      product_row(generator, supplier_ids[i % len(supplier_ids)],
+                  subcategories[i % len(subcategories)], str(ULID())) for i in range(count)
+  ]
+
+
+def generate_line_items(products, count: int, seed: int | None) -> list[tuple]:
+  """Line item rows of orders cycling through the products, like seed_orders_partition does"""
+  catalog = ProductCatalog.from_rows([(args[0], title, offer) for args, title, offer in products])
+  ledger = InventoryLedger.from_records(
+      (str(ULID()), catalog.product_ids[p], catalog.variant_ids[v], int(catalog.quantity[v]), 0)
+      for p in range(len(catalog))
+      for v in range(catalog.variant_offsets[p], catalog.variant_offsets[p + 1]))
+  entries, available = catalog.bind_inventory(ledger)
+  rng = np.random.default_rng(seed)
+
+  rows: list[tuple] = []
+  batch_size = min(500, len(catalog))
+  product_idx = 0
+  while len(rows) < count:
+    product_indices = (product_idx + 1 + np.arange(batch_size)) % len(catalog)
+    product_idx = int(product_indices[-1])
+    lines = price_order_batch(catalog, available, product_indices, rng)
+    if not len(lines.order):
+      break  # every variant ran out of stock
+
+    line_starts = np.searchsorted(lines.order, np.arange(batch_size + 1))
+    for i in range(batch_size):
+      order_id = str(ULID())
+      items = order_line_items(catalog, entries, ledger, lines, line_starts[i], line_starts[i + 1],
+                               int(product_indices[i]), order_id)
+      rows.extend(order_line_item_row(order_id, item) for item in items)
+
+  return rows[:count]
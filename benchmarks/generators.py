@@ -0,0 +1,75 @@
+import json
+import os
+from typing import Any, Callable
+
+from general_utils.value_pools import POOLS, ValuePools
+from models.config import Config
+from seeders.orders import create_successful_payment
+from seeders.product_title import generate_product_title
+from seeders.products import generate_random_ean, generate_random_upc
+from seeders.seed_products import ProductGenerator
+
+FIXTURE = os.path.join(os.path.dirname(__file__), 'fixtures', 'fashion_category.json')
+
+# Variants of the largest products, their names are deduped against each other
+VARIANTS_PER_PRODUCT = 4
+
+
+def load_subcategories() -> list[dict[str, Any]]:
+  """Fashion subcategories shaped like the `categories` row the products stage reads"""
+  with open(FIXTURE, 'r') as f:
+    return json.load(f)['subcategories']
+
+
+def generator_cases(cfg: Config) -> dict[str, Callable[[], Any]]:
+  """The per-row generation hot paths, run against the fixture without a database or MinIO"""
+  generator = ProductGenerator(cfg, connect_storage=False)
+  subcategories = load_subcategories()
+  cases: dict[str, Callable[[], Any]] = {}
+
+  for subcategory in subcategories:
+    subcategory_id = subcategory['id']
+    attributes = list(subcategory['attributes'].values())
+    variant_attrs = {
+        attr_id: attr
+        for attr_id, attr in subcategory['attributes'].items()
+        if attr.get('include_in_variants')
+    }
+    variant_data = {
+        attr_id: generator.generate_any_value(attr)
+        for attr_id, attr in variant_attrs.items()
+    }
+
+    def title(subcategory_id=subcategory_id):
+      return generate_product_title(subcategory_id)
+
+    def any_values(attributes=attributes):
+      return [generator.generate_any_value(attr) for attr in attributes]
+
+    def variant_names(subcategory_id=subcategory_id, variant_data=variant_data):
+      used_names: set[str] = set()
+      return [
+          generator.generate_variant_name(subcategory_id, variant_data, used_names)
+          for _ in range(VARIANTS_PER_PRODUCT)
+      ]
+
+    cases[f"generate_product_title[{subcategory_id}]"] = title
+    cases[f"generate_any_value[{subcategory_id}]"] = any_values
+    cases[f"generate_variant_name[{subcategory_id}]"] = variant_names
+
+  variant_ids = ['01JBENCHVARIANT00000000001', '01JBENCHVARIANT00000000002',
+                 '01JBENCHVARIANT00000000003']
+  cases['generate_product_offer[single]'] = lambda: generator.generate_product_offer(
+      False, variant_ids[0])
+  cases['generate_product_offer[variants]'] = lambda: generator.generate_product_offer(
+      True, variant_ids[0], variant_ids)
+  cases['generate_random_upc'] = generate_random_upc
+  cases['generate_random_ean'] = generate_random_ean
+  cases['create_successful_payment'] = lambda: create_successful_payment(4999, 'USD')
+  for name in POOLS:
+    # Opened (built the first time) outside of the timed draws
+    ValuePools.pool(name)
+    cases[f"value_pool[{name}]"] = lambda name=name: ValuePools.draw(name)
+  ValuePools.corpus()
+  cases['text_corpus[10-200]'] = lambda: ValuePools.text(10, 200)
+  return cases
@@ -0,0 +1,105 @@
+import json
+import platform
+import statistics
+import timeit
+from typing import Any, Callable
+
+# A case is flagged when its median time per call grew by more than this fraction of the baseline
+DEFAULT_THRESHOLD = 0.15
+DEFAULT_REPEAT = 15
+
+
+def reference_workload() -> list[str]:
+  """Fixed interpreter work (integer math, string formatting, sorting) timed next to every case"""
+  return sorted(f"{i * 7919 % 1009:04d}-{i}" for i in range(200))
+
+
+def measure(fn: Callable[[], Any], repeat: int = DEFAULT_REPEAT) -> dict[str, float]:
+  """
+    Times `fn` like `python -m timeit`: autorange() picks the number of calls that takes at least
+    0.2s, then that many calls are timed `repeat` times. The median run is the one compared
+    against the baseline, a single lucky best run made unchanged cases look slower. Each run is
+    followed by a run of reference_workload(), whose median tells how fast the machine was while
+    this case ran.
+    """
+  timer, reference = timeit.Timer(fn), timeit.Timer(reference_workload)
+  number, _ = timer.autorange()
+  reference_number, _ = reference.autorange()
+  per_call, reference_per_call = [], []
+  for _ in range(repeat):
+    per_call.append(timer.timeit(number) / number * 1e9)
+    reference_per_call.append(reference.timeit(reference_number) / reference_number * 1e9)
+  return {
+      'ns_per_call': round(min(per_call), 1),
+      'median_ns': round(statistics.median(per_call), 1),
+      'reference_ns': round(statistics.median(reference_per_call), 1),
+      'calls': number * repeat,
+  }
+
+
+def run_cases(cases: dict[str, Callable[[], Any]],
+              repeat: int = DEFAULT_REPEAT) -> dict[str, dict[str, float]]:
+  results = {}
+  for name, fn in cases.items():
+    results[name] = measure(fn, repeat)
+    print(f"  {name:<45} {format_ns(results[name]['median_ns']):>10}/call "
+          f"(best {format_ns(results[name]['ns_per_call'])}, {results[name]['calls']} calls)")
+  return results
+
+
+def format_ns(ns: float) -> str:
+  if ns >= 1e6:
+    return f"{ns / 1e6:.2f} ms"
+  if ns >= 1e3:
+    return f"{ns / 1e3:.2f} µs"
+  return f"{ns:.0f} ns"
+
+
+def save_results(path: str, results: dict[str, dict[str, float]]):
+  document = {
+      'python': platform.python_version(),
+      'machine': f"{platform.system()} {platform.machine()}",
+      'results': results,
+  }
+  with open(path, 'w') as f:
+    json.dump(document, f, indent=2, sort_keys=True)
+    f.write('\n')
+
+
+def load_results(path: str) -> dict[str, Any]:
+  with open(path, 'r') as f:
+    return json.load(f)
+
+
+def compare(baseline: dict[str, Any], current: dict[str, dict[str, float]],
+            threshold: float = DEFAULT_THRESHOLD) -> list[str]:
+  """
+    Prints current vs baseline per case, returns the names of the cases that regressed. When both
+    runs timed the reference workload next to a case, its baseline is scaled by how much slower
+    or faster the machine was this time, so a busy or throttled host does not flag every case.
+    """
+  base = baseline.get('results', {})
+  regressions = []
+
+  print(f"Baseline recorded with Python {baseline.get('python', '?')} on "
+        f"{baseline.get('machine', '?')}, threshold +{threshold:.0%}")
+  for name, result in current.items():
+    if name not in base:
+      print(f"  {name:<45} {format_ns(result['median_ns']):>10}  (no baseline)")
+      continue
+
+    before, after = base[name]['median_ns'], result['median_ns']
+    if base[name].get('reference_ns') and result.get('reference_ns'):
+      before *= result['reference_ns'] / base[name]['reference_ns']
+    change = (after - before) / before if before else 0.0
+    mark = ''
+    if change > threshold:
+      mark = '  ⚠️ regression'
+      regressions.append(name)
+    elif change < -threshold:
+      mark = '  ✅ faster'
+    print(f"  {name:<45} {format_ns(before):>10} → {format_ns(after):>10}  {change:+.1%}{mark}")
+
+  for name in sorted(base.keys() - current.keys()):
+    print(f"  {name:<45} missing from the current run")
+  return regressions
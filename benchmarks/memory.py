@@ -0,0 +1,153 @@
+"""
+Peak memory of the generation pipelines (source -> rows -> batched file sink), measured with
+tracemalloc at growing row counts. A pipeline streams: its peak must not grow with the rows.
+"""
+import contextlib
+import os
+import tempfile
+import tracemalloc
+from itertools import islice
+from typing import Any, Callable, Iterator
+
+from ulid import ULID
+
+from benchmarks.generators import load_subcategories
+from general_utils.general import password_hash
+from general_utils.sinks import FileSink
+from models.config import Config, ConfigExport
+from seeders.catalog import variant_summaries
+from seeders.registry import SeedRegistry
+from seeders.seed_orders import seed_orders
+from seeders.seed_products import PRODUCT_COLUMNS, ProductGenerator, product_row
+from seeders.seed_users import USER_COLUMNS, UserType, user_row
+
+PIPELINES = ('users', 'products', 'orders')
+DEFAULT_SCALES = (1000, 10000)
+# Smallest ratio between the largest and the smallest scale, closer scales hide per-row growth
+MIN_SCALE_RATIO = 10
+DEFAULT_CEILING_MB = 256
+# Peak growth tolerated from the smallest to the largest scale, as a fraction of the smallest
+DEFAULT_GROWTH = 0.25
+
+
+def batched(rows: Iterator, size: int) -> Iterator[list]:
+  while True:
+    batch = list(islice(rows, size))
+    if not batch:
+      return
+    yield batch
+
+
+def user_rows(count: int) -> Iterator[tuple]:
+  password, err = password_hash("password")
+  if err:
+    raise RuntimeError("failed to hash a password, user_rows", err)
+  for number in range(1, count + 1):
+    yield user_row(UserType.CUSTOMER, number, password)
+
+
+def product_rows(cfg: Config, count: int) -> Iterator[tuple[tuple, str, dict[str, Any]]]:
+  generator = ProductGenerator(cfg, connect_storage=False)
+  subcategories = load_subcategories()
+  for i in range(count):
+    yield product_row(generator, 'supplier', subcategories[i % len(subcategories)], str(ULID()))
+
+
+class NoDatabase:
+  """Connection handed to seed_orders while exporting, its cursor is None so no query can run"""
+
+  def cursor(self):
+    return contextlib.nullcontext()
+
+  def commit(self):
+    pass
+
+  def rollback(self):
+    pass
+
+
+def export_orders(cfg: Config, count: int):
+  """
+    One order for each of `count` customers, seeded by seed_orders into the sink. Customers,
+    products and inventory come from a registry holding catalog_window rows of a kind, the rest
+    is spilled to its scratch files like in an --export past registry_max_rows.
+    """
+  registry = SeedRegistry(cfg.seeding.catalog_window, spill=True)
+  try:
+    for args, title, offer in product_rows(cfg, count):
+      registry.publish_user('customer', str(ULID()), ['customer'])
+      registry.publish_product(args[0], title, offer)
+      for variant_id, _, _, _, _, quantity in variant_summaries(offer):
+        registry.publish_inventory(str(ULID()), args[0], variant_id, quantity)
+
+    orders_cfg = cfg.model_copy(deep=True)
+    orders_cfg.seeding.number_of_customers_have_orders = count
+    orders_cfg.seeding.number_of_orders_per_customer = 1
+    orders_cfg.seeding.workers = 1
+    orders_cfg.seeding.commit_every = 0
+    orders_cfg.seeding.top_up = False
+    orders_cfg.seeding.resume = False
+    seed_orders(NoDatabase(), orders_cfg, registry)
+  finally:
+    registry.close()
+
+
+def pipeline(cfg: Config, name: str, rows: int) -> Callable[[], None]:
+  """Generates `rows` rows (orders: customers) of the pipeline and writes them to the sink"""
+
+  def run():
+    if name == 'users':
+      source, columns = user_rows(rows), USER_COLUMNS
+    elif name == 'products':
+      source = (args for args, _, _ in product_rows(cfg, rows))
+      columns = PRODUCT_COLUMNS
+    else:
+      export_orders(cfg, rows)
+      return
+    for batch in batched(source, cfg.seeding.batch_size):
+      FileSink.write(name, columns, batch)
+
+  return run
+
+
+def peak_bytes(fn: Callable[[], None]) -> int:
+  tracemalloc.start()
+  try:
+    fn()
+    return tracemalloc.get_traced_memory()[1]
+  finally:
+    tracemalloc.stop()
+
+
+def run_memory(cfg: Config, pipelines, scales) -> dict[str, dict[int, int]]:
+  """Peak traced bytes of every pipeline at every scale, the sink writes to a scratch directory"""
+  results: dict[str, dict[int, int]] = {}
+  for name in pipelines:
+    results[name] = {}
+    for rows in scales:
+      with tempfile.TemporaryDirectory() as directory:
+        FileSink.configure(ConfigExport(directory=directory, format='tsv'))
+        try:
+          # The generators log every placeholder image, kept in memory it would be measured too
+          with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            results[name][rows] = peak_bytes(pipeline(cfg, name, rows))
+        finally:
+          FileSink.close(False)
+      print(f"  {name:<18} {rows:>9} rows  peak {results[name][rows] / 2**20:8.1f} MiB")
+  return results
+
+
+def check_memory(results: dict[str, dict[int, int]], ceiling_mb: float, growth: float) -> list[str]:
+  """Pipelines over the ceiling or whose peak grows with the rows, a ⚠️ line for each"""
+  failures = []
+  for name, peaks in results.items():
+    scales = sorted(peaks)
+    smallest, largest = peaks[scales[0]], peaks[scales[-1]]
+    if max(peaks.values()) > ceiling_mb * 2**20:
+      print(f"⚠️ {name}: peak {max(peaks.values()) / 2**20:.1f} MiB over the {ceiling_mb} MiB ceiling")
+      failures.append(name)
+    elif largest - smallest > smallest * growth:
+      print(f"⚠️ {name}: peak grows from {smallest / 2**20:.1f} MiB ({scales[0]} rows) "
+            f"to {largest / 2**20:.1f} MiB ({scales[-1]} rows)")
+      failures.append(name)
+  return failures
@@ -0,0 +1,51 @@
+"""
+Startup time of targeted runs: a fresh interpreter importing main.py and loading the entry points
+of the selected stages, which is what a run pays before it generates anything.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+DEFAULT_REPEAT = 5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in the child, prints the seconds spent importing (interpreter startup excluded)
+LOAD_STAGES = """
+import sys, time
+start = time.perf_counter()
+import main
+from seeders.stages import STAGES
+for stage in STAGES:
+  if stage.name in sys.argv[1:]:
+    stage.run.load()
+print(time.perf_counter() - start)
+"""
+
+
+def startup_seconds(stages: list[str]) -> tuple[float, float]:
+  """(whole process, imports only) seconds of one fresh interpreter loading the stages"""
+  start = time.perf_counter()
+  result = subprocess.run([sys.executable, '-c', LOAD_STAGES, *stages],
+                          cwd=ROOT,
+                          capture_output=True,
+                          text=True,
+                          check=True)
+  process = time.perf_counter() - start
+  return process, float(result.stdout.strip().splitlines()[-1])
+
+
+def run_startup(cases: dict[str, list[str]], repeat: int) -> dict[str, dict[str, float]]:
+  """Median milliseconds of every case (a name for a list of stages) over `repeat` interpreters"""
+  results: dict[str, dict[str, float]] = {}
+  for name, stages in cases.items():
+    samples = [startup_seconds(stages) for _ in range(repeat)]
+    results[name] = {
+        'process_ms': statistics.median(process for process, _ in samples) * 1000,
+        'imports_ms': statistics.median(imports for _, imports in samples) * 1000,
+    }
+    print(f"  {name:<18} process {results[name]['process_ms']:8.1f} ms  "
+          f"imports {results[name]['imports_ms']:8.1f} ms")
+  return results
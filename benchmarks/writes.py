@@ -0,0 +1,164 @@
+import json
+import time
+from typing import Any, Callable
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import connection, cursor
+from psycopg2.extras import Json, execute_batch, execute_values
+
+from general_utils.copy_writer import CopyWriter, copy_line
+
+STRATEGIES = ('row', 'execute_batch', 'execute_values', 'copy', 'server_side')
+DEFAULT_BATCH_SIZES = (100, 1000, 5000)
+
+# COPY buffers are flushed by row count only, like seeding.copy_max_rows
+NO_BYTE_LIMIT = 1 << 62
+
+Loader = Callable[[cursor, str, tuple[str, ...], list[tuple], int], None]
+
+
+def scratch_table(table: str) -> str:
+  return f"bench_{table}"
+
+
+def load_row(cur: cursor, table: str, columns: tuple[str, ...], rows: list[tuple], _: int):
+  stmt = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+  for row in rows:
+    cur.execute(stmt, row)
+
+
+def load_execute_batch(cur: cursor, table: str, columns: tuple[str, ...], rows: list[tuple],
+                       batch_size: int):
+  stmt = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+  execute_batch(cur, stmt, rows, page_size=batch_size)
+
+
+def load_execute_values(cur: cursor, table: str, columns: tuple[str, ...], rows: list[tuple],
+                        batch_size: int):
+  execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows,
+                 page_size=batch_size)
+
+
+def load_copy(cur: cursor, table: str, columns: tuple[str, ...], rows: list[tuple],
+              batch_size: int):
+  writer = CopyWriter({table: columns}, batch_size, NO_BYTE_LIMIT)
+  for row in rows:
+    writer.add(table, row)
+    if writer.should_flush():
+      writer.write(cur)
+      writer.reset()
+  writer.write(cur)
+
+
+def load_server_side(cur: cursor, table: str, columns: tuple[str, ...], rows: list[tuple],
+                     batch_size: int):
+  """Ships every batch as one JSON document, the rows are built by the database"""
+  names = ', '.join(columns)
+  stmt = f"INSERT INTO {table} ({names}) SELECT {names} FROM json_populate_recordset(NULL::{table}, %s)"
+  for start in range(0, len(rows), batch_size):
+    batch = [{
+        column: value.adapted if isinstance(value, Json) else value
+        for column, value in zip(columns, row)
+    } for row in rows[start:start + batch_size]]
+    cur.execute(stmt, [json.dumps(batch)])
+
+
+LOADERS: dict[str, Loader] = {
+    'row': load_row,
+    'execute_batch': load_execute_batch,
+    'execute_values': load_execute_values,
+    'copy': load_copy,
+    'server_side': load_server_side,
+}
+
+
+def prepare_scratch_tables(conn: connection, tables):
+  """Copies of the real tables (columns, defaults, indexes, no foreign keys) to load into"""
+  with conn.cursor() as cur:
+    for table in tables:
+      cur.execute(f"DROP TABLE IF EXISTS {scratch_table(table)}")
+      cur.execute(f"CREATE TABLE {scratch_table(table)} (LIKE {table} INCLUDING ALL)")
+  conn.commit()
+
+
+def drop_scratch_tables(conn: connection, tables):
+  conn.rollback()
+  with conn.cursor() as cur:
+    for table in tables:
+      cur.execute(f"DROP TABLE IF EXISTS {scratch_table(table)}")
+  conn.commit()
+
+
+def run_write(conn: connection, table: str, columns: tuple[str, ...], rows: list[tuple],
+              strategy: str, batch_size: int, payload_bytes: int) -> dict[str, Any]:
+  """
+    Loads `rows` into the scratch copy of `table` in one transaction and times it, commit
+    included. db_wait_s is the wall time the client did not spend on its own CPU: the server
+    working on the statements plus the network round trips.
+    """
+  scratch = scratch_table(table)
+  with conn.cursor() as cur:
+    cur.execute(f"TRUNCATE {scratch}")
+  conn.commit()
+
+  result: dict[str, Any] = {'table': table, 'strategy': strategy, 'batch_size': batch_size,
+                            'rows': len(rows)}
+  started, started_cpu = time.perf_counter(), time.process_time()
+  try:
+    with conn.cursor() as cur:
+      LOADERS[strategy](cur, scratch, columns, rows, batch_size)
+    conn.commit()
+  except Psycopg2Error as e:
+    conn.rollback()
+    result['error'] = str(e).strip()
+    return result
+  wall = time.perf_counter() - started
+  cpu = time.process_time() - started_cpu
+
+  with conn.cursor() as cur:
+    cur.execute(f"SELECT count(*) FROM {scratch}")
+    loaded = cur.fetchone()[0]
+  conn.commit()
+  if loaded != len(rows):
+    result['error'] = f"{loaded} of {len(rows)} rows loaded"
+
+  result.update({
+      'seconds': round(wall, 4),
+      'db_wait_s': round(max(0.0, wall - cpu), 4),
+      'rows_per_s': round(len(rows) / wall, 1),
+      'bytes_per_s': round(payload_bytes / wall, 1),
+  })
+  return result
+
+
+def run_writes(conn: connection, dataset: dict[str, tuple[tuple[str, ...], list[tuple]]],
+               strategies=STRATEGIES, batch_sizes=DEFAULT_BATCH_SIZES) -> list[dict[str, Any]]:
+  """Every strategy at every batch size (per-row inserts once) for every table of the dataset"""
+  results = []
+  prepare_scratch_tables(conn, dataset.keys())
+  try:
+    for table, (columns, rows) in dataset.items():
+      # Bytes are measured on the COPY text of the rows, the same payload for every strategy
+      payload_bytes = sum(len(copy_line(row).encode()) for row in rows)
+      print(f"{table}: {len(rows)} rows, {payload_bytes / 1024 / 1024:.1f} MB")
+      for strategy in strategies:
+        for batch_size in ([1] if strategy == 'row' else batch_sizes):
+          result = run_write(conn, table, columns, rows, strategy, batch_size, payload_bytes)
+          print_result(result)
+          results.append(result)
+  finally:
+    drop_scratch_tables(conn, dataset.keys())
+  return results
+
+
+def print_result(result: dict[str, Any]):
+  label = f"  {result['strategy']:<15} batch {result['batch_size']:>6}"
+  if 'error' in result and 'seconds' not in result:
+    print(f"{label}  ❌ {result['error']}")
+    return
+  line = (f"{label}  {result['rows_per_s']:>12,.0f} rows/s  "
+          f"{result['bytes_per_s'] / 1024 / 1024:>7.2f} MB/s  {result['seconds']:>8.3f} s  "
+          f"(db {result['db_wait_s']:.3f} s)")
+  if 'error' in result:
+    line += f"  ⚠️ {result['error']}"
+  print(line)
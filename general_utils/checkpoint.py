@@ -0,0 +1,205 @@
+import json
+import threading
+from typing import Any, Callable
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import connection, cursor
+
+from general_utils.db import DatabasePool
+from general_utils.general import get_time_miliseconds
+from general_utils.retry import run_transaction
+from models.app import SeedingError
+from models.config import Config
+
+CREATE_STMT = """
+  CREATE TABLE IF NOT EXISTS seed_checkpoints (
+    stage TEXT PRIMARY KEY,
+    position TEXT NOT NULL,
+    rows_done INT8 NOT NULL DEFAULT 0,
+    completed BOOL NOT NULL DEFAULT false,
+    updated_at INT8 NOT NULL
+  )
+"""
+
+SAVE_STMT = """
+  INSERT INTO seed_checkpoints (stage, position, rows_done, completed, updated_at)
+  VALUES (%s, %s, %s, %s, %s)
+  ON CONFLICT (stage) DO UPDATE
+     SET position = excluded.position,
+         rows_done = excluded.rows_done,
+         completed = excluded.completed,
+         updated_at = excluded.updated_at
+"""
+
+# Stage of the seed_checkpoints rows keeping UniqueIds state, see IdLeases
+ID_STAGE_PREFIX = 'ids.'
+
+
+def checkpoints_enabled(cfg: Config) -> bool:
+  return cfg.seeding.commit_every > 0 or cfg.seeding.resume
+
+
+def prepare_checkpoints(conn: connection, cfg: Config):
+  """
+    Creates the seed_checkpoints table, it also keeps the ID allocators' state (see IdLeases).
+    A fresh (non --resume) run forgets the stage checkpoints of the previous run, so a later
+    --resume never skips work based on stale progress. The IDs it handed out stay recorded.
+    """
+  try:
+    with conn.cursor() as cur:
+      cur.execute(CREATE_STMT)
+      if not cfg.seeding.resume:
+        cur.execute("DELETE FROM seed_checkpoints WHERE stage NOT LIKE %s",
+                    [ID_STAGE_PREFIX + '%'])
+    conn.commit()
+  except Psycopg2Error as e:
+    conn.rollback()
+    raise SeedingError(f"Failed to prepare the seed_checkpoints table. Error: {e}") from e
+
+
+class Checkpoint:
+  """
+    Progress of one stage, used to commit every seeding.commit_every rows and to resume.
+
+    Stages hold the rows they generate and hand a `write` callable to advance()/complete(),
+    which decide when the held rows reach the database:
+      - commit_every > 0: every commit_every rows the rows and the position are written in one
+        transaction, restarted on CockroachDB retry errors (see run_transaction). The stage must
+        keep its rows until advance() returns True, since `write` may run more than once.
+      - commit_every == 0: every batch_size rows the rows are written into the open transaction,
+        the run still commits once (with --resume, complete() commits the finished stage).
+    """
+
+  def __init__(self, conn: connection, stage: str, cfg: Config):
+    self.conn = conn
+    self.stage = stage
+    self.commit_every = cfg.seeding.commit_every
+    self.batch_size = max(1, cfg.seeding.batch_size)
+    self.max_attempts = cfg.seeding.retry_max_attempts
+    self.base_delay_ms = cfg.seeding.retry_base_delay_ms
+    self.enabled = checkpoints_enabled(cfg)
+    self.position: str | None = None
+    self.completed = False
+    self.rows_done = 0
+    self._rows_held = 0
+
+    if self.enabled and cfg.seeding.resume:
+      self._load()
+
+  def _load(self):
+    try:
+      with self.conn.cursor() as cur:
+        cur.execute(
+            "SELECT position, rows_done, completed FROM seed_checkpoints WHERE stage = %s",
+            [self.stage])
+        row = cur.fetchone()
+    except Psycopg2Error as e:
+      raise SeedingError(f"Failed to read the checkpoint of stage {self.stage}. Error: {e}") from e
+
+    if row:
+      self.position, self.rows_done, self.completed = row
+      state = 'completed' if self.completed else f"position {self.position}"
+      print(f"↻ Resuming stage {self.stage} from {state} ({self.rows_done} rows done)")
+
+  def already_completed(self) -> bool:
+    if self.completed:
+      print(f"✅ Stage {self.stage} was completed by a previous run, skipping it")
+    return self.completed
+
+  def start(self, default: int = 0) -> int:
+    """Saved position as an integer (number of units already done)"""
+    return int(self.position) if self.position is not None else default
+
+  def advance(self, position, rows: int = 1, write: Callable[[cursor], Any] | None = None) -> bool:
+    """Records `rows` more held rows, returns True once they were written by `write`"""
+    self.rows_done += rows
+    self._rows_held += rows
+    if self._rows_held < (self.commit_every or self.batch_size):
+      return False
+
+    self.commit(position, write)
+    return True
+
+  def commit(self,
+             position,
+             write: Callable[[cursor], Any] | None = None,
+             completed=False):
+    """Writes the held rows and, when checkpointing, saves the position in the same transaction"""
+
+    def unit(cur: cursor):
+      if write:
+        write(cur)
+      if self.enabled:
+        try:
+          cur.execute(SAVE_STMT, [
+              self.stage,
+              str(position), self.rows_done, completed,
+              get_time_miliseconds()
+          ])
+        except Psycopg2Error as e:
+          raise SeedingError(
+              f"Failed to save the checkpoint of stage {self.stage} at {position}. Error: {e}"
+          ) from e
+
+    if self.commit_every:
+      run_transaction(self.conn, unit, self.stage, self.max_attempts, self.base_delay_ms)
+    else:
+      with self.conn.cursor() as cur:
+        unit(cur)
+      if self.enabled and completed:
+        self.conn.commit()
+
+    self.position = str(position)
+    self.completed = completed
+    self._rows_held = 0
+
+  def complete(self, position, write: Callable[[cursor], Any] | None = None):
+    self.commit(position, write, completed=True)
+
+
+class IdLeases:
+  """
+    Keeps the permutation and the counters leased by every UniqueIds namespace in
+    seed_checkpoints (stage 'ids.<namespace>'), so a later run (--top-up, --resume, a run with the
+    same --seed) continues after every ID an earlier run may have written. A lease is committed on
+    a connection of its own before any of its IDs is handed out.
+    """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._conn: connection | None = None
+
+  def _cursor(self) -> cursor:
+    if self._conn is None:
+      self._conn = DatabasePool.connect()
+      self._conn.autocommit = True
+    return self._conn.cursor()
+
+  def load(self, namespace: str) -> dict[str, Any] | None:
+    with self._lock:
+      try:
+        with self._cursor() as cur:
+          cur.execute("SELECT position FROM seed_checkpoints WHERE stage = %s",
+                      [ID_STAGE_PREFIX + namespace])
+          row = cur.fetchone()
+      except Psycopg2Error as e:
+        raise SeedingError(f"Failed to read the {namespace} ID lease. Error: {e}") from e
+    return json.loads(row[0]) if row else None
+
+  def save(self, namespace: str, state: dict[str, Any]):
+    with self._lock:
+      try:
+        with self._cursor() as cur:
+          cur.execute(SAVE_STMT, [
+              ID_STAGE_PREFIX + namespace,
+              json.dumps(state), state['counter'], False,
+              get_time_miliseconds()
+          ])
+      except Psycopg2Error as e:
+        raise SeedingError(f"Failed to save the {namespace} ID lease. Error: {e}") from e
+
+  def close(self):
+    with self._lock:
+      if self._conn is not None:
+        self._conn.close()
+        self._conn = None
@@ -0,0 +1,110 @@
+import io
+import json
+from typing import Any
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import cursor
+from psycopg2.extras import Json
+
+from models.app import SeedingError
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def copy_value(value: Any) -> str:
+  """Encodes a python value as a field of the COPY text format"""
+  if value is None:
+    return '\\N'
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, (int, float)):
+    return str(value)
+  if isinstance(value, Json):
+    return json.dumps(value.adapted).translate(_COPY_ESCAPES)
+  if isinstance(value, (list, tuple)):
+    elements = ('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in value)
+    value = '{' + ','.join(elements) + '}'
+  elif isinstance(value, dict):
+    value = json.dumps(value)
+  return str(value).translate(_COPY_ESCAPES)
+
+
+def copy_line(row: tuple) -> str:
+  return '\t'.join(copy_value(v) for v in row) + '\n'
+
+
+class CopyWriter:
+  """
+    Buffers rows of several tables and writes them with COPY ... FROM STDIN.
+
+    `tables` maps each table to its columns and must be ordered parents first: a flush always
+    writes every buffer in that order so foreign keys between the tables are satisfied.
+    """
+
+  def __init__(self, tables: dict[str, tuple[str, ...]], max_rows: int, max_bytes: int):
+    self.tables = tables
+    self.max_rows = max_rows
+    self.max_bytes = max_bytes
+    self._buffers = {table: io.StringIO() for table in tables}
+    self._rows = {table: 0 for table in tables}
+    self._bytes = 0
+    self._written: dict[str, int] = {}
+    self.flushes = 0
+
+  @property
+  def pending_rows(self) -> int:
+    return sum(self._rows.values())
+
+  def add(self, table: str, row: tuple):
+    line = copy_line(row)
+    self._buffers[table].write(line)
+    self._rows[table] += 1
+    self._bytes += len(line)
+
+  def add_rows(self, rows: dict[str, list[tuple]]):
+    for table, table_rows in rows.items():
+      for row in table_rows:
+        self.add(table, row)
+
+  def should_flush(self) -> bool:
+    return self.pending_rows >= self.max_rows or self._bytes >= self.max_bytes
+
+  def write(self, cur: cursor) -> dict[str, int]:
+    """COPYs every non empty buffer, parents first. Buffers are kept until reset()"""
+    written = {}
+    for table, columns in self.tables.items():
+      if not self._rows[table]:
+        continue
+
+      buffer = self._buffers[table]
+      buffer.seek(0)
+      try:
+        cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+      except Psycopg2Error as e:
+        raise SeedingError(
+            f"COPY failed for {table} ({self._rows[table]} rows). Error: {e}") from e
+      written[table] = self._rows[table]
+    self._written = written
+    return written
+
+  def reset(self):
+    self._buffers = {table: io.StringIO() for table in self.tables}
+    self._rows = {table: 0 for table in self.tables}
+    self._bytes = 0
+
+  def release(self) -> dict[str, int]:
+    """Drops the buffers once the transaction holding the last write() committed"""
+    size_kb = self._bytes / 1024
+    written = self._written
+    self._written = {}
+    self.reset()
+
+    if written:
+      self.flushes += 1
+      counts = ', '.join(f"{table}={rows}" for table, rows in written.items())
+      print(f"  - COPY flush #{self.flushes} ({size_kb:.0f} KB): {counts}")
+    return written
+
+  def flush(self, cur: cursor) -> dict[str, int]:
+    self.write(cur)
+    return self.release()
@@ -1,28 +1,161 @@
+import re
 import threading
+from typing import Iterator
 
+import psycopg2
+from psycopg2 import Error as Psycopg2Error
 from psycopg2 import pool
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, cursor
+
+from models.app import SeedingError
+
+# Session parameter names accepted by SET, anything else would be spliced into the statement
+SESSION_PARAM = re.compile(r'^[A-Za-z_][A-Za-z0-9_.]*$')
+
+
+class SeederConnection(connection):
+  """Pooled connection remembering whether its session is set up and what is prepared on it"""
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.configured = False
+    self.prepared: set[str] = set()
+
+
+class PreparedStatement:
+  """
+    A statement (with %s placeholders) PREPAREd once per connection and run with EXECUTE, so the
+    server parses and plans it once instead of for every row. Every instance is prepared on the
+    connections of the pool as they are set up, or on first use when created later (stage modules
+    are imported lazily). Prepared statements outlive transactions, a rollback keeps them.
+    """
+  _lock = threading.Lock()
+  _enabled = True
+  _all: dict[str, 'PreparedStatement'] = {}
+
+  def __init__(self, name: str, stmt: str):
+    self.name = name
+    self.stmt = stmt
+    numbers = iter(range(1, stmt.count('%s') + 1))
+    self.body = re.sub(r'%%|%s', lambda m: '%' if m.group() == '%%' else f"${next(numbers)}",
+                       stmt)
+    self.execute_stmt = f"EXECUTE {name} ({', '.join(['%s'] * stmt.count('%s'))})"
+    with PreparedStatement._lock:
+      PreparedStatement._all[name] = self
+
+  @classmethod
+  def configure(cls, enabled: bool):
+    with cls._lock:
+      cls._enabled = enabled
+
+  @classmethod
+  def registered(cls) -> list['PreparedStatement']:
+    with cls._lock:
+      return list(cls._all.values())
+
+  def sql(self, cur: cursor) -> str:
+    """Text to run with the args on `cur`, EXECUTE once prepared on the cursor's connection"""
+    prepared = getattr(cur.connection, 'prepared', None)
+    if not PreparedStatement._enabled or prepared is None:
+      return self.stmt
+    if self.name not in prepared:
+      self.prepare(cur)
+    return self.execute_stmt
+
+  def prepare(self, cur: cursor):
+    try:
+      cur.execute(f"PREPARE {self.name} AS {self.body}")
+    except Psycopg2Error as e:
+      raise SeedingError(f"Failed to prepare the {self.name} statement. Error: {e}") from e
+    cur.connection.prepared.add(self.name)
 
 
 class DatabasePool:
   _lock = threading.Lock()
   _pool = None
   _initialized = False
+  _minconn = 0
+  _maxconn = 0
+  _session_params: dict[str, str] = {}
+  _db_params: dict = {}
 
   @classmethod
-  def initialize(cls, minconn=1, maxconn=10, **db_params):
+  def initialize(cls, minconn=1, maxconn=10, session_params: dict[str, str] | None = None,
+                 **db_params):
+    """
+      Opens `minconn` connections right away and up to `maxconn` on demand. Every connection runs
+      SET <name> = <value> for the session params, and prepares the PreparedStatements, the first
+      time it is handed out.
+      """
+    if minconn > maxconn:
+      raise ValueError(f"The pool minimum ({minconn}) is over its maximum ({maxconn})")
+    invalid = [name for name in (session_params or {}) if not SESSION_PARAM.match(name)]
+    if invalid:
+      raise ValueError(f"Invalid session parameter name(s): {', '.join(invalid)}")
     with cls._lock:
       if cls._pool is None:
-        cls._pool = pool.ThreadedConnectionPool(minconn, maxconn, **db_params)
+        cls._pool = pool.ThreadedConnectionPool(minconn,
+                                                maxconn,
+                                                connection_factory=SeederConnection,
+                                                **db_params)
+        cls._minconn = minconn
+        cls._maxconn = maxconn
+        cls._session_params = dict(session_params or {})
+        cls._db_params = db_params
         cls._initialized = True
       elif not cls._initialized:
         raise RuntimeError("DatabasePool is already initialized.")
 
+  @classmethod
+  def warm_up(cls):
+    """Sets up the connections opened by initialize, so the stages do not pay for it"""
+    conns = [cls.get_conn() for _ in range(cls._minconn)]
+    for conn in conns:
+      cls.release_conn(conn)
+
   @classmethod
   def get_conn(cls) -> connection:
     if cls._pool is None:
       raise RuntimeError("Database is not initialized")
-    return cls._pool.getconn()
+    conn = cls._pool.getconn()
+    if not getattr(conn, 'configured', True):
+      try:
+        cls._configure(conn)
+      except Exception:
+        cls._pool.putconn(conn, close=True)
+        raise
+    return conn
+
+  @classmethod
+  def _configure(cls, conn: SeederConnection):
+    try:
+      with conn.cursor() as cur:
+        for name, value in cls._session_params.items():
+          cur.execute(f"SET {name} = %s", (value,))
+        if PreparedStatement._enabled:
+          for stmt in PreparedStatement.registered():
+            if stmt.name not in conn.prepared:
+              stmt.prepare(cur)
+        cur.execute("SELECT 1")
+      conn.commit()
+    except Psycopg2Error as e:
+      conn.rollback()
+      raise SeedingError(f"Failed to set up a database connection. Error: {e}") from e
+    conn.configured = True
+
+  @classmethod
+  def connect(cls) -> connection:
+    """New connection outside the pool (it does not count against maxconn), the caller closes it"""
+    if cls._pool is None:
+      raise RuntimeError("Database is not initialized")
+    try:
+      return psycopg2.connect(**cls._db_params)
+    except Psycopg2Error as e:
+      raise SeedingError(f"Failed to open a database connection. Error: {e}") from e
+
+  @classmethod
+  def max_connections(cls) -> int:
+    return cls._maxconn
 
   @classmethod
   def release_conn(cls, conn: connection):
@@ -34,3 +167,52 @@ class DatabasePool:
     if cls._pool:
       cls._pool.closeall()
       cls._initialized = False
+
+
+def sql_now_ms() -> str:
+  """SQL expression for the current transaction time in milliseconds (see get_time_miliseconds)"""
+  return "(extract(epoch FROM now()) * 1000)::INT8"
+
+
+def sql_ulid(correlate: str) -> str:
+  """
+    SQL expression producing a ULID string (10 timestamp chars + 16 random chars, Crockford base32).
+    `correlate` must reference a column of the outer row, it forces the subquery to be evaluated
+    once per row instead of once per statement.
+    """
+  return f"""(
+    SELECT string_agg(
+             substr('0123456789ABCDEFGHJKMNPQRSTVWXYZ',
+                    (CASE WHEN g.i <= 10 THEN ({sql_now_ms()} >> (5 * (10 - g.i))) & 31
+                          ELSE floor(random() * 32)::INT8 END)::INT + 1, 1),
+             '' ORDER BY g.i)
+      FROM generate_series(1, 26) AS g(i)
+     WHERE {correlate} IS NOT NULL
+  )"""
+
+
+def keyset_pages(cur: cursor, select: str, args: list | tuple = (), page_size: int = 1000,
+                 limit: int | None = None, key: str = 'id') -> Iterator[list[tuple]]:
+  """
+    Pages of `select` in `key` order, at most `limit` rows in total.
+    Every page is a short query of its own continuing after the last key of the previous one
+    (keyset pagination): memory holds a single page and, unlike a server-side cursor, nothing
+    has to stay open across the commits of a stage.
+    `select` returns the key first and ends with a {after} placeholder in its WHERE clause.
+    """
+  last = None
+  remaining = limit
+  while remaining is None or remaining > 0:
+    size = page_size if remaining is None else min(page_size, remaining)
+    after = 'TRUE' if last is None else f"{key} > %s"
+    page_args = [*args, *([] if last is None else [last]), size]
+    cur.execute(f"{select.format(after=after)} ORDER BY {key} LIMIT %s", page_args)
+    page = cur.fetchall()
+    if not page:
+      return
+    yield page
+    if len(page) < size:
+      return
+    last = page[-1][0]
+    if remaining is not None:
+      remaining -= len(page)
@@ -0,0 +1,55 @@
+import threading
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+  from faker import Faker
+
+# The only providers the seeders call, a default Faker() loads every provider of the locale
+PROVIDERS = (
+    # first_name, last_name
+    'faker.providers.person',
+    # user_name
+    'faker.providers.internet',
+    # address
+    'faker.providers.address',
+    # text, paragraph, word
+    'faker.providers.lorem',
+    # color_name
+    'faker.providers.color',
+    # currency_code
+    'faker.providers.currency',
+)
+
+
+def faker_class() -> type['Faker']:
+  """faker is only imported (and its providers loaded) when a stage first asks for values"""
+  from faker import Faker
+  return Faker
+
+
+class SharedFaker:
+  """Process wide Faker of the seeders, built with PROVIDERS on first use"""
+  _lock = threading.Lock()
+  _fake: 'Faker | None' = None
+  _seed: int | None = None
+
+  @classmethod
+  def seed(cls, seed: int | None):
+    """Seeds the random instance shared by every Faker, now if faker is loaded or once it is"""
+    with cls._lock:
+      cls._seed = seed
+      if cls._fake is not None and seed is not None:
+        faker_class().seed(seed)
+
+  @classmethod
+  def get(cls) -> 'Faker':
+    fake = cls._fake
+    if fake is None:
+      with cls._lock:
+        fake = cls._fake
+        if fake is None:
+          Faker = faker_class()
+          if cls._seed is not None:
+            Faker.seed(cls._seed)
+          fake = cls._fake = Faker(providers=list(PROVIDERS))
+    return fake
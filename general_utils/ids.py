@@ -0,0 +1,202 @@
+import math
+import random
+import string
+import threading
+from typing import Any, Callable
+
+# Placeholder characters follow Faker's bothify/hexify conventions
+PLACEHOLDERS = {
+    '#': string.digits,
+    '?': string.ascii_letters,
+    '^': '0123456789abcdef',
+}
+
+DEFAULT_ID_FORMATS = {
+    'sku': 'SKU-########',
+    'payment_intent': 'pi_?????????????????????????',
+    'charge': 'ch_^^^^^^^^-^^^^-4^^^-^^^^-^^^^^^^^^^^^',
+}
+
+# Counters recorded as handed out at a time when the allocators are persisted
+ID_LEASE = 10000
+
+
+class IdAllocator:
+  """
+    Hands out unique identifiers rendered from a template (e.g. 'SKU-#####').
+
+    The n-th call maps the counter n through the affine permutation (a * n + b) mod space,
+    with `a` coprime to the space size, so values look scattered but never repeat until the
+    space is exhausted. Every call is O(1) and nothing is remembered besides the counter.
+
+    With `lease`, counters are taken ID_LEASE at a time and lease(allocator, end) is called
+    before any counter of a new lease is used, so the state saved there is never behind.
+    """
+
+  def __init__(self,
+               template: str,
+               rng: random.Random | None = None,
+               multiplier: int | None = None,
+               offset: int | None = None,
+               counter: int = 0,
+               lease: Callable[['IdAllocator', int], None] | None = None):
+    rng = rng or random.Random()
+    self.template = template
+    self._radixes = [PLACEHOLDERS[c] for c in template if c in PLACEHOLDERS]
+    if not self._radixes:
+      raise ValueError(f"ID template '{template}' has no placeholder characters")
+
+    self.space = math.prod(len(r) for r in self._radixes)
+    self._multiplier = multiplier or self._coprime(self.space, rng)
+    self._offset = rng.randrange(self.space) if offset is None else offset
+    self._counter = counter
+    # End of the counters leased so far
+    self._leased = counter
+    self._lease = lease
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def _coprime(space: int, rng: random.Random) -> int:
+    if space == 1:
+      return 1
+    while True:
+      candidate = rng.randrange(space // 3 or 1, space)
+      if math.gcd(candidate, space) == 1:
+        return candidate
+
+  def next(self) -> str:
+    n = self.reserve(1)
+    value = (self._multiplier * n + self._offset) % self.space
+    return self._render(value)
+
+  def reserve(self, count: int) -> int:
+    """Takes `count` consecutive counters, returns the first one"""
+    with self._lock:
+      if self._counter + count > self.space:
+        raise RuntimeError(
+            f"ID space of template '{self.template}' exhausted after {self.space} values")
+      n = self._counter
+      self._counter += count
+      if self._lease and self._counter > self._leased:
+        self._leased = min(self.space, self._counter + ID_LEASE)
+        self._lease(self, self._leased)
+    return n
+
+  def state(self, counter: int) -> dict[str, Any]:
+    """What an allocator continuing the same permutation at `counter` is created from"""
+    return {
+        'template': self.template,
+        'multiplier': self._multiplier,
+        'offset': self._offset,
+        'counter': counter,
+    }
+
+  def sql(self, counter: str) -> str:
+    """
+      SQL expression rendering the value of `counter` (an INT8 expression of a counter taken with
+      reserve()) exactly like next() would, for rows generated by the database.
+      """
+    if (self.space - 1) * self._multiplier + self._offset >= 2**63:
+      raise ValueError(f"ID template '{self.template}' is too large to be rendered in SQL")
+    value = f"mod({self._multiplier} * ({counter}) + {self._offset}, {self.space})"
+
+    parts = []
+    literal = ''
+    divisor = self.space
+    for c in self.template:
+      if c not in PLACEHOLDERS:
+        literal += c
+        continue
+      if literal:
+        parts.append("'" + literal.replace("'", "''") + "'")
+        literal = ''
+      radix = PLACEHOLDERS[c]
+      divisor //= len(radix)
+      parts.append(f"substr('{radix}', mod(div({value}, {divisor}), {len(radix)})::INT + 1, 1)")
+    if literal:
+      parts.append("'" + literal.replace("'", "''") + "'")
+    return ' || '.join(parts)
+
+  def _render(self, value: int) -> str:
+    digits: list[str] = []
+    for radix in reversed(self._radixes):
+      value, idx = divmod(value, len(radix))
+      digits.append(radix[idx])
+
+    out = []
+    for c in self.template:
+      out.append(digits.pop() if c in PLACEHOLDERS else c)
+    return ''.join(out)
+
+
+class UniqueIds:
+  """
+    Process wide allocators, one per namespace (sku, payment_intent, charge, ...).
+
+    Once persist() is given where to load and save their state, an allocator continues the
+    permutation and the counter an earlier run saved, so IDs already in the database are not
+    handed out again.
+    """
+  _lock = threading.Lock()
+  _formats: dict[str, str] = dict(DEFAULT_ID_FORMATS)
+  _allocators: dict[str, IdAllocator] = {}
+  _rng = random.Random()
+  _load: Callable[[str], dict[str, Any] | None] | None = None
+  _save: Callable[[str, dict[str, Any]], None] | None = None
+
+  @classmethod
+  def configure(cls, formats: dict[str, str] | None = None, seed: int | None = None):
+    with cls._lock:
+      cls._formats = {**DEFAULT_ID_FORMATS, **(formats or {})}
+      cls._allocators = {}
+      cls._rng = random.Random(seed)
+
+  @classmethod
+  def persist(cls, load: Callable[[str], dict[str, Any] | None] | None,
+              save: Callable[[str, dict[str, Any]], None] | None):
+    """load(namespace) returns the state save(namespace, state) stored, None if there is none"""
+    with cls._lock:
+      cls._load = load
+      cls._save = save
+      cls._allocators = {}
+
+  @classmethod
+  def next(cls, namespace: str) -> str:
+    return cls.allocator(namespace).next()
+
+  @classmethod
+  def sql(cls, namespace: str, count: int, row_number: str) -> str:
+    """
+      SQL expression of the namespace's next `count` values, `row_number` being a 1 based INT8
+      expression numbering the rows, like row_number() OVER ()
+      """
+    first = cls.allocator(namespace).reserve(count)
+    return cls.allocator(namespace).sql(f"{first} + ({row_number}) - 1")
+
+  @classmethod
+  def allocator(cls, namespace: str) -> IdAllocator:
+    allocator = cls._allocators.get(namespace)
+    if allocator is None:
+      with cls._lock:
+        allocator = cls._allocators.get(namespace)
+        if allocator is None:
+          if namespace not in cls._formats:
+            raise KeyError(f"No ID format configured for namespace '{namespace}'")
+          allocator = cls._create(namespace, cls._formats[namespace])
+          cls._allocators[namespace] = allocator
+    return allocator
+
+  @classmethod
+  def _create(cls, namespace: str, template: str) -> IdAllocator:
+    load, save = cls._load, cls._save
+    if load is None or save is None:
+      return IdAllocator(template, cls._rng)
+
+    def lease(allocator: IdAllocator, end: int):
+      save(namespace, allocator.state(end))
+
+    state = load(namespace)
+    if state is None or state['template'] != template:
+      return IdAllocator(template, cls._rng, lease=lease)
+    return IdAllocator(template, cls._rng, state['multiplier'], state['offset'], state['counter'],
+                       lease)
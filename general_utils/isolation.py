@@ -0,0 +1,83 @@
+import json
+import threading
+from typing import Any, Callable, TypeVar
+
+from psycopg2.extensions import cursor
+
+from general_utils.general import get_time_miliseconds
+from general_utils.metrics import RunMetrics
+from general_utils.retry import is_retryable
+
+T = TypeVar('T')
+
+BATCH_SAVEPOINT = 'seed_batch'
+
+
+class RejectLog:
+  """NDJSON file of the rows that could not be written, shared by every stage and worker"""
+  _lock = threading.Lock()
+  _path = 'rejects.ndjson'
+
+  @classmethod
+  def configure(cls, path: str):
+    with cls._lock:
+      cls._path = path
+
+  @classmethod
+  def record(cls, stage: str, unit: Any, error: BaseException):
+    RunMetrics.incr(f"rejected.{stage}")
+    line = json.dumps(
+        {
+            'stage': stage,
+            'error': str(error).strip(),
+            'unit': unit,
+            'rejected_at': get_time_miliseconds(),
+        },
+        default=str)
+
+    with cls._lock:
+      with open(cls._path, 'a') as f:
+        f.write(line + '\n')
+      path = cls._path
+    print(f"❌ Rejected a {stage} row (logged to {path}). Error: {str(error).strip()}")
+
+
+def write_isolated(cur: cursor,
+                   units: list[T],
+                   write: Callable[[cursor, list[T]], Any],
+                   stage: str,
+                   describe: Callable[[T], Any] = lambda unit: unit,
+                   write_all: Callable[[cursor], Any] | None = None) -> list[T]:
+  """
+    Writes `units` with `write` inside a savepoint, so a failing row no longer aborts the whole
+    transaction. On error the batch rolls back to the savepoint and is split in halves until the
+    failing units are isolated; they go to the reject log, every other unit is written.
+    Returns the units that were written. `write_all` optionally replaces the first attempt, for
+    callers that already hold every unit in a faster form (e.g. COPY buffers).
+
+    Restart errors (40001) are raised as is: only run_transaction can recover from them.
+    """
+  if not units:
+    return []
+
+  cur.execute(f"SAVEPOINT {BATCH_SAVEPOINT}")
+  try:
+    if write_all:
+      write_all(cur)
+    else:
+      write(cur, units)
+  except Exception as e:
+    if is_retryable(e):
+      raise
+    cur.execute(f"ROLLBACK TO SAVEPOINT {BATCH_SAVEPOINT}")
+    cur.execute(f"RELEASE SAVEPOINT {BATCH_SAVEPOINT}")
+    if len(units) == 1:
+      RejectLog.record(stage, describe(units[0]), e)
+      return []
+
+    middle = len(units) // 2
+    return (write_isolated(cur, units[:middle], write, stage, describe) +
+            write_isolated(cur, units[middle:], write, stage, describe))
+
+  cur.execute(f"RELEASE SAVEPOINT {BATCH_SAVEPOINT}")
+  return units
@@ -0,0 +1,36 @@
+import threading
+
+
+class RunMetrics:
+  """Counters shared by every stage and worker thread of a run, reported once seeding ends"""
+  _lock = threading.Lock()
+  _counters: dict[str, int] = {}
+
+  @classmethod
+  def incr(cls, name: str, value: int = 1):
+    with cls._lock:
+      cls._counters[name] = cls._counters.get(name, 0) + value
+
+  @classmethod
+  def get(cls, name: str) -> int:
+    with cls._lock:
+      return cls._counters.get(name, 0)
+
+  @classmethod
+  def snapshot(cls) -> dict[str, int]:
+    with cls._lock:
+      return dict(cls._counters)
+
+  @classmethod
+  def reset(cls):
+    with cls._lock:
+      cls._counters = {}
+
+  @classmethod
+  def report(cls):
+    counters = cls.snapshot()
+    if not counters:
+      return
+    print("Run metrics:")
+    for name in sorted(counters):
+      print(f"  - {name}: {counters[name]}")
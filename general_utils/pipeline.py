@@ -0,0 +1,71 @@
+from typing import Any
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import cursor
+
+from general_utils.db import PreparedStatement
+from models.app import SeedingError
+
+# A queue is also sent once its statements reach this many bytes of query text
+MAX_PIPELINE_BYTES = 1024 * 1024
+
+
+class StatementPipeline:
+  """
+    Cursor stand-in sending the statements it is given `depth` at a time, in a single round trip
+    (one multi-statement query rendered client side by mogrify), instead of waiting for the
+    response of every execute. Only for statements whose results are not read.
+
+    Used as a context manager the remaining statements are sent on exit. An error surfaces when
+    the queue is sent and covers all of it, as a SeedingError whatever the depth: callers do not
+    catch errors around execute(), they isolate the failing rows with a savepoint and record
+    them with their context (see write_isolated). A depth of 1 executes every statement right away.
+
+    A PreparedStatement is sent as an EXECUTE of the statement prepared on the cursor's connection.
+
+    This is batching, not the pipeline mode of psycopg 3: there are no per-statement results, and
+    the statements run on the psycopg2 connection of the stage's transaction.
+    """
+
+  def __init__(self, cur: cursor, depth: int):
+    self.cur = cur
+    self.depth = max(1, depth)
+    self._queued: list[bytes] = []
+    self._bytes = 0
+
+  def __enter__(self) -> 'StatementPipeline':
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.flush()
+    else:
+      self._queued = []
+      self._bytes = 0
+
+  def execute(self, stmt: str | PreparedStatement, args: Any = None):
+    if isinstance(stmt, PreparedStatement):
+      stmt = stmt.sql(self.cur)
+    if self.depth == 1:
+      try:
+        self.cur.execute(stmt, args)
+      except Psycopg2Error as e:
+        raise SeedingError(f"DB statement failed. Error: {e}") from e
+      return
+
+    query = self.cur.mogrify(stmt, args)
+    self._queued.append(query)
+    self._bytes += len(query)
+    if len(self._queued) >= self.depth or self._bytes >= MAX_PIPELINE_BYTES:
+      self.flush()
+
+  def flush(self):
+    if not self._queued:
+      return
+    queued = self._queued
+    self._queued = []
+    self._bytes = 0
+    try:
+      self.cur.execute(b';\n'.join(queued))
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB pipeline of {len(queued)} statements failed. Error: {e}") from e
@@ -0,0 +1,91 @@
+import random
+import time
+from typing import Callable, TypeVar
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, connection, cursor
+
+from general_utils.metrics import RunMetrics
+from models.app import SeedingError
+
+T = TypeVar('T')
+
+# SQLSTATE of serialization failures, CockroachDB returns it for every retryable transaction error
+RETRY_SQLSTATE = '40001'
+RESTART_SAVEPOINT = 'cockroach_restart'
+
+
+def is_retryable(e: BaseException) -> bool:
+  """True when `e` (or an exception it was raised from) is a 40001 restart error"""
+  seen = set()
+  while e is not None and id(e) not in seen:
+    seen.add(id(e))
+    if getattr(e, 'pgcode', None) == RETRY_SQLSTATE:
+      return True
+    e = e.__cause__ or e.__context__
+  return False
+
+
+def backoff_delay(attempt: int, base_delay_ms: int, max_delay_ms: int = 5000) -> float:
+  """Exponential backoff with full jitter, in seconds"""
+  return random.uniform(0, min(max_delay_ms, base_delay_ms * (2**attempt))) / 1000
+
+
+def run_transaction(conn: connection,
+                    unit: Callable[[cursor], T],
+                    label: str,
+                    max_attempts: int = 5,
+                    base_delay_ms: int = 50) -> T:
+  """
+    Runs `unit` as one transaction using the CockroachDB client-side retry protocol:
+
+      SAVEPOINT cockroach_restart; <unit>; RELEASE SAVEPOINT cockroach_restart; COMMIT
+
+    On a 40001 error the transaction rolls back to the savepoint, waits with exponential backoff
+    and runs `unit` again, so `unit` must be replayable: it may only write rows it still holds
+    in memory and must not discard them before run_transaction returns. On Postgres the same
+    statements are plain savepoint statements.
+
+    The restart savepoint has to open the transaction, so anything still open on `conn` (the
+    reads a stage does before its first unit) is committed first.
+    """
+  if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+    conn.commit()
+
+  attempt = 0
+  with conn.cursor() as cur:
+    try:
+      cur.execute(f"SAVEPOINT {RESTART_SAVEPOINT}")
+    except Psycopg2Error as e:
+      conn.rollback()
+      raise SeedingError(f"Failed to open a transaction for {label}. Error: {e}") from e
+
+    while True:
+      try:
+        result = unit(cur)
+        cur.execute(f"RELEASE SAVEPOINT {RESTART_SAVEPOINT}")
+        conn.commit()
+        RunMetrics.incr('transactions')
+        return result
+      except Exception as e:
+        attempt += 1
+        if not is_retryable(e) or attempt >= max_attempts:
+          conn.rollback()
+          if is_retryable(e):
+            RunMetrics.incr(f"retries_exhausted.{label}")
+            raise SeedingError(
+                f"Transaction {label} still conflicting after {attempt} attempts. Error: {e}"
+            ) from e
+          raise
+
+        RunMetrics.incr(f"retries.{label}")
+        delay = backoff_delay(attempt, base_delay_ms)
+        print(f"⚠️ Restarting transaction {label} (attempt {attempt + 1}/{max_attempts}) "
+              f"in {delay * 1000:.0f} ms: {e}")
+        try:
+          cur.execute(f"ROLLBACK TO SAVEPOINT {RESTART_SAVEPOINT}")
+        except Psycopg2Error as rollback_error:
+          conn.rollback()
+          raise SeedingError(
+              f"Failed to restart transaction {label}. Error: {rollback_error}") from e
+        time.sleep(delay)
@@ -0,0 +1,145 @@
+import importlib
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable
+
+from models.app import SeedingError
+
+
+class StageEntry:
+  """
+    Entry point of a stage given as module and function names. The module is imported the first
+    time the stage runs, so a run only loads the seeders (and their dependencies) it uses.
+    """
+
+  def __init__(self, module: str, function: str):
+    self.module = module
+    self.function = function
+
+  def load(self) -> Callable:
+    return getattr(importlib.import_module(self.module), self.function)
+
+  def __call__(self, *args, **kwargs):
+    return self.load()(*args, **kwargs)
+
+
+class Stage:
+  """A seeding step and the stages whose rows it reads"""
+
+  def __init__(self, name: str, run: Callable, deps: tuple[str, ...] = ()):
+    self.name = name
+    self.run = run
+    self.deps = deps
+
+
+def run_stages(stages: list[Stage],
+               runner: Callable[[Stage], None],
+               max_parallel: int = 1) -> dict[str, tuple[float, float]]:
+  """
+    Runs every stage once all of its dependencies finished, up to `max_parallel` at a time.
+    Ready stages start in declaration order, so with max_parallel=1 the stages run in the order
+    they are listed. Dependencies on stages that are not part of `stages` count as satisfied.
+
+    Once a stage fails no new stage is started; the running ones are waited for and a
+    SeedingError naming the failed stage is raised. Returns {stage: (start, end)} in seconds
+    since the first stage started; the timings (and critical path) are reported either way.
+    """
+  names = {stage.name for stage in stages}
+  deps = {stage.name: {dep for dep in stage.deps if dep in names} for stage in stages}
+  pending = {stage.name: stage for stage in stages}
+  done: set[str] = set()
+  timings: dict[str, tuple[float, float]] = {}
+  failed: tuple[str, Exception] | None = None
+  origin = time.perf_counter()
+
+  def timed(stage: Stage) -> tuple[float, float]:
+    start = time.perf_counter() - origin
+    runner(stage)
+    return start, time.perf_counter() - origin
+
+  try:
+    with ThreadPoolExecutor(max_workers=max(1, max_parallel)) as executor:
+      running: dict[Future, Stage] = {}
+
+      while pending or running:
+        if failed is None:
+          for name in [name for name in pending if deps[name] <= done]:
+            if len(running) >= max_parallel:
+              break
+            stage = pending.pop(name)
+            print(f"▶ Starting stage {stage.name}")
+            running[executor.submit(timed, stage)] = stage
+
+        if not running:
+          if failed is None:
+            raise SeedingError(f"Stage dependency cycle between: {', '.join(pending)}")
+          break
+
+        finished, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+          stage = running.pop(future)
+          try:
+            timings[stage.name] = future.result()
+            done.add(stage.name)
+            start, end = timings[stage.name]
+            print(f"✅ Stage {stage.name} finished in {end - start:.1f}s")
+          except Exception as e:
+            print(f"❌ Stage {stage.name} failed. Error: {e}")
+            if failed is None:
+              failed = (stage.name, e)
+  finally:
+    report_timings(stages, timings)
+
+  if failed is not None:
+    skipped = f", skipped: {', '.join(pending)}" if pending else ''
+    raise SeedingError(f"Stage {failed[0]} failed{skipped}. Error: {failed[1]}") from failed[1]
+  return timings
+
+
+# A stage starting within this many seconds after another one finished was waiting for it
+GATE_TOLERANCE = 0.05
+
+
+def critical_path(stages: list[Stage], timings: dict[str, tuple[float, float]]) -> list[str]:
+  """
+    Chain of stages that set the total runtime. Starting from the stage finishing last, walk to
+    what the stage waited for: the dependency finishing last, or, when the stage started later
+    than that (no free slot), the stage whose end freed the slot.
+    """
+  if not timings:
+    return []
+  by_name = {stage.name: stage for stage in stages}
+  current = max(timings, key=lambda name: timings[name][1])
+  path = [current]
+  while True:
+    start = timings[current][0]
+    gate = None
+    deps = [dep for dep in by_name[current].deps if dep in timings]
+    if deps:
+      gate = max(deps, key=lambda name: timings[name][1])
+    if gate is None or start - timings[gate][1] > GATE_TOLERANCE:
+      earlier = [name for name in timings if name not in path and timings[name][1] <= start]
+      if earlier:
+        gate = max(earlier, key=lambda name: timings[name][1])
+    if gate is None or gate in path:
+      break
+    current = gate
+    path.append(current)
+  return path[::-1]
+
+
+def report_timings(stages: list[Stage], timings: dict[str, tuple[float, float]]):
+  if not timings:
+    return
+
+  wall_clock = max(end for _, end in timings.values())
+  summed = sum(end - start for start, end in timings.values())
+  print("Stage timings:")
+  for name, (start, end) in sorted(timings.items(), key=lambda item: item[1][0]):
+    print(f"  - {name}: {end - start:.1f}s (started at {start:.1f}s)")
+
+  path = critical_path(stages, timings)
+  chain = ' → '.join(f"{name} ({timings[name][1] - timings[name][0]:.1f}s)" for name in path)
+  path_time = sum(timings[name][1] - timings[name][0] for name in path)
+  print(f"Critical path: {chain}")
+  print(f"  = {path_time:.1f}s of {wall_clock:.1f}s wall clock, {summed:.1f}s of stage time in total")
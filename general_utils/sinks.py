@@ -0,0 +1,194 @@
+import json
+import os
+import threading
+from typing import Any
+
+from psycopg2.extras import Json
+
+from general_utils.copy_writer import copy_line
+from models.app import SeedingError
+from models.config import ConfigExport
+
+MANIFEST = 'manifest.json'
+
+
+def parquet_modules():
+  """pyarrow is only needed (and imported) when a table is exported as parquet"""
+  try:
+    import pyarrow
+    import pyarrow.parquet
+  except ImportError as e:
+    raise SeedingError("The parquet export format needs pyarrow: pip install pyarrow") from e
+  return pyarrow, pyarrow.parquet
+
+
+def plain_value(value: Any) -> Any:
+  """Value as a JSON document holds it (NDJSON)"""
+  if isinstance(value, Json):
+    return value.adapted
+  if isinstance(value, tuple):
+    return list(value)
+  return value
+
+
+def csv_value(value: Any) -> Any:
+  """Value in the text form COPY ... CSV and IMPORT INTO ... CSV parse, None stays NULL"""
+  if isinstance(value, bool):
+    return 't' if value else 'f'
+  if isinstance(value, Json):
+    return json.dumps(value.adapted)
+  if isinstance(value, dict):
+    return json.dumps(value)
+  if isinstance(value, (list, tuple)):
+    elements = ('"' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"' for v in value)
+    return '{' + ','.join(elements) + '}'
+  return value
+
+
+def csv_line(row: tuple) -> str:
+  """
+    CSV record where every value is quoted and None is an empty unquoted field: COPY ... CSV and
+    IMPORT INTO ... WITH nullif = '' read only the latter as NULL, a quoted "" stays ''.
+    """
+  fields = ('' if v is None else '"' + str(v).replace('"', '""') + '"'
+            for v in map(csv_value, row))
+  return ','.join(fields) + '\n'
+
+
+def parquet_value(value: Any) -> Any:
+  """Documents are stored as JSON strings, arrays of scalars as parquet lists"""
+  value = plain_value(value)
+  if isinstance(value, dict) or (isinstance(value, list) and any(
+      isinstance(v, (dict, list)) for v in value)):
+    return json.dumps(value)
+  return value
+
+
+class TableFiles:
+  """Files of one table, a new part is started every `rows_per_file` rows"""
+
+  def __init__(self, directory: str, table: str, columns: tuple[str, ...], format: str,
+               rows_per_file: int):
+    self.directory = directory
+    self.table = table
+    self.columns = columns
+    self.format = format
+    self.rows_per_file = max(1, rows_per_file)
+    self.files: list[str] = []
+    self.rows = 0
+    self._part_rows = 0
+    self._file = None
+    self._records: list[dict[str, Any]] = []
+    os.makedirs(os.path.join(directory, table), exist_ok=True)
+
+  def write(self, rows: list[tuple]):
+    for row in rows:
+      if self._part_rows == 0:
+        self._open_part()
+
+      if self.format == 'tsv':
+        self._file.write(copy_line(row))
+      elif self.format == 'csv':
+        self._file.write(csv_line(row))
+      elif self.format == 'ndjson':
+        self._file.write(
+            json.dumps({c: plain_value(v) for c, v in zip(self.columns, row)}, default=str) + '\n')
+      else:
+        self._records.append({c: parquet_value(v) for c, v in zip(self.columns, row)})
+
+      self.rows += 1
+      self._part_rows += 1
+      if self._part_rows >= self.rows_per_file:
+        self._close_part()
+
+  def _open_part(self):
+    name = os.path.join(self.table, f"part-{len(self.files) + 1:05d}.{self.format}")
+    self.files.append(name)
+    if self.format == 'parquet':
+      return
+    self._file = open(os.path.join(self.directory, name), 'w', newline='')
+
+  def _close_part(self):
+    if self.format == 'parquet':
+      pyarrow, parquet = parquet_modules()
+      parquet.write_table(pyarrow.Table.from_pylist(self._records),
+                          os.path.join(self.directory, self.files[-1]))
+      self._records = []
+    else:
+      self._file.close()
+      self._file = None
+    self._part_rows = 0
+
+  def close(self):
+    if self._part_rows:
+      self._close_part()
+
+  def describe(self) -> dict[str, Any]:
+    return {
+        'table': self.table,
+        'columns': list(self.columns),
+        'format': self.format,
+        'files': self.files,
+        'rows': self.rows,
+    }
+
+
+class FileSink:
+  """
+    Receives the rows of every stage instead of the database when exporting (--export).
+    Tables are listed in the manifest in the order they were first written, which follows the
+    stage dependencies, so loading them in that order satisfies the foreign keys.
+    """
+  _lock = threading.Lock()
+  _export: ConfigExport | None = None
+  _tables: dict[str, TableFiles] = {}
+
+  @classmethod
+  def configure(cls, export: ConfigExport):
+    directory = export.directory
+    if directory and os.path.exists(os.path.join(directory, MANIFEST)):
+      raise SeedingError(f"{directory} already holds an export, choose an empty directory")
+    if directory and 'parquet' in (export.format, *export.table_formats.values()):
+      parquet_modules()
+
+    with cls._lock:
+      cls._export = export if directory else None
+      cls._tables = {}
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+
+  @classmethod
+  def enabled(cls) -> bool:
+    return cls._export is not None
+
+  @classmethod
+  def write(cls, table: str, columns: tuple[str, ...], rows: list[tuple]):
+    if not rows:
+      return
+    with cls._lock:
+      files = cls._tables.get(table)
+      if files is None:
+        export = cls._export
+        files = TableFiles(export.directory, table, columns,
+                           export.table_formats.get(table, export.format), export.rows_per_file)
+        cls._tables[table] = files
+      files.write(rows)
+
+  @classmethod
+  def close(cls, complete: bool = True) -> str | None:
+    """Closes every file and writes the manifest, returns its path"""
+    with cls._lock:
+      if cls._export is None:
+        return None
+      for files in cls._tables.values():
+        files.close()
+      path = os.path.join(cls._export.directory, MANIFEST)
+      with open(path, 'w') as f:
+        json.dump({
+            'complete': complete,
+            'tables': [files.describe() for files in cls._tables.values()],
+        }, f, indent=2)
+        f.write('\n')
+      cls._export = None
+      cls._tables = {}
+    return path
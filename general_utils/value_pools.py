@@ -0,0 +1,315 @@
+"""
+Pools of Faker values (names, usernames, addresses, currencies) generated once and kept on disk
+as memory-mapped string tables, so drawing a value is an array lookup instead of Faker logic.
+
+Every table is three files: the values back to back as UTF-8 (`<pool>.strings`), the offset of
+each value in it (`<pool>.offsets.npy`) and its length in characters (`<pool>.lengths.npy`, the
+offsets count bytes). All are mapped read only, the pages are shared by every thread and process
+using the same directory. Tables live in <directory>/<locale>-v<POOL_VERSION>,
+bump POOL_VERSION whenever the generated values change.
+
+Free text (descriptions, string attributes) comes from a text corpus stored the same way: texts of
+every length up to CORPUS_MAX_CHARS built from Faker lorem sentences, kept in length order so the
+texts fitting (min_len, max_len) are a contiguous range of the table.
+"""
+import mmap
+import os
+import random
+import threading
+import zlib
+from typing import TYPE_CHECKING, Callable, Iterable
+
+import numpy as np
+
+from general_utils.fake import PROVIDERS, SharedFaker, faker_class
+from models.app import SeedingError
+from models.config import ConfigValuePools
+
+if TYPE_CHECKING:
+  from faker import Faker
+
+POOL_VERSION = 2
+
+# Faker methods a pool can be built from
+POOLS = ('first_name', 'last_name', 'user_name', 'address', 'currency_code')
+
+# Values decoded at once for the draws of a pool
+DRAW_BLOCK = 1024
+
+# Longest text of the corpus, longer ones are joined from several texts
+CORPUS_MAX_CHARS = 1000
+# Texts of the corpus for every length
+TEXTS_PER_LENGTH = 8
+# Sentences (and words) generated by Faker to build the corpus texts from
+CORPUS_SENTENCES = 5000
+# Below this length a text is words instead of sentences, like Faker's text()
+MIN_SENTENCES_CHARS = 25
+
+
+class StringTable:
+  """Read only strings stored back to back in one UTF-8 buffer with the offset of every one"""
+
+  def __init__(self, offsets: np.ndarray, strings: mmap.mmap | bytes, lengths: np.ndarray):
+    self.offsets = offsets
+    self.strings = strings
+    # Characters of every value, a value of non-ASCII characters has more bytes
+    self.lengths = lengths
+
+  def __len__(self) -> int:
+    return len(self.offsets) - 1
+
+  def __getitem__(self, index: int) -> str:
+    return self.strings[int(self.offsets[index]):int(self.offsets[index + 1])].decode()
+
+  def take(self, indices: np.ndarray) -> list[str]:
+    """The values at `indices`, their bounds are gathered in one vectorized lookup"""
+    starts = self.offsets[indices].tolist()
+    ends = self.offsets[indices + 1].tolist()
+    strings = self.strings
+    return [strings[start:end].decode() for start, end in zip(starts, ends)]
+
+  @staticmethod
+  def paths(path: str) -> tuple[str, str, str]:
+    return f"{path}.offsets.npy", f"{path}.strings", f"{path}.lengths.npy"
+
+  @classmethod
+  def write(cls, path: str, values: Iterable[str]):
+    """Writes the table next to its final place and moves it there, readers never see a partial one"""
+    offsets_path, strings_path, lengths_path = cls.paths(path)
+    values = list(values)
+    encoded = [value.encode() for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    lengths = np.array([len(value) for value in values], dtype=np.int64)
+
+    suffix = f".tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(strings_path + suffix, 'wb') as f:
+      f.write(b''.join(encoded))
+    with open(offsets_path + suffix, 'wb') as f:
+      np.save(f, offsets)
+    with open(lengths_path + suffix, 'wb') as f:
+      np.save(f, lengths)
+    # The offsets go last: a table is only looked for through them
+    os.replace(strings_path + suffix, strings_path)
+    os.replace(lengths_path + suffix, lengths_path)
+    os.replace(offsets_path + suffix, offsets_path)
+
+  @classmethod
+  def open(cls, path: str) -> 'StringTable | None':
+    offsets_path, strings_path, lengths_path = cls.paths(path)
+    if not os.path.exists(offsets_path):
+      return None
+    offsets = np.load(offsets_path, mmap_mode='r')
+    with open(strings_path, 'rb') as f:
+      # mmap rejects empty files, a table of empty values has no bytes to map
+      strings = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if offsets[-1] else b''
+    return cls(offsets, strings, np.load(lengths_path, mmap_mode='r'))
+
+
+class ValuePool:
+  """Uniform draws from a table, indices are drawn and decoded DRAW_BLOCK at a time"""
+
+  def __init__(self, table: StringTable, rng: np.random.Generator):
+    self.table = table
+    self._rng = rng
+    self._lock = threading.Lock()
+    self._block: list[str] = []
+
+  def draw(self) -> str:
+    with self._lock:
+      if not self._block:
+        self._block = self.sample(DRAW_BLOCK)
+        self._block.reverse()
+      return self._block.pop()
+
+  def sample(self, count: int) -> list[str]:
+    return self.table.take(self._rng.integers(0, len(self.table), size=count))
+
+
+class TextCorpus:
+  """Texts of a table sorted by length, drawn uniformly among the ones fitting the bounds"""
+
+  def __init__(self, table: StringTable, rng: np.random.Generator):
+    self.table = table
+    self._rng = rng
+    self._lock = threading.Lock()
+    self._uniform: list[float] = []
+    lengths = table.lengths
+    self.longest = int(lengths[-1])
+    # first[n] is the index of the first text of at least n characters
+    self._first = np.searchsorted(lengths, np.arange(self.longest + 2)).tolist()
+
+  def _index(self, low: int, high: int) -> int:
+    with self._lock:
+      if not self._uniform:
+        self._uniform = self._rng.random(DRAW_BLOCK).tolist()
+      return low + int(self._uniform.pop() * (high - low))
+
+  def text(self, min_len: int, max_len: int) -> str:
+    """A text of min_len to max_len characters (whole words unless max_len is too short)"""
+    min_len = max(1, min_len)
+    if max_len < min_len:
+      raise ValueError(f"Text bounds ({min_len}, {max_len}) are empty")
+
+    if min_len <= self.longest:
+      low = self._first[min_len]
+      high = self._first[min(max_len, self.longest) + 1]
+      if low < high:
+        return self.table[self._index(low, high)]
+
+    # No text fits: join texts long enough and cut the result at a word boundary
+    text = ''
+    while len(text) < min_len:
+      low = self._first[min(min_len - len(text), self.longest)]
+      text = f"{text} {self.table[self._index(low, len(self.table))]}".lstrip()
+    if len(text) > max_len:
+      cut = text.rfind(' ', min_len, max_len + 1)
+      text = text[:cut] if cut >= min_len else text[:max_len]
+    return text
+
+
+class ValuePools:
+  """Process wide pools, each opened (or built, the first time) when a value is first drawn"""
+  _lock = threading.Lock()
+  _config = ConfigValuePools()
+  _seed: int | None = None
+  _pools: dict[str, ValuePool] = {}
+  _corpus: TextCorpus | None = None
+
+  @classmethod
+  def configure(cls, config: ConfigValuePools, seed: int | None = None):
+    with cls._lock:
+      cls._config = config
+      cls._seed = seed
+      cls._pools = {}
+      cls._corpus = None
+
+  @classmethod
+  def directory(cls) -> str:
+    config = cls._config
+    return os.path.join(config.directory, f"{config.locale}-v{POOL_VERSION}")
+
+  @classmethod
+  def draw(cls, name: str) -> str:
+    if not cls._config.enabled:
+      return getattr(SharedFaker.get(), name)()
+    return cls.pool(name).draw()
+
+  @classmethod
+  def sample(cls, name: str, count: int) -> list[str]:
+    if not cls._config.enabled:
+      fake = SharedFaker.get()
+      return [getattr(fake, name)() for _ in range(count)]
+    return cls.pool(name).sample(count)
+
+  @classmethod
+  def text(cls, min_len: int, max_len: int) -> str:
+    """Lorem text of min_len to max_len characters"""
+    if not cls._config.enabled:
+      return faker_text(SharedFaker.get(), min_len, max_len)
+    return cls.corpus().text(min_len, max_len)
+
+  @classmethod
+  def corpus(cls) -> TextCorpus:
+    corpus = cls._corpus
+    if corpus is None:
+      with cls._lock:
+        corpus = cls._corpus
+        if corpus is None:
+          table = cls._table('text_corpus', CORPUS_MAX_CHARS, build_corpus)
+          corpus = cls._corpus = TextCorpus(table, cls._rng('text_corpus'))
+    return corpus
+
+  @classmethod
+  def pool(cls, name: str) -> ValuePool:
+    pool = cls._pools.get(name)
+    if pool is None:
+      with cls._lock:
+        pool = cls._pools.get(name)
+        if pool is None:
+          if name not in POOLS:
+            raise KeyError(f"No value pool named '{name}'")
+          table = cls._table(name, cls._config.size,
+                             lambda locale: build_values(name, locale, cls._config.size))
+          pool = cls._pools[name] = ValuePool(table, cls._rng(name))
+    return pool
+
+  @classmethod
+  def _rng(cls, name: str) -> np.random.Generator:
+    # A stream per pool, the draws of one pool do not depend on when the others are used
+    seed = None if cls._seed is None else [cls._seed, zlib.crc32(name.encode())]
+    return np.random.default_rng(seed)
+
+  @classmethod
+  def _table(cls, name: str, size: int, build: Callable[[str], list[str]]) -> StringTable:
+    path = os.path.join(cls.directory(), f"{name}.{size}")
+    table = StringTable.open(path)
+    if table is not None:
+      return table
+
+    print(f"Building the {name} value pool ({size}) in {cls.directory()}")
+    try:
+      os.makedirs(cls.directory(), exist_ok=True)
+      StringTable.write(path, build(cls._config.locale))
+    except OSError as e:
+      raise SeedingError(f"Failed to write the {name} value pool to {path}. Error: {e}") from e
+    return StringTable.open(path)
+
+
+def build_values(name: str, locale: str, size: int) -> list[str]:
+  """Values of a pool, from a Faker seeded with the pool version so a rebuild gives the same ones"""
+  generate = getattr(pool_faker(locale), name)
+  return [generate() for _ in range(size)]
+
+
+def pool_faker(locale: str) -> 'Faker':
+  fake = faker_class()(locale, providers=list(PROVIDERS))
+  fake.seed_instance(POOL_VERSION)
+  return fake
+
+
+def build_corpus(locale: str) -> list[str]:
+  """
+    TEXTS_PER_LENGTH texts for every length up to CORPUS_MAX_CHARS, sorted by length. Like
+    Faker's text() a text is as many random sentences (words below MIN_SENTENCES_CHARS) as fit.
+    """
+  fake = pool_faker(locale)
+  sentences = [fake.sentence() for _ in range(CORPUS_SENTENCES)]
+  words = [fake.word() for _ in range(CORPUS_SENTENCES)]
+  rng = random.Random(POOL_VERSION)
+
+  texts = []
+  for length in range(1, CORPUS_MAX_CHARS + 1):
+    for _ in range(TEXTS_PER_LENGTH):
+      if length < MIN_SENTENCES_CHARS:
+        # Words made a sentence, the period takes the last character
+        text = fill(words, length - 1, rng)
+        text = f"{text[:1].upper()}{text[1:]}." if text else ''
+      else:
+        text = fill(sentences, length, rng)
+      if text:
+        texts.append(text)
+  texts.sort(key=len)
+  return texts
+
+
+def fill(pieces: list[str], length: int, rng: random.Random) -> str:
+  """Random pieces joined by spaces while they fit in `length`, a few misses end the text"""
+  text = ''
+  misses = 0
+  while misses < 8:
+    piece = rng.choice(pieces)
+    candidate = f"{text} {piece}" if text else piece
+    if len(candidate) > length:
+      misses += 1
+      continue
+    text = candidate
+  return text
+
+
+def faker_text(fake: 'Faker', min_len: int, max_len: int) -> str:
+  """Faker text of min_len to max_len characters, padded with words like the corpus is not"""
+  text = fake.text(max_nb_chars=max(5, max_len))
+  while len(text) < min_len:
+    text += " " + fake.word()
+  return text[:max_len].strip()
@@ -1,34 +1,69 @@
+from general_utils.checkpoint import IdLeases, prepare_checkpoints
 from general_utils.db import DatabasePool
 from general_utils.general import fatal
-from seeders.load import load
-from seeders.seed_hero_products import seed_hero_products
-from seeders.seed_inventory import seed_inventory
-from seeders.seed_orders import seed_orders
-from seeders.seed_payment_methods import seed_payment_methods
-from seeders.seed_products import seed_products
-from seeders.seed_users import seed_users
+from general_utils.ids import UniqueIds
+from general_utils.metrics import RunMetrics
+from general_utils.scheduler import run_stages
+from general_utils.sinks import FileSink
+from seeders import bulk_load
+from seeders.cli import apply_args, parse_args, print_plan
+from seeders.load import connect, load_config
+from seeders.registry import SeedRegistry
+from seeders.stages import run_on_pooled_connection
 
 
 def main():
   print("megacommerce data seeder")
 
-  config = load()
+  args = parse_args()
+  config = load_config()
+  stages = apply_args(config, args)
+  if args.dry_run:
+    print_plan(config, stages)
+    return
+
+  connect(config)
   conn = None
+  registry = None
+  id_leases = None
+  completed = False
 
   try:
+    FileSink.configure(config.export)
     conn = DatabasePool.get_conn()
     conn.autocommit = False
+    if not FileSink.enabled():
+      prepare_checkpoints(conn, config)
+      # IDs continue after the ones earlier runs wrote, an export goes to an empty database
+      id_leases = IdLeases()
+      UniqueIds.persist(id_leases.load, id_leases.save)
+    if config.bulk_load.enabled:
+      bulk_load.prepare(config.bulk_load)
+
+    # A resumed or topped-up run only knows part of the rows, later stages must read them from
+    # the database
+    # An export never reaches the database, its registry spills the rows past the cap to files
+    registry = None if config.seeding.resume or config.seeding.top_up else SeedRegistry(
+        config.seeding.registry_max_rows, spill=FileSink.enabled())
 
-    seed_users(conn, config)
-    seed_products(conn, config)
-    seed_inventory(conn)
-    seed_orders(conn, config)
-    seed_hero_products(conn)
-    seed_payment_methods(conn, config)
+    parallel = config.seeding.parallel_stages
+    if parallel > 1:
+      # Every stage commits on its own pooled connection, this one is not needed anymore
+      conn.commit()
+      DatabasePool.release_conn(conn)
+      conn = None
+      run_stages(stages, lambda stage: run_on_pooled_connection(stage, config, registry), parallel)
+    else:
+      run_stages(stages, lambda stage: stage.run(conn, config, registry))
 
     # All operations successful, commit the transaction
-    conn.commit()
-    print("Successfully committed all seeding changes.")
+    if conn:
+      conn.commit()
+    completed = True
+    if FileSink.enabled():
+      print(f"Successfully exported all seeding rows to {config.export.directory}.")
+    else:
+      print("Successfully committed all seeding changes.")
 
   except Exception as e:
     if conn:
@@ -36,8 +71,22 @@ def main():
     fatal("error running database seeding transaction", e)
 
   finally:
+    manifest = FileSink.close(completed)
+    if manifest:
+      print(f"Export manifest written to {manifest}")
+    RunMetrics.report()
+    if registry:
+      registry.close()
+    if id_leases:
+      id_leases.close()
     if conn:
       DatabasePool.release_conn(conn)
+    if config.bulk_load.enabled:
+      # Rebuilt whether or not the run succeeded, the dropped definitions are in the state file
+      try:
+        bulk_load.restore(config.bulk_load)
+      except Exception as e:
+        fatal("error rebuilding the bulk load indexes", e)
 
 
 if __name__ == "__main__":
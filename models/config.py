@@ -1,8 +1,28 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
 
 class ConfigDB(BaseModel):
   dsn: str
+  # Connections opened when the pool starts, and the most it opens (parallel stages and order
+  # workers each hold one)
+  pool_min_connections: int = 1
+  pool_max_connections: int = 10
+  # Set up (session params, prepared statements) the first connections before seeding starts
+  warm_up: bool = True
+  # SET <name> = <value> on every connection, e.g. application_name
+  session_params: dict[str, str] = {}
+  # Longest a statement may run on the server, 0 keeps the server default
+  statement_timeout_ms: int = 0
+  # The hot INSERT/UPDATE statements are PREPAREd once per connection and run with EXECUTE
+  prepared_statements: bool = True
+
+
+class ConfigHeroProducts(BaseModel):
+  # Number of distinct on-sale products shown in each slider
+  category_slider: int = 4
+  welcome_deals_slider: int = 4
 
 
 class ConfigSeeding(BaseModel):
@@ -12,6 +32,92 @@ class ConfigSeeding(BaseModel):
   number_of_suppliers_have_products: int
   number_of_customers_have_orders: int
   number_of_orders_per_customer: int
+  server_side_generation: bool = False
+  # Number of rows (orders for seed_orders) buffered before they are written back in bulk
+  batch_size: int = 500
+  # Thresholds at which buffered final-state order rows are written with COPY
+  copy_max_rows: int = 50000
+  copy_max_bytes: int = 32 * 1024 * 1024
+  # workflow_replay: insert then update like the checkout flow, final_state: write final rows once
+  order_write_mode: Literal['workflow_replay', 'final_state'] = 'workflow_replay'
+  # Row statements (inserts, workflow_replay steps) sent per round trip as one multi-statement
+  # psycopg2 query (batching, an error covers the batch), 1 waits for the response of every one
+  pipeline_statements: int = 100
+  # Number of partitions (each on its own pooled connection) used to seed orders
+  workers: int = 1
+  # Stages run at the same time once their dependencies are done, each on its own pooled
+  # connection and transaction. 1 runs them one by one in the run's single transaction
+  parallel_stages: int = 1
+  hero_products: ConfigHeroProducts = ConfigHeroProducts()
+  # Overrides of general_utils.ids.DEFAULT_ID_FORMATS, keyed by namespace
+  id_formats: dict[str, str] = {}
+  # Commit (and record a checkpoint) every N rows of a stage, 0 keeps one transaction per run
+  commit_every: int = 0
+  # Continue from the checkpoints of the previous run (set by --resume)
+  resume: bool = False
+  # Only generate what the database lacks against the counts above (set by --top-up)
+  top_up: bool = False
+  # Attempts (with exponential backoff from retry_base_delay_ms) of a chunk hitting 40001 errors
+  retry_max_attempts: int = 5
+  retry_base_delay_ms: int = 50
+  # Seeds python's random, Faker, NumPy, the value pools and the ID allocators so runs can be
+  # reproduced
+  seed: int | None = None
+  # NDJSON file receiving the rows isolated as failing by a batch savepoint
+  reject_log: str = 'rejects.ndjson'
+  # Rows of a kind (users of a type, products, inventory) handed from stage to stage in memory,
+  # past it later stages stream them from the database (an export spills them to a scratch file)
+  # so memory does not grow with the data. A product is a few hundred bytes per variant
+  registry_max_rows: int = 100000
+  # Products (with their inventory) held in memory at once while seeding orders from the database
+  catalog_window: int = 50000
+
+
+ExportFormat = Literal['tsv', 'csv', 'ndjson', 'parquet']
+
+
+class ConfigExport(BaseModel):
+  # Directory receiving the rows as files instead of the database (set by --export)
+  directory: str | None = None
+  # tsv is the COPY text format, csv suits COPY and IMPORT INTO, parquet is for analytics only
+  format: ExportFormat = 'tsv'
+  # Per table overrides of `format`
+  table_formats: dict[str, ExportFormat] = {'products': 'ndjson'}
+  # A table is split into part-00001, part-00002, ... files of at most this many rows
+  rows_per_file: int = 100000
+
+
+class ConfigValuePools(BaseModel):
+  # Draw names, usernames, addresses and currencies from pools generated once by Faker, false
+  # calls Faker for every value
+  enabled: bool = True
+  # Directory keeping the pools as memory-mapped files, reused by later runs
+  directory: str = '.value_pools'
+  # Faker locale the pools are generated in
+  locale: str = 'en_US'
+  # Values generated for every pool
+  size: int = 50000
+
+
+class ConfigBulkLoad(BaseModel):
+  # Drop the secondary indexes and foreign keys of `tables` before loading and rebuild them after
+  # (set by --bulk-load)
+  enabled: bool = False
+  # Tables whose non-unique indexes and foreign keys are deferred, unique indexes are kept
+  tables: list[str] = ['products', 'orders', 'order_line_items', 'inventory_items']
+  # Indexes kept anyway, by table and leading column: the stages read through them while loading
+  # (the orders' inventory windows, the inventory anti-join and the --top-up counts)
+  keep_indexes: dict[str, list[str]] = {
+      'inventory_items': ['product_id'],
+      'orders': ['user_id'],
+      'products': ['user_id'],
+  }
+  # Definitions of the dropped indexes and foreign keys, kept until they are all rebuilt
+  state_file: str = 'bulk_load_state.json'
+  # Row counts, index and constraint validity and timings of the rebuild
+  report_file: str = 'bulk_load_report.json'
+  # Indexes built at the same time, each on its own pooled connection
+  parallel_builds: int = 4
 
 
 class ConfigMinio(BaseModel):
@@ -26,3 +132,6 @@ class Config(BaseModel):
   db: ConfigDB
   seeding: ConfigSeeding
   minio: ConfigMinio
+  export: ConfigExport = ConfigExport()
+  value_pools: ConfigValuePools = ConfigValuePools()
+  bulk_load: ConfigBulkLoad = ConfigBulkLoad()
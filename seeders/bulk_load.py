@@ -0,0 +1,327 @@
+"""
+Bulk-load mode (main.py --bulk-load, file_loader --bulk-load): the non-unique secondary indexes and
+the foreign keys of the loaded tables are dropped before the rows are written and recreated once
+they are, then the tables are analyzed and a verification report is written.
+
+Unique indexes (primary keys included) are kept, the seeders rely on them to reject duplicates,
+and so are the indexes of bulk_load.keep_indexes the stages read through while loading.
+The dropped definitions are saved to bulk_load.state_file before anything is dropped and the file
+is only removed once every index and constraint is back, an interrupted load is finished with
+
+  python -m seeders.bulk_load restore
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import connection, cursor
+
+from general_utils.db import DatabasePool
+from general_utils.general import fatal, get_time_miliseconds
+from models.app import SeedingError
+from models.config import ConfigBulkLoad
+from seeders.load import connect, load_config
+
+SECONDARY_INDEXES_STMT = """
+  SELECT tablename, indexname, indexdef
+    FROM pg_indexes
+   WHERE schemaname = current_schema() AND tablename = ANY(%s)
+     AND indexdef NOT LIKE 'CREATE UNIQUE INDEX%%'
+   ORDER BY tablename, indexname
+"""
+
+FOREIGN_KEYS_STMT = """
+  SELECT t.relname, c.conname, pg_get_constraintdef(c.oid), c.convalidated
+    FROM pg_constraint AS c
+    JOIN pg_class AS t ON t.oid = c.conrelid
+    JOIN pg_namespace AS n ON n.oid = t.relnamespace
+   WHERE c.contype = 'f' AND n.nspname = current_schema() AND t.relname = ANY(%s)
+   ORDER BY t.relname, c.conname
+"""
+
+INDEX_VALIDITY_STMT = """
+  SELECT i.relname, x.indisvalid
+    FROM pg_index AS x
+    JOIN pg_class AS i ON i.oid = x.indexrelid
+    JOIN pg_class AS t ON t.oid = x.indrelid
+    JOIN pg_namespace AS n ON n.oid = t.relnamespace
+   WHERE n.nspname = current_schema() AND t.relname = ANY(%s)
+"""
+
+
+def is_cockroach(cur: cursor) -> bool:
+  cur.execute("SELECT version()")
+  return 'CockroachDB' in cur.fetchone()[0]
+
+
+def with_autocommit(work: Callable[[connection], Any]) -> Any:
+  """Runs `work` on a pooled connection in autocommit, DDL like CREATE INDEX CONCURRENTLY needs it"""
+  conn = DatabasePool.get_conn()
+  try:
+    conn.autocommit = True
+    return work(conn)
+  finally:
+    conn.autocommit = False
+    DatabasePool.release_conn(conn)
+
+
+def leading_column(definition: str) -> str | None:
+  """First key column of a CREATE INDEX definition, None when it is an expression"""
+  if '(' not in definition:
+    return None
+  key = definition[definition.index('(') + 1:].split(',')[0].split(')')[0].split()
+  return key[0].strip('"') if key and '(' not in key[0] else None
+
+
+def read_definitions(cur: cursor, tables: list[str],
+                     keep: dict[str, list[str]]) -> dict[str, list[dict[str, str]]]:
+  cur.execute(SECONDARY_INDEXES_STMT, (tables,))
+  indexes = [{
+      'table': t,
+      'name': n,
+      'definition': d
+  } for t, n, d in cur.fetchall() if leading_column(d) not in keep.get(t, [])]
+  cur.execute(FOREIGN_KEYS_STMT, (tables,))
+  foreign_keys = [{'table': t, 'name': n, 'definition': d} for t, n, d, _ in cur.fetchall()]
+  return {'indexes': indexes, 'foreign_keys': foreign_keys}
+
+
+def load_state(path: str) -> dict[str, Any] | None:
+  if not os.path.exists(path):
+    return None
+  with open(path) as f:
+    return json.load(f)
+
+
+def save_state(path: str, state: dict[str, Any]):
+  with open(path + '.tmp', 'w') as f:
+    json.dump(state, f, indent=2)
+    f.write('\n')
+  os.replace(path + '.tmp', path)
+
+
+def merged(saved: list[dict[str, str]], current: list[dict[str, str]]) -> list[dict[str, str]]:
+  """Saved definitions (already dropped by an interrupted load) followed by the current ones"""
+  names = {(d['table'], d['name']) for d in saved}
+  return saved + [d for d in current if (d['table'], d['name']) not in names]
+
+
+def prepare(config: ConfigBulkLoad):
+  """Saves the definitions of the secondary indexes and foreign keys of the tables and drops them"""
+  started = time.perf_counter()
+
+  def drop(conn: connection) -> dict[str, Any]:
+    with conn.cursor() as cur:
+      cockroach = is_cockroach(cur)
+      current = read_definitions(cur, config.tables, config.keep_indexes)
+      saved = load_state(config.state_file)
+      if saved:
+        print(f"⚠️ {config.state_file} lists definitions of an unfinished bulk load, they are "
+              "recreated with the ones dropped now")
+      state = {
+          'tables': sorted(set(config.tables) | set(saved['tables'] if saved else [])),
+          'cockroach': cockroach,
+          'dropped_at': get_time_miliseconds(),
+          'indexes': merged(saved['indexes'] if saved else [], current['indexes']),
+          'foreign_keys': merged(saved['foreign_keys'] if saved else [], current['foreign_keys']),
+      }
+      # Saved first, a crash while dropping loses nothing
+      save_state(config.state_file, state)
+
+      # Foreign keys first, CockroachDB refuses to drop an index a constraint uses
+      for fk in current['foreign_keys']:
+        cur.execute(f"ALTER TABLE {fk['table']} DROP CONSTRAINT IF EXISTS {fk['name']}")
+      for index in current['indexes']:
+        target = f"{index['table']}@{index['name']}" if cockroach else index['name']
+        cur.execute(f"DROP INDEX IF EXISTS {target}")
+      return current
+
+  try:
+    dropped = with_autocommit(drop)
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to drop the indexes and foreign keys for the bulk load, their "
+                       f"definitions are kept in {config.state_file}. Error: {e}") from e
+  print(f"Bulk load: dropped {len(dropped['indexes'])} indexes and "
+        f"{len(dropped['foreign_keys'])} foreign keys of {', '.join(config.tables)} "
+        f"in {time.perf_counter() - started:.1f}s (saved to {config.state_file})")
+
+
+def create_index(index: dict[str, str], cockroach: bool) -> tuple[str, float, str | None]:
+  """Builds one index on its own connection, (name, seconds, error)"""
+  started = time.perf_counter()
+  prefix = 'CREATE INDEX IF NOT EXISTS ' if cockroach else 'CREATE INDEX CONCURRENTLY IF NOT EXISTS '
+  stmt = prefix + index['definition'].removeprefix('CREATE INDEX ')
+
+  def build(conn: connection):
+    with conn.cursor() as cur:
+      try:
+        cur.execute(stmt)
+      except Psycopg2Error:
+        if not cockroach:
+          # A failed concurrent build leaves an invalid index IF NOT EXISTS would skip on retry
+          cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index['name']}")
+        raise
+
+  try:
+    with_autocommit(build)
+    return index['name'], time.perf_counter() - started, None
+  except Psycopg2Error as e:
+    return index['name'], time.perf_counter() - started, str(e).strip()
+
+
+def add_foreign_key(cur: cursor, fk: dict[str, str], cockroach: bool) -> str | None:
+  """Adds a constraint back unless it exists, validated separately on Postgres (lighter lock)"""
+  cur.execute(
+      "SELECT 1 FROM pg_constraint AS c JOIN pg_class AS t ON t.oid = c.conrelid "
+      "WHERE t.relname = %s AND c.conname = %s", (fk['table'], fk['name']))
+  if cur.fetchone():
+    return None
+  add = f"ALTER TABLE {fk['table']} ADD CONSTRAINT {fk['name']} {fk['definition']}"
+  try:
+    if cockroach:
+      cur.execute(add)
+    else:
+      cur.execute(f"{add} NOT VALID")
+      cur.execute(f"ALTER TABLE {fk['table']} VALIDATE CONSTRAINT {fk['name']}")
+    return None
+  except Psycopg2Error as e:
+    return str(e).strip()
+
+
+def restore(config: ConfigBulkLoad) -> dict[str, Any] | None:
+  """
+    Recreates what prepare dropped: the indexes parallel_builds at a time (CONCURRENTLY on
+    Postgres, CockroachDB builds them online), then the foreign keys, then ANALYZE. Writes the
+    verification report and removes the state file once everything is back.
+    """
+  state = load_state(config.state_file)
+  if state is None:
+    return None
+  cockroach = state['cockroach']
+  timings: dict[str, float] = {}
+  errors: dict[str, str] = {}
+
+  started = time.perf_counter()
+  # One connection is held by the run, the others can build
+  workers = max(1, min(config.parallel_builds, DatabasePool.max_connections() - 1))
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    for name, seconds, error in executor.map(lambda index: create_index(index, cockroach),
+                                             state['indexes']):
+      timings[f"index.{name}"] = seconds
+      if error:
+        errors[name] = error
+  timings['indexes'] = time.perf_counter() - started
+
+  def constraints_and_analyze(conn: connection):
+    with conn.cursor() as cur:
+      started = time.perf_counter()
+      for fk in state['foreign_keys']:
+        error = add_foreign_key(cur, fk, cockroach)
+        if error:
+          errors[fk['name']] = error
+      timings['foreign_keys'] = time.perf_counter() - started
+
+      started = time.perf_counter()
+      for table in state['tables']:
+        cur.execute(f"ANALYZE {table}")
+      timings['analyze'] = time.perf_counter() - started
+      return verify(cur, state, errors, timings)
+
+  try:
+    report = with_autocommit(constraints_and_analyze)
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to restore the bulk load constraints, their definitions are "
+                       f"kept in {config.state_file}. Error: {e}") from e
+
+  with open(config.report_file, 'w') as f:
+    json.dump(report, f, indent=2)
+    f.write('\n')
+  print_report(report, config.report_file)
+  if report['ok']:
+    os.remove(config.state_file)
+  else:
+    print(f"⚠️ Definitions kept in {config.state_file}, fix the data and run "
+          "python -m seeders.bulk_load restore")
+  return report
+
+
+def verify(cur: cursor, state: dict[str, Any], errors: dict[str, str],
+           timings: dict[str, float]) -> dict[str, Any]:
+  """Checks that every saved index and foreign key exists and is valid, with the table sizes"""
+  tables = state['tables']
+  cur.execute(INDEX_VALIDITY_STMT, (tables,))
+  valid_indexes = dict(cur.fetchall())
+  cur.execute(FOREIGN_KEYS_STMT, (tables,))
+  validated = {name: ok for _, name, _, ok in cur.fetchall()}
+
+  rows = {}
+  for table in tables:
+    cur.execute(f"SELECT count(*) FROM {table}")
+    rows[table] = cur.fetchone()[0]
+
+  indexes = [{
+      'table': index['table'],
+      'name': index['name'],
+      'exists': index['name'] in valid_indexes,
+      'valid': bool(valid_indexes.get(index['name'])),
+      'seconds': round(timings.get(f"index.{index['name']}", 0), 3),
+      'error': errors.get(index['name']),
+  } for index in state['indexes']]
+  foreign_keys = [{
+      'table': fk['table'],
+      'name': fk['name'],
+      'exists': fk['name'] in validated,
+      'validated': bool(validated.get(fk['name'])),
+      'error': errors.get(fk['name']),
+  } for fk in state['foreign_keys']]
+
+  return {
+      'ok': all(i['valid'] for i in indexes) and all(fk['validated'] for fk in foreign_keys),
+      'checked_at': get_time_miliseconds(),
+      'rows': rows,
+      'indexes': indexes,
+      'foreign_keys': foreign_keys,
+      'seconds': {
+          name: round(seconds, 3) for name, seconds in timings.items() if '.' not in name
+      },
+  }
+
+
+def print_report(report: dict[str, Any], path: str):
+  seconds = report['seconds']
+  print(f"Bulk load: rebuilt {len(report['indexes'])} indexes in {seconds.get('indexes', 0):.1f}s, "
+        f"{len(report['foreign_keys'])} foreign keys in {seconds.get('foreign_keys', 0):.1f}s, "
+        f"analyzed in {seconds.get('analyze', 0):.1f}s")
+  for item in report['indexes'] + report['foreign_keys']:
+    if not (item.get('valid') or item.get('validated')):
+      print(f"❌ {item['table']}.{item['name']} is not restored. Error: {item['error']}")
+  if report['ok']:
+    print(f"✅ Every index and foreign key is back and valid, report written to {path}")
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(prog='python -m seeders.bulk_load',
+                                   description="finish an interrupted bulk load")
+  parser.add_argument('command',
+                      choices=['restore'],
+                      help="recreate the indexes and foreign keys listed in bulk_load.state_file")
+  return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None):
+  parse_args(argv)
+  config = load_config()
+  connect(config)
+  try:
+    if restore(config.bulk_load) is None:
+      print(f"Nothing to restore, {config.bulk_load.state_file} does not exist.")
+  except Exception as e:
+    fatal("error restoring the bulk load indexes", e)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,359 @@
+import json
+import os
+from itertools import chain, islice
+from typing import Iterator, Sized
+
+import numpy as np
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import cursor
+
+from models.app import SeedingError
+from seeders.inventory_ledger import InventoryEntry, InventoryLedger
+
+NO_PRICE = -1
+SHIPPING_CENTS = 223
+
+
+def to_cents(price: str | None) -> int:
+  """Same conversion the order seeder always used: int(float(x) * 100), NO_PRICE when empty"""
+  return int(float(price) * 100) if price else NO_PRICE
+
+
+def variant_summaries(offer: dict | str | None) -> tuple[tuple[str, str, int, int, int, int], ...]:
+  """
+    (variant_id, sku, price, list_price, sale_price, quantity) of every variant of a
+    products.offer document, prices in cents. This is all the later stages read from an offer.
+    """
+  if isinstance(offer, str):
+    offer = json.loads(offer)
+  variants = (offer or {}).get('offer') or {}
+  return tuple((variant_id, variant.get('sku') or '', to_cents(variant.get('price')),
+                to_cents(variant.get('list_price')), to_cents(variant.get('sale_price')),
+                int(variant.get('quantity') or 0)) for variant_id, variant in variants.items())
+
+
+class ProductCatalog:
+  """
+    Columnar copy of the product offers needed to price orders.
+
+    Variants of product p live at [variant_offsets[p], variant_offsets[p + 1]) in every
+    per-variant column, prices are kept in cents, NO_PRICE marks a missing list/sale price.
+    """
+
+  def __init__(self):
+    self.product_ids: list[str] = []
+    self.product_titles: list[str] = []
+    self.variant_ids: list[str] = []
+    self.skus: list[str] = []
+    self.variant_offsets = np.zeros(1, dtype=np.int64)
+    self.price_cents = np.zeros(0, dtype=np.int64)
+    self.list_price_cents = np.zeros(0, dtype=np.int64)
+    self.sale_price_cents = np.zeros(0, dtype=np.int64)
+    self.quantity = np.zeros(0, dtype=np.int32)
+
+  def __len__(self) -> int:
+    return len(self.product_ids)
+
+  @property
+  def has_sale(self) -> np.ndarray:
+    return self.sale_price_cents > 0
+
+  @classmethod
+  def from_rows(cls, rows) -> 'ProductCatalog':
+    """Builds the catalog from (id, title, offer) rows, offer being the products.offer JSONB"""
+
+    def summaries():
+      for product_id, title, offer in rows:
+        try:
+          yield product_id, title, variant_summaries(offer)
+        except (ValueError, TypeError, AttributeError) as e:
+          raise SeedingError(
+              f"DATA PARSING ERROR while loading the catalog. Product ID: {product_id}, Error: {e}"
+          ) from e
+
+    return cls.from_summaries(summaries())
+
+  @classmethod
+  def from_summaries(cls, rows) -> 'ProductCatalog':
+    """Builds the catalog from (id, title, variant_summaries) rows, as the registry keeps them"""
+    catalog = cls()
+    offsets = [0]
+    prices, list_prices, sale_prices, quantities = [], [], [], []
+
+    for product_id, title, variants in rows:
+      for variant_id, sku, price, list_price, sale_price, quantity in variants:
+        prices.append(price)
+        list_prices.append(list_price)
+        sale_prices.append(sale_price)
+        quantities.append(quantity)
+        catalog.variant_ids.append(variant_id)
+        catalog.skus.append(sku)
+
+      catalog.product_ids.append(product_id)
+      catalog.product_titles.append(title)
+      offsets.append(len(catalog.variant_ids))
+
+    catalog.variant_offsets = np.array(offsets, dtype=np.int64)
+    catalog.price_cents = np.array(prices, dtype=np.int64)
+    catalog.list_price_cents = np.array(list_prices, dtype=np.int64)
+    catalog.sale_price_cents = np.array(sale_prices, dtype=np.int64)
+    catalog.quantity = np.array(quantities, dtype=np.int32)
+    return catalog
+
+  def take(self, product_indices) -> 'ProductCatalog':
+    """Catalog restricted to the given products (used to partition products between workers)"""
+    product_indices = np.asarray(product_indices, dtype=np.int64)
+    variant_idx = self.variant_rows(product_indices)[1]
+    counts = self.variant_offsets[product_indices + 1] - self.variant_offsets[product_indices]
+
+    catalog = ProductCatalog()
+    catalog.product_ids = [self.product_ids[i] for i in product_indices.tolist()]
+    catalog.product_titles = [self.product_titles[i] for i in product_indices.tolist()]
+    catalog.variant_ids = [self.variant_ids[i] for i in variant_idx.tolist()]
+    catalog.skus = [self.skus[i] for i in variant_idx.tolist()]
+    catalog.variant_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    catalog.price_cents = self.price_cents[variant_idx]
+    catalog.list_price_cents = self.list_price_cents[variant_idx]
+    catalog.sale_price_cents = self.sale_price_cents[variant_idx]
+    catalog.quantity = self.quantity[variant_idx]
+    return catalog
+
+  def variant_rows(self, product_indices: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+      Expands products into their variants.
+      Returns (position of the product in product_indices, variant index) for every variant.
+      """
+    starts = self.variant_offsets[product_indices]
+    counts = self.variant_offsets[product_indices + 1] - starts
+    owner = np.repeat(np.arange(len(product_indices), dtype=np.int64), counts)
+    first_of_owner = np.repeat(np.cumsum(counts) - counts, counts)
+    variant_idx = np.repeat(starts, counts) + (np.arange(len(owner), dtype=np.int64) - first_of_owner)
+    return owner, variant_idx
+
+  def bind_inventory(self, ledger: InventoryLedger) -> tuple[list[InventoryEntry | None], np.ndarray]:
+    """Ledger entry of every variant and an array of their available quantities (-1 if missing)"""
+    entries = [
+        ledger.get(self.product_ids[p], self.variant_ids[v])
+        for p in range(len(self.product_ids))
+        for v in range(self.variant_offsets[p], self.variant_offsets[p + 1])
+    ]
+    available = np.fromiter((entry.quantity_available if entry else -1 for entry in entries),
+                            dtype=np.int64,
+                            count=len(entries))
+    return entries, available
+
+
+class CatalogWindow:
+  """Products [start, end) of a product sequence, with their inventory"""
+
+  def __init__(self, catalog: ProductCatalog, ledger: InventoryLedger, start: int):
+    self.catalog = catalog
+    self.ledger = ledger
+    self.start = start
+
+  @property
+  def end(self) -> int:
+    return self.start + len(self.catalog)
+
+  def covers(self, index: int) -> bool:
+    return self.start <= index < self.end
+
+
+class InMemoryProducts:
+  """
+    Products already in memory (published to the registry in this run), a single window.
+    Like ProductStream it hands out `total` products through window().
+    """
+
+  def __init__(self, catalog: ProductCatalog, ledger: InventoryLedger):
+    self.total = len(catalog)
+    self._window = CatalogWindow(catalog, ledger, 0)
+
+  def partition(self, partition: int, workers: int) -> 'InMemoryProducts':
+    catalog = self._window.catalog.take(np.arange(partition, self.total, workers))
+    return InMemoryProducts(catalog, self._window.ledger.subset(set(catalog.product_ids)))
+
+  def window(self, cur: cursor, index: int) -> CatalogWindow:
+    return self._window
+
+
+# Products of a partition: every `workers`-th row of a page read in primary key order. The page
+# starts at a multiple of `workers`, page_end is where the next page continues.
+PARTITION_PAGE_STMT = """
+  SELECT id, title, offer, page_end FROM (
+    SELECT id, title, offer, row_number() OVER (ORDER BY id) AS n, max(id) OVER () AS page_end
+      FROM (SELECT id, title, offer FROM products WHERE {after} ORDER BY id LIMIT %s OFFSET %s)
+        AS page
+  ) AS numbered
+  WHERE mod(n - 1, %s) = %s
+  ORDER BY id
+"""
+
+
+class ProductStream:
+  """
+    Products read from the database `size` at a time with the inventory of each window, so
+    memory stays bounded whatever the size of the products table.
+
+    Products are ordered by id (ULIDs, creation order) and partition `partition` of `workers`
+    owns every product whose position modulo `workers` is `partition`. Consecutive windows
+    continue after the last id read, a jump (resumed run, cycling back to the first product)
+    uses OFFSET once.
+    """
+
+  def __init__(self, total: int, size: int, partition: int = 0, workers: int = 1):
+    self.total = total
+    self.size = max(1, size)
+    self._partition = partition
+    self._workers = workers
+    # Index of the product following the last window and the id its page continues after
+    self._next = 0
+    self._after = None
+
+  @classmethod
+  def count(cls, cur: cursor, size: int) -> 'ProductStream':
+    try:
+      cur.execute("SELECT count(*) FROM products")
+      return cls(int(cur.fetchone()[0]), size)
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB SELECT failed while counting the products. Error: {e}") from e
+
+  def partition(self, partition: int, workers: int) -> 'ProductStream':
+    return ProductStream(len(range(partition, self.total, workers)), self.size, partition, workers)
+
+  def window(self, cur: cursor, index: int) -> CatalogWindow:
+    """The products of this partition starting at `index`"""
+    page_rows = self.size * self._workers
+    if index == self._next and self._after is not None:
+      after, args = "id > %s", [self._after, page_rows, 0]
+    else:
+      after, args = "TRUE", [page_rows, index * self._workers]
+    try:
+      cur.execute(PARTITION_PAGE_STMT.format(after=after), [*args, self._workers, self._partition])
+      rows = cur.fetchall()
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB SELECT failed while loading products {index}+. Error: {e}") from e
+    if not rows:
+      raise SeedingError(f"No product at position {index} of {self.total}, were products deleted?")
+
+    catalog = ProductCatalog.from_rows(row[:3] for row in rows)
+    self._next = index + len(catalog)
+    self._after = rows[-1][3]
+    return CatalogWindow(catalog, InventoryLedger.load(cur, catalog.product_ids), index)
+
+
+class SpilledProducts:
+  """
+    Products and inventory published to the registry but spilled to its scratch files (--export
+    past registry_max_rows), read back `size` products at a time like ProductStream reads them
+    from the database.
+
+    Products are (id, title, variant_summaries) rows and partition `partition` of `workers` owns
+    every product whose position modulo `workers` is `partition`. A window scans the spilled
+    inventory for the rows of its products. The quantities left by a window are appended to a
+    file next to the spilled inventory when it leaves memory, and override the registry rows
+    when the products come back (the orders cycle through the products). Inventory the registry
+    still holds in memory is loaded once and shared by the windows instead.
+    """
+
+  def __init__(self, products: Sized, inventory: Sized, size: int, partition: int = 0,
+               workers: int = 1, ledger: InventoryLedger | None = None):
+    self.total = len(range(partition, len(products), workers))
+    self.size = max(1, size)
+    self._products = products
+    self._inventory = inventory
+    self._partition = partition
+    self._workers = workers
+    if ledger is None and isinstance(inventory, list):
+      ledger = InventoryLedger.from_records(inventory)
+    self._ledger = ledger
+    self._quantities = None
+    if ledger is None:
+      self._quantities = os.path.join(os.path.dirname(inventory.path),
+                                      f"quantities.{partition + 1}of{workers}.ndjson")
+    # Rows of this partition following the last window, and the index of the next one
+    self._rows = None
+    self._next = 0
+    self._window: CatalogWindow | None = None
+
+  def partition(self, partition: int, workers: int) -> 'SpilledProducts':
+    return SpilledProducts(self._products, self._inventory, self.size, partition, workers,
+                           self._ledger)
+
+  def window(self, cur: cursor, index: int) -> CatalogWindow:
+    """The products of this partition starting at `index`"""
+    if self._window is not None and self._quantities:
+      with open(self._quantities, 'a') as f:
+        for record in self._window.ledger.records():
+          f.write(json.dumps(record) + '\n')
+    if self._rows is None or index != self._next:
+      self._rows = islice(iter(self._products), self._partition + index * self._workers, None,
+                          self._workers)
+    catalog = ProductCatalog.from_summaries(islice(self._rows, self.size))
+    if not len(catalog):
+      raise SeedingError(f"No product at position {index} of {self.total} in the registry")
+    self._next = index + len(catalog)
+
+    product_ids = set(catalog.product_ids)
+    if self._ledger is not None:
+      ledger = self._ledger.subset(product_ids)
+    else:
+      records = self._inventory
+      if os.path.exists(self._quantities):
+        records = chain(records, self._saved_quantities())
+      # Later records of an entry replace the earlier ones
+      ledger = InventoryLedger.from_records(record for record in records
+                                            if record[1] in product_ids)
+    self._window = CatalogWindow(catalog, ledger, index)
+    return self._window
+
+  def _saved_quantities(self) -> Iterator[list]:
+    with open(self._quantities) as f:
+      for line in f:
+        yield json.loads(line)
+
+
+# Where the orders stage takes its products from
+ProductSource = InMemoryProducts | ProductStream | SpilledProducts
+
+
+class PricedLines:
+  """Line items of a batch of orders, one array element per line"""
+
+  def __init__(self, order: np.ndarray, variant: np.ndarray, quantity: np.ndarray,
+               discount_cents: np.ndarray, total_cents: np.ndarray, subtotal_cents: np.ndarray):
+    self.order = order
+    self.variant = variant
+    self.quantity = quantity
+    self.discount_cents = discount_cents
+    self.total_cents = total_cents
+    self.subtotal_cents = subtotal_cents
+
+
+def price_order_batch(catalog: ProductCatalog, available: np.ndarray, product_indices: np.ndarray,
+                      rng: np.random.Generator) -> PricedLines:
+  """
+    Picks quantities and prices every line of a batch of orders (one product per order).
+    `available` is decremented in place by the chosen quantities. Each product must appear at
+    most once per batch so that no variant is reserved twice within the same computation.
+    """
+  owner, variant_idx = catalog.variant_rows(product_indices)
+  avail = available[variant_idx]
+
+  # Same rules as before: 20% of the stock, or 1-5 units for well stocked variants
+  quantity = (avail * 0.20).astype(np.int64)
+  well_stocked = quantity > 6
+  quantity[well_stocked] = rng.integers(1, 6, size=int(well_stocked.sum()))
+  keep = (quantity > 0) & (avail >= quantity)
+
+  owner, variant_idx, quantity = owner[keep], variant_idx[keep], quantity[keep]
+  available[variant_idx] -= quantity
+
+  sale = catalog.sale_price_cents[variant_idx]
+  unit_price = np.where(sale > 0, sale, catalog.price_cents[variant_idx])
+  line_subtotal = unit_price * quantity
+  discount_cents = np.where(rng.random(len(quantity)) < 0.5, (line_subtotal * 0.05).astype(np.int64),
+                            0)
+  total_cents = line_subtotal - discount_cents + SHIPPING_CENTS
+
+  return PricedLines(owner, variant_idx, quantity, discount_cents, total_cents, line_subtotal)
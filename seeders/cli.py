@@ -0,0 +1,194 @@
+import argparse
+import random
+from typing import get_args
+
+import numpy as np
+import yaml
+from pydantic import ValidationError
+
+from general_utils.fake import SharedFaker
+from general_utils.ids import UniqueIds
+from general_utils.value_pools import ValuePools
+from general_utils.scheduler import Stage
+from models.config import Config, ConfigSeeding, ExportFormat
+from seeders.stages import STAGES, planned_rows
+
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+# Entity counts multiplied by --scale. Per-entity counts (products per supplier, orders per
+# customer) are left alone so every table grows linearly with the scale factor
+SCALED_FIELDS = (
+    'number_of_suppliers',
+    'number_of_customers',
+    'number_of_suppliers_have_products',
+    'number_of_customers_have_orders',
+)
+
+
+def stage_list(value: str) -> list[str]:
+  names = [name.strip() for name in value.split(',') if name.strip()]
+  unknown = [name for name in names if name not in STAGE_NAMES]
+  if unknown:
+    raise argparse.ArgumentTypeError(
+        f"unknown stage(s) {', '.join(unknown)}, expected some of: {', '.join(STAGE_NAMES)}")
+  return names
+
+
+def positive_int(value: str) -> int:
+  number = int(value)
+  if number < 1:
+    raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+  return number
+
+
+def positive_float(value: str) -> float:
+  number = float(value)
+  if number <= 0:
+    raise argparse.ArgumentTypeError(f"expected a positive number, got {value}")
+  return number
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(
+      description="megacommerce data seeder",
+      epilog=f"stages: {', '.join(STAGE_NAMES)}. Counts not given on the command line come from "
+      "config.<ENV>.yaml")
+  parser.add_argument('--resume',
+                      action='store_true',
+                      help="continue from the checkpoints recorded by the previous run")
+  parser.add_argument('--top-up',
+                      action='store_true',
+                      help="count the rows already in the database and only generate the "
+                      "shortfall against the configured counts")
+  parser.add_argument('--scale',
+                      type=positive_float,
+                      default=1.0,
+                      help="multiply the number of suppliers and customers (and those having "
+                      "products/orders) by this factor")
+  selection = parser.add_mutually_exclusive_group()
+  selection.add_argument('--only',
+                         type=stage_list,
+                         action='extend',
+                         metavar='STAGES',
+                         help="comma separated stages to run, their dependencies must exist")
+  selection.add_argument('--skip',
+                         type=stage_list,
+                         action='extend',
+                         metavar='STAGES',
+                         help="comma separated stages to leave out")
+  parser.add_argument('--workers', type=positive_int, help="partitions used to seed orders")
+  parser.add_argument('--batch-size', type=positive_int, help="rows buffered per write")
+  parser.add_argument('--parallel-stages',
+                      type=positive_int,
+                      help="stages allowed to run at the same time")
+  parser.add_argument('--seed', type=int, help="seed every random generator for repeatable data")
+  parser.add_argument('--set',
+                      dest='overrides',
+                      action='append',
+                      default=[],
+                      metavar='FIELD=VALUE',
+                      help="override a seeding setting (applied after --scale), e.g. "
+                      "--set number_of_orders_per_customer=50 --set hero_products.category_slider=6")
+  parser.add_argument('--export',
+                      metavar='DIR',
+                      help="write the rows to files in DIR instead of the database (orders in "
+                      "their final state), load them with python -m seeders.file_loader DIR")
+  parser.add_argument('--export-format',
+                      choices=get_args(ExportFormat),
+                      help="file format of the tables without a per-table format in the config")
+  parser.add_argument('--bulk-load',
+                      action='store_true',
+                      help="drop the secondary indexes and foreign keys of the big tables before "
+                      "seeding and rebuild them afterwards")
+  parser.add_argument('--dry-run',
+                      action='store_true',
+                      help="print the planned row counts per table and exit")
+  return parser.parse_args(argv)
+
+
+def apply_args(config: Config, args: argparse.Namespace) -> list[Stage]:
+  """Applies the command line to the loaded config, returns the stages to run"""
+  seeding = config.seeding.model_dump()
+
+  if args.scale != 1:
+    for field in SCALED_FIELDS:
+      seeding[field] = max(1, round(seeding[field] * args.scale))
+  for name, field in (('workers', 'workers'), ('batch_size', 'batch_size'),
+                      ('parallel_stages', 'parallel_stages'), ('seed', 'seed')):
+    if getattr(args, name) is not None:
+      seeding[field] = getattr(args, name)
+  seeding['resume'] = args.resume
+  seeding['top_up'] = args.top_up
+
+  for override in args.overrides:
+    key, sep, value = override.partition('=')
+    if not sep:
+      raise SystemExit(f"--set expects FIELD=VALUE, got {override}")
+    target = seeding
+    *parents, field = key.strip().split('.')
+    for parent in parents:
+      if not isinstance(target.get(parent), dict):
+        raise SystemExit(f"--set: unknown seeding setting {key}")
+      target = target[parent]
+    if field not in target:
+      raise SystemExit(f"--set: unknown seeding setting {key}")
+    target[field] = yaml.safe_load(value)
+
+  try:
+    config.seeding = ConfigSeeding(**seeding)
+  except ValidationError as e:
+    raise SystemExit(f"invalid seeding settings: {e}") from e
+  if config.seeding.top_up and config.seeding.resume:
+    # A top-up recounts what exists, an interrupted one is continued by running it again
+    raise SystemExit("--top-up cannot be combined with --resume, rerun --top-up instead")
+
+  if args.export:
+    config.export.directory = args.export
+  if args.export_format:
+    config.export.format = args.export_format
+  if config.export.directory:
+    check_export(config)
+
+  if args.bulk_load:
+    config.bulk_load.enabled = True
+  if config.bulk_load.enabled and config.export.directory:
+    raise SystemExit("--bulk-load cannot be combined with --export, use file_loader --bulk-load")
+
+  if config.seeding.seed is not None:
+    seed_generators(config)
+
+  if args.only:
+    return [stage for stage in STAGES if stage.name in args.only]
+  if args.skip:
+    return [stage for stage in STAGES if stage.name not in args.skip]
+  return list(STAGES)
+
+
+def check_export(config: Config):
+  """Exported rows never reach the database, so nothing may depend on them being there"""
+  seeding = config.seeding
+  if seeding.server_side_generation:
+    raise SystemExit("--export cannot be combined with server_side_generation")
+  if seeding.commit_every or seeding.resume or seeding.top_up:
+    raise SystemExit("--export cannot be combined with commit_every, --resume or --top-up")
+
+
+def seed_generators(config: Config):
+  seed = config.seeding.seed
+  random.seed(seed)
+  np.random.seed(seed)
+  SharedFaker.seed(seed)
+  UniqueIds.configure(config.seeding.id_formats, seed)
+  ValuePools.configure(config.value_pools, seed)
+
+
+def print_plan(config: Config, stages: list[Stage]):
+  print(f"Stages: {', '.join(stage.name for stage in stages)}")
+  print("Planned rows per table (~ marks estimates from the generators' averages):")
+  for table, (rows, exact) in planned_rows(config, [stage.name for stage in stages]).items():
+    print(f"  - {table}: {'' if exact else '~'}{rows}")
+  if config.seeding.top_up:
+    print("With --top-up the rows already in the database are subtracted when the run starts")
+  if config.bulk_load.enabled:
+    print(f"With --bulk-load the secondary indexes and foreign keys of "
+          f"{', '.join(config.bulk_load.tables)} are rebuilt after the run")
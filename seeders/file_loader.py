@@ -0,0 +1,202 @@
+"""
+Bulk-loads an export written by `main.py --export DIR` into the configured database.
+
+  python -m seeders.file_loader DIR                         COPY ... FROM STDIN from this host
+  python -m seeders.file_loader DIR --method import --url nodelocal://1/seed
+                                                            CockroachDB IMPORT INTO, the cluster
+                                                            reads the files under the URL
+
+NDJSON tables are inserted in batches expanded by json_populate_recordset with either method,
+parquet tables are meant for analytics and are skipped.
+"""
+import argparse
+import json
+import os
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import connection, cursor
+
+from general_utils.db import DatabasePool
+from general_utils.general import fatal
+from general_utils.sinks import MANIFEST
+from models.app import SeedingError
+from seeders import bulk_load
+from seeders.inventory_ledger import ADJUSTMENT_COLUMNS, ADJUSTMENTS_TABLE
+from seeders.load import connect, load_config
+
+# Reservations are loaded here first, then applied to inventory_items in one UPDATE
+ADJUSTMENTS_STAGING = 'seed_inventory_adjustments'
+
+CREATE_STAGING_STMT = f"""
+  CREATE TABLE IF NOT EXISTS {ADJUSTMENTS_STAGING} (id TEXT, quantity INT8, updated_at INT8)
+"""
+
+APPLY_ADJUSTMENTS_STMT = f"""
+  UPDATE inventory_items AS i
+     SET quantity_reserved = i.quantity_reserved + a.quantity,
+         quantity_available = i.quantity_available - a.quantity,
+         updated_at = a.updated_at
+    FROM (SELECT id, sum(quantity) AS quantity, max(updated_at) AS updated_at
+            FROM {ADJUSTMENTS_STAGING}
+           GROUP BY id) AS a
+   WHERE i.id = a.id
+"""
+
+NDJSON_BATCH_ROWS = 1000
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+  parser = argparse.ArgumentParser(prog='python -m seeders.file_loader',
+                                   description="load a seeding export into the database")
+  parser.add_argument('directory', help="directory written by --export")
+  parser.add_argument('--method',
+                      choices=['copy', 'import'],
+                      default='copy',
+                      help="COPY from this host (default) or CockroachDB IMPORT INTO")
+  parser.add_argument('--url',
+                      help="URL under which the cluster reads DIR, required by --method import "
+                      "(e.g. nodelocal://1/seed or http://fileserver:8000/seed)")
+  parser.add_argument('--bulk-load',
+                      action='store_true',
+                      help="drop the secondary indexes and foreign keys of the big tables before "
+                      "loading and rebuild them afterwards")
+  args = parser.parse_args(argv)
+  if args.method == 'import' and not args.url:
+    parser.error("--method import needs --url")
+  return args
+
+
+def load_manifest(directory: str) -> dict:
+  path = os.path.join(directory, MANIFEST)
+  if not os.path.exists(path):
+    raise SeedingError(f"{path} not found, is {directory} an export?")
+  with open(path, 'r') as f:
+    manifest = json.load(f)
+  if not manifest.get('complete'):
+    raise SeedingError(f"The export in {directory} is incomplete, its seeding run failed")
+  return manifest
+
+
+def copy_files(cur: cursor, directory: str, target: str, entry: dict):
+  options = " WITH (FORMAT csv)" if entry['format'] == 'csv' else ''
+  stmt = f"COPY {target} ({', '.join(entry['columns'])}) FROM STDIN{options}"
+  for name in entry['files']:
+    with open(os.path.join(directory, name), 'r', newline='') as f:
+      cur.copy_expert(stmt, f)
+
+
+def import_files(cur: cursor, url: str, target: str, entry: dict):
+  files = ', '.join(f"'{url.rstrip('/')}/{name}'" for name in entry['files'])
+  columns = ', '.join(entry['columns'])
+  if entry['format'] == 'csv':
+    cur.execute(f"IMPORT INTO {target} ({columns}) CSV DATA ({files}) WITH nullif = ''")
+  else:
+    # The COPY text format: tab separated, backslash escapes, \N for NULL
+    cur.execute(f"IMPORT INTO {target} ({columns}) DELIMITED DATA ({files}) "
+                "WITH fields_escaped_by = '\\', nullif = '\\N'")
+
+
+def insert_ndjson(cur: cursor, directory: str, target: str, entry: dict):
+  columns = ', '.join(entry['columns'])
+  stmt = (f"INSERT INTO {target} ({columns}) "
+          f"SELECT {columns} FROM json_populate_recordset(NULL::{target}, %s)")
+  for name in entry['files']:
+    with open(os.path.join(directory, name), 'r') as f:
+      batch = []
+      for line in f:
+        batch.append(line.strip())
+        if len(batch) >= NDJSON_BATCH_ROWS:
+          cur.execute(stmt, ['[' + ','.join(batch) + ']'])
+          batch = []
+      if batch:
+        cur.execute(stmt, ['[' + ','.join(batch) + ']'])
+
+
+def load_table(conn: connection, directory: str, entry: dict, method: str, url: str | None,
+               target: str):
+  fmt = entry['format']
+  if fmt == 'parquet':
+    print(f"⚠️ Skipping {entry['table']}: parquet files are not loadable, export it as csv/tsv")
+    return
+
+  try:
+    with conn.cursor() as cur:
+      if fmt == 'ndjson':
+        insert_ndjson(cur, directory, target, entry)
+      elif method == 'import':
+        import_files(cur, url, target, entry)
+      else:
+        copy_files(cur, directory, target, entry)
+    conn.commit()
+  except Psycopg2Error as e:
+    conn.rollback()
+    raise SeedingError(f"Loading {entry['table']} from {directory} failed. Error: {e}") from e
+  print(f"✅ Loaded {entry['rows']} rows into {entry['table']} ({len(entry['files'])} files)")
+
+
+def load_export(conn: connection, directory: str, method: str = 'copy', url: str | None = None):
+  """Loads the tables in manifest order (parents first), then applies the reservations"""
+  manifest = load_manifest(directory)
+  adjustments = None
+
+  for entry in manifest['tables']:
+    if entry['table'] == ADJUSTMENTS_TABLE:
+      adjustments = entry
+      continue
+    if method == 'import' and entry['format'] != 'ndjson':
+      # IMPORT INTO cannot run inside a transaction
+      conn.autocommit = True
+    load_table(conn, directory, entry, method, url, entry['table'])
+    conn.autocommit = False
+
+  if adjustments is None:
+    return
+
+  if list(adjustments['columns']) != list(ADJUSTMENT_COLUMNS):
+    raise SeedingError(f"Unexpected {ADJUSTMENTS_TABLE} columns {adjustments['columns']}")
+  try:
+    with conn.cursor() as cur:
+      cur.execute(f"DROP TABLE IF EXISTS {ADJUSTMENTS_STAGING}")
+      cur.execute(CREATE_STAGING_STMT)
+    conn.commit()
+    if method == 'import':
+      conn.autocommit = True
+    load_table(conn, directory, adjustments, method, url, ADJUSTMENTS_STAGING)
+    conn.autocommit = False
+
+    with conn.cursor() as cur:
+      cur.execute(APPLY_ADJUSTMENTS_STMT)
+      print(f"✅ Applied reservations to {cur.rowcount} inventory items")
+      cur.execute(f"DROP TABLE {ADJUSTMENTS_STAGING}")
+    conn.commit()
+  except Psycopg2Error as e:
+    conn.rollback()
+    raise SeedingError(f"Applying the inventory reservations failed. Error: {e}") from e
+
+
+def main(argv: list[str] | None = None):
+  args = parse_args(argv)
+  config = load_config()
+  connect(config)
+
+  conn = DatabasePool.get_conn()
+  try:
+    conn.autocommit = False
+    if args.bulk_load:
+      bulk_load.prepare(config.bulk_load)
+    load_export(conn, args.directory, args.method, args.url)
+    print(f"Successfully loaded {args.directory}.")
+  except Exception as e:
+    conn.rollback()
+    fatal("error loading the export", e)
+  finally:
+    DatabasePool.release_conn(conn)
+    if args.bulk_load:
+      try:
+        bulk_load.restore(config.bulk_load)
+      except Exception as e:
+        fatal("error rebuilding the bulk load indexes", e)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,141 @@
+from typing import Iterator
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import cursor
+from psycopg2.extras import execute_values
+
+from general_utils.general import get_time_miliseconds
+from general_utils.sinks import FileSink
+from models.app import SeedingError
+
+# Reservations of an export, applied to inventory_items by the file loader once it is loaded
+ADJUSTMENTS_TABLE = 'inventory_adjustments'
+ADJUSTMENT_COLUMNS = ('id', 'quantity', 'updated_at')
+
+
+class InventoryEntry:
+  __slots__ = ('id', 'quantity_available', 'quantity_reserved', 'pending_reserved')
+
+  def __init__(self, id: str, quantity_available: int, quantity_reserved: int):
+    self.id = id
+    self.quantity_available = quantity_available
+    self.quantity_reserved = quantity_reserved
+    self.pending_reserved = 0
+
+
+class InventoryLedger:
+  """
+    In-memory copy of inventory_items keyed by (product_id, variant_id).
+    Reservations are applied here first and written back in bulk by flush().
+    """
+
+  def __init__(self):
+    self._entries: dict[tuple[str, str], InventoryEntry] = {}
+    self._dirty: list[InventoryEntry] = []
+
+  def __len__(self) -> int:
+    return len(self._entries)
+
+  @classmethod
+  def load(cls, cur: cursor, product_ids: list[str] | None = None) -> 'InventoryLedger':
+    """Loads inventory_items, only the rows of `product_ids` when given"""
+    ledger = cls()
+    stmt = """SELECT id, product_id, variant_id, quantity_available, quantity_reserved
+                FROM inventory_items"""
+    try:
+      if product_ids is None:
+        cur.execute(stmt)
+      else:
+        cur.execute(f"{stmt} WHERE product_id = ANY(%s)", (product_ids,))
+      for row in cur.fetchall():
+        ledger.add(row[0], row[1], row[2], int(row[3] or 0), int(row[4] or 0))
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB SELECT failed while loading the inventory ledger. Error: {e}") from e
+    return ledger
+
+  @classmethod
+  def from_records(cls, records) -> 'InventoryLedger':
+    """Builds the ledger from (id, product_id, variant_id, available, reserved) records"""
+    ledger = cls()
+    for record in records:
+      ledger.add(*record)
+    return ledger
+
+  def records(self) -> Iterator[tuple[str, str, str, int, int]]:
+    """The entries as from_records() takes them"""
+    for (product_id, variant_id), entry in self._entries.items():
+      yield (entry.id, product_id, variant_id, entry.quantity_available, entry.quantity_reserved)
+
+  def add(self, id: str, product_id: str, variant_id: str, quantity_available: int,
+          quantity_reserved: int = 0):
+    self._entries[(product_id, variant_id)] = InventoryEntry(id, quantity_available,
+                                                             quantity_reserved)
+
+  def subset(self, product_ids: set[str]) -> 'InventoryLedger':
+    """Ledger holding only the entries of the given products (used to partition inventory)"""
+    ledger = InventoryLedger()
+    ledger._entries = {
+        key: entry
+        for key, entry in self._entries.items() if key[0] in product_ids
+    }
+    return ledger
+
+  def get(self, product_id: str, variant_id: str) -> InventoryEntry | None:
+    return self._entries.get((product_id, variant_id))
+
+  def reserve(self, entry: InventoryEntry, quantity: int) -> bool:
+    """Moves `quantity` from available to reserved, returns False if there is not enough stock"""
+    if quantity <= 0 or entry.quantity_available < quantity:
+      return False
+
+    if entry.pending_reserved == 0:
+      self._dirty.append(entry)
+    entry.quantity_available -= quantity
+    entry.quantity_reserved += quantity
+    entry.pending_reserved += quantity
+    return True
+
+  def release(self, entry: InventoryEntry, quantity: int):
+    """Undoes a reservation (of an order that was rejected), even one that was already written"""
+    if entry.pending_reserved == 0:
+      self._dirty.append(entry)
+    entry.quantity_available += quantity
+    entry.quantity_reserved -= quantity
+    entry.pending_reserved -= quantity
+
+  def flush(self, cur: cursor) -> int:
+    """Writes the accumulated reservations with a single UPDATE ... FROM (VALUES ...)"""
+    written = self.write(cur)
+    self.mark_written()
+    return written
+
+  def write(self, cur: cursor) -> int:
+    """Like flush() but keeps the reservations pending, so a restarted transaction can rewrite them"""
+    now_ms = get_time_miliseconds()
+    rows = [(entry.id, entry.pending_reserved, now_ms)
+            for entry in self._dirty
+            if entry.pending_reserved]
+    if not rows:
+      return 0
+    if FileSink.enabled():
+      FileSink.write(ADJUSTMENTS_TABLE, ADJUSTMENT_COLUMNS, rows)
+      return len(rows)
+    stmt = """
+      UPDATE inventory_items AS i
+         SET quantity_reserved = i.quantity_reserved + v.quantity,
+             quantity_available = i.quantity_available - v.quantity,
+             updated_at = v.updated_at
+        FROM (VALUES %s) AS v(id, quantity, updated_at)
+       WHERE i.id = v.id
+    """
+    try:
+      execute_values(cur, stmt, rows, page_size=len(rows))
+    except Psycopg2Error as e:
+      raise SeedingError(
+          f"DB UPDATE failed while flushing {len(rows)} inventory reservations. Error: {e}") from e
+    return len(rows)
+
+  def mark_written(self):
+    for entry in self._dirty:
+      entry.pending_reserved = 0
+    self._dirty = []
@@ -3,11 +3,21 @@ from urllib.parse import urlparse
 
 import yaml
 
-from general_utils.db import DatabasePool
+from general_utils.db import DatabasePool, PreparedStatement
+from general_utils.ids import UniqueIds
+from general_utils.isolation import RejectLog
+from general_utils.value_pools import ValuePools
 from models.config import Config
 
 
 def load() -> Config:
+  config = load_config()
+  connect(config)
+  return config
+
+
+def load_config() -> Config:
+  """Reads config.<ENV>.yaml without touching the database"""
   env = os.getenv('ENV', 'local')
 
   if env not in ['dev', 'local', 'production']:
@@ -27,21 +37,36 @@ def load() -> Config:
     data = yaml.safe_load(f)
 
   config = Config(**data)
+  UniqueIds.configure(config.seeding.id_formats)
+  RejectLog.configure(config.seeding.reject_log)
+  ValuePools.configure(config.value_pools)
+  return config
 
+
+def connect(config: Config):
   try:
     parsed = urlparse(config.db.dsn)
   except Exception as e:
     raise RuntimeError("failed to parse db connection DSN", e)
 
+  db = config.db
+  session_params = dict(db.session_params)
+  if db.statement_timeout_ms:
+    session_params['statement_timeout'] = f"{db.statement_timeout_ms}ms"
+  PreparedStatement.configure(db.prepared_statements)
+
   try:
-    DatabasePool.initialize(host=parsed.hostname,
+    DatabasePool.initialize(minconn=db.pool_min_connections,
+                            maxconn=db.pool_max_connections,
+                            session_params=session_params,
+                            host=parsed.hostname,
                             port=parsed.port,
                             dbname=parsed.path.lstrip("/"),
                             user=parsed.username,
                             password=parsed.password,
                             sslmode="disable")
+    if db.warm_up:
+      DatabasePool.warm_up()
     print('connected to database')
   except Exception as e:
     raise RuntimeError("failed to initialize database connection ", e)
-
-  return config
@@ -1,104 +1,86 @@
 import json
-from faker import Faker
-from google.protobuf import json_format
-from products.v1.product_pb2 import ProductOffer
+from typing import Iterable, Iterator, Sized
+
+from psycopg2 import Error as Psycopg2Error
 from psycopg2.extensions import cursor
+from general_utils.db import keyset_pages
+from general_utils.ids import UniqueIds
 from models.app import SeedingError
 from models.config import Config
-
-fake = Faker()
+from seeders.registry import SeedRegistry
 
 
-class ProductIDAndOffer:
-  def __init__(self, id: str, title: str, offer: ProductOffer):
-    self.id = id
-    self.title = title
-    self.offer = offer
+# Users of a type having a role, {after} is filled in by keyset_pages
+USERS_WITH_ROLE_STMT = "SELECT id FROM users WHERE user_type = %s AND roles && %s AND {after}"
 
 
-def get_user_ids(cur: cursor, cfg: Config) -> list[str]:
+def stream_user_ids(cur: cursor, user_type: str, role: str, limit: int,
+                    page_size: int = 1000) -> Iterator[str]:
   """
-    Fetches a list of customer IDs from the database.
+    First `limit` users of the type having `role`, a page at a time.
+    Ids are ULIDs minted when the user is generated, so id order is creation order and the
+    pages are read through the primary key.
     Raises SeedingError on database operation failure.
     """
-  stmt = "SELECT id FROM users WHERE user_type = %s AND roles && %s ORDER BY created_at LIMIT %s"
   try:
-    # Execute the SQL statement
-    cur.execute(stmt, (
-        'customer',
-        ['customer'],
-        cfg.seeding.number_of_customers_have_orders,
-    ))
+    for page in keyset_pages(cur, USERS_WITH_ROLE_STMT, (user_type, [role]), page_size, limit):
+      for row in page:
+        yield row[0]
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to retrieve {user_type} IDs. Database error: {e}") from e
 
-    rows = cur.fetchall()
-    customer_ids: list[str] = []
-    for row in rows:
-      customer_ids.append(row[0])
 
-    return customer_ids
-  except Exception as e:
-    # Catch any exception (like psycopg2.Error) and raise a SeedingError
-    message = f"Failed to retrieve user IDs. Database error: {e}"
-    raise SeedingError(message) from e
+def count_user_ids(cur: cursor, user_type: str, role: str, limit: int) -> int:
+  """Number of users stream_user_ids() yields"""
+  try:
+    cur.execute(
+        "SELECT count(*) FROM "
+        "(SELECT 1 FROM users WHERE user_type = %s AND roles && %s LIMIT %s) AS u",
+        (user_type, [role], limit))
+    return int(cur.fetchone()[0])
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to count {user_type} IDs. Database error: {e}") from e
 
 
-def get_products(cur: cursor) -> list[ProductIDAndOffer]:
+def get_user_ids(cur: cursor, cfg: Config, registry: SeedRegistry | None = None) -> Iterable[str]:
   """
-    Fetches products and parses their offers from the database.
-    Raises SeedingError on database operation or JSON parsing failure.
+    The customers that get payment methods and orders: a list from the registry when seed_users
+    ran in this process, otherwise an iterator streaming them from the database.
+    Raises SeedingError on database operation failure.
     """
-  stmt = "SELECT id, offer, title FROM products"
-  try:
-    # Database operation
-    cur.execute(stmt)
-    rows = cur.fetchall()
-    products = []
-
-    for row in rows:
-      product_id = row[0]
-      offer_data = row[1]  # This is now a Python dict (from jsonb)
-      offer = ProductOffer()
-
-      # Data parsing operation
-      if offer_data:
-        try:
-          offer_json_string = json.dumps(offer_data)
-
-          json_format.Parse(offer_json_string, offer)
-        except Exception as parse_e:
-          # Catch protobuf/json_format parsing errors
-          message = f"Failed to parse ProductOffer for product ID {product_id}. Error: {parse_e}"
-          raise SeedingError(message) from parse_e
+  limit = cfg.seeding.number_of_customers_have_orders
+  if registry:
+    customer_ids = registry.user_ids('customer', 'customer', limit)
+    if customer_ids is not None:
+      return customer_ids
+  return stream_user_ids(cur, 'customer', 'customer', limit, cfg.seeding.batch_size)
 
-      products.append(ProductIDAndOffer(id=product_id, title=row[2], offer=offer))
 
-    return products
-  except SeedingError:
-    # Re-raise the SeedingError from inside the loop
-    raise
-  except Exception as e:
-    # Catch any exception (like psycopg2.Error) and raise a SeedingError
-    message = f"Failed to retrieve products. Database error: {e}"
-    raise SeedingError(message) from e
+def count_customers(cur: cursor, cfg: Config, customer_ids: Iterable[str]) -> int:
+  """Length of what get_user_ids() returned, counted in the database for a stream"""
+  if isinstance(customer_ids, Sized):
+    return len(customer_ids)
+  return count_user_ids(cur, 'customer', 'customer', cfg.seeding.number_of_customers_have_orders)
 
 
 def create_successful_payment(amount_cents: int, currency: str):
+  payment_intent_id = UniqueIds.next('payment_intent')
   return {
       'payment_provider':
       'stripe',
       'payment_transaction_id':
-      fake.unique.bothify(text='pi_?????????????????????????'),
+      payment_intent_id,
       'payment_status':
       'CAPTURED',
       'payment_provider_response':
       json.dumps({
           'status': 'succeeded',
-          'id': f'pi_{fake.unique.uuid4()}',
+          'id': payment_intent_id,
           'amount': amount_cents,
           'currency': currency,
           'charges': {
               'data': [{
-                  'id': f'ch_{fake.unique.uuid4()}',
+                  'id': UniqueIds.next('charge'),
                   'status': 'succeeded'
               }]
           }
@@ -109,17 +91,18 @@ def create_successful_payment(amount_cents: int, currency: str):
 
 
 def create_failed_payment(amount_cents: int, currency: str):
+  payment_intent_id = UniqueIds.next('payment_intent')
   return {
       'payment_provider':
       'stripe',
       'payment_transaction_id':
-      fake.unique.bothify(text='pi_?????????????????????????'),
+      payment_intent_id,
       'payment_status':
       'FAILED',
       'payment_provider_response':
       json.dumps({
           'status': 'failed',
-          'id': f'pi_{fake.unique.uuid4()}',
+          'id': payment_intent_id,
           'amount': amount_cents,
           'currency': currency,
           'error': {
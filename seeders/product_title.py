@@ -1,9 +1,5 @@
 import random
 
-from faker import Faker
-
-fake = Faker()
-
 
 def generate_product_title(category_id) -> str:
   """
@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from itertools import islice
+from typing import Any, Iterator
+
+from seeders.catalog import variant_summaries
+
+
+class SpilledRows:
+  """Rows of a kind past max_rows kept as JSON lines in a file, read back on every iteration"""
+
+  def __init__(self, path: str, rows: list):
+    self.path = path
+    self.rows = 0
+    self._file = open(path, 'w')
+    for row in rows:
+      self.append(row)
+
+  def append(self, row: tuple):
+    self._file.write(json.dumps(row) + '\n')
+    self.rows += 1
+
+  def __len__(self) -> int:
+    return self.rows
+
+  def __iter__(self) -> Iterator[list]:
+    self._file.flush()
+    with open(self.path) as f:
+      for line in f:
+        yield json.loads(line)
+
+  def close(self):
+    self._file.close()
+
+
+class SpilledIds:
+  """First `limit` ids of spilled users having `role`, re-read on every iteration"""
+
+  def __init__(self, users: SpilledRows, role: str, limit: int):
+    self._users = users
+    self._role = role
+    self._limit = limit
+    self._count: int | None = None
+
+  def __iter__(self) -> Iterator[str]:
+    return islice((id for id, roles in self._users if self._role in roles), self._limit)
+
+  def __len__(self) -> int:
+    if self._count is None:
+      self._count = sum(1 for _ in self)
+    return self._count
+
+
+class SeedRegistry:
+  """
+    Run-scoped record of what every stage created, so later stages do not have to re-query
+    (and re-parse) rows this process wrote moments ago.
+
+    Each accessor returns None when the producing stage has not published in this run (for
+    example when a stage is run on its own); callers then fall back to reading the database.
+    A kind holding more than `max_rows` rows is dropped and reads the database too, so the
+    registry never grows with the dataset. With `spill` (--export, the rows never reach the
+    database) such a kind is moved to a file in a scratch directory and read back from it.
+    """
+
+  def __init__(self, max_rows: int | None = None, spill: bool = False):
+    self._lock = threading.Lock()
+    self.max_rows = max_rows
+    self._spill_directory = tempfile.mkdtemp(prefix='seed-registry-') if spill else None
+    # Kinds ('users.<type>', 'products', 'inventory') that went past max_rows
+    self._dropped: set[str] = set()
+    # user_type -> [(id, roles)] in creation order
+    self._users: dict[str, list[tuple[str, tuple[str, ...]]] | SpilledRows] = {}
+    # (id, title, variants) where variants is variant_summaries(offer): id, sku, prices in cents
+    # and quantity of every variant, the offer document itself is not kept
+    self._products: list[tuple[str, str, tuple[tuple, ...]]] | SpilledRows | None = None
+    # (id, product_id, variant_id, quantity_available, quantity_reserved)
+    self._inventory: list[tuple[str, str, str, int, int]] | SpilledRows | None = None
+
+  def _full(self, kind: str, rows: list | SpilledRows | None) -> bool:
+    """True when `kind` is (or just got) dropped, the caller must not append to it"""
+    if kind in self._dropped:
+      return True
+    if (self.max_rows is not None and isinstance(rows, list) and len(rows) >= self.max_rows
+        and self._spill_directory is None):
+      self._dropped.add(kind)
+      print(f"⚠️ More than {self.max_rows} {kind} rows, later stages will read them from the database")
+      return True
+    return False
+
+  def _append(self, kind: str, rows: list | SpilledRows, row: tuple) -> list | SpilledRows:
+    """Appends `row`, moving the rows of `kind` to a file when they reach max_rows"""
+    if isinstance(rows, list) and self.max_rows is not None and len(rows) >= self.max_rows:
+      rows = SpilledRows(os.path.join(self._spill_directory, f"{kind}.ndjson"), rows)
+    rows.append(row)
+    return rows
+
+  def close(self):
+    """Removes the spilled rows"""
+    with self._lock:
+      for rows in (*self._users.values(), self._products, self._inventory):
+        if isinstance(rows, SpilledRows):
+          rows.close()
+      if self._spill_directory:
+        shutil.rmtree(self._spill_directory, ignore_errors=True)
+
+  def publish_user(self, user_type: str, id: str, roles: list[str]):
+    kind = f"users.{user_type}"
+    with self._lock:
+      if self._full(kind, self._users.get(user_type)):
+        self._users.pop(user_type, None)
+        return
+      self._users[user_type] = self._append(kind, self._users.get(user_type, []),
+                                            (id, tuple(roles)))
+
+  def user_ids(self, user_type: str, role: str, limit: int) -> list[str] | SpilledIds | None:
+    """First `limit` users of the type having `role`, in creation order (like get_user_ids)"""
+    with self._lock:
+      users = self._users.get(user_type)
+      if users is None:
+        return None
+      if isinstance(users, SpilledRows):
+        return SpilledIds(users, role, limit)
+      return [id for id, roles in users if role in roles][:limit]
+
+  def publish_product(self, id: str, title: str, offer: dict[str, Any]):
+    with self._lock:
+      if self._full('products', self._products):
+        self._products = None
+        return
+      self._products = self._append('products', self._products or [],
+                                    (id, title, variant_summaries(offer)))
+
+  def products(self) -> list[tuple[str, str, tuple[tuple, ...]]] | SpilledRows | None:
+    with self._lock:
+      if isinstance(self._products, list):
+        return list(self._products)
+      return self._products
+
+  def publish_inventory(self, id: str, product_id: str, variant_id: str, quantity_available: int,
+                        quantity_reserved: int = 0):
+    with self._lock:
+      if self._full('inventory', self._inventory):
+        self._inventory = None
+        return
+      self._inventory = self._append(
+          'inventory', self._inventory or [],
+          (id, product_id, variant_id, quantity_available, quantity_reserved))
+
+  def inventory(self) -> list[tuple[str, str, str, int, int]] | SpilledRows | None:
+    with self._lock:
+      if isinstance(self._inventory, list):
+        return list(self._inventory)
+      return self._inventory
@@ -1,4 +1,5 @@
 import random
+from itertools import chain, islice
 
 from google.protobuf import json_format
 from products.v1.hero_products_pb2 import (
@@ -8,66 +9,131 @@ from products.v1.hero_products_pb2 import (
     WelcomeDealsSlider,
 )
 from psycopg2 import Error as Psycopg2Error
-from psycopg2 import Error as Psycopg2Error
-from psycopg2.extensions import connection
-from psycopg2.extensions import connection
-from ulid import ULID
+from psycopg2.extensions import connection, cursor
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
 from general_utils.general import get_time_miliseconds
-from general_utils.general import get_time_miliseconds
+from general_utils.sinks import FileSink
 from models.app import SeedingError
-from models.app import SeedingError
-from seeders.orders import ProductIDAndOffer, get_products
+from models.config import Config
+from seeders.registry import SeedRegistry
+from seeders.top_up import count_rows
+
+
+SALE_PRODUCTS_STMT = """
+  SELECT s.id, s.sale_variants
+    FROM (
+      SELECT p.id,
+             ARRAY(SELECT v.key
+                     FROM jsonb_each(p.offer->'offer') AS v(key, value)
+                    WHERE v.value->>'sale_price' IS NOT NULL) AS sale_variants
+        FROM products AS p
+       WHERE {condition}
+       ORDER BY p.id
+    ) AS s
+   WHERE cardinality(s.sale_variants) > 0
+   LIMIT %s
+"""
 
 
-def seed_hero_products(con: connection):
+def random_pivot(cur: cursor) -> str | None:
+  """Random ULID between the lowest and highest product id, both read from the primary key"""
+  cur.execute("SELECT min(id), max(id) FROM products")
+  low, high = cur.fetchone()
+  if low is None:
+    return None
+
+  try:
+    low_ts, high_ts = ULID.from_str(low).timestamp, ULID.from_str(high).timestamp
+    pivot = str(ULID.from_timestamp(random.uniform(low_ts, high_ts)))
+  except ValueError:
+    # Not ULIDs, scan from the start
+    pivot = low
+  return pivot
+
+
+def sale_products_candidates(cur: cursor, registry: SeedRegistry | None,
+                             count: int) -> list[tuple[str, list[str]]]:
+  """
+    Up to `count` distinct (product id, on-sale variant ids) pairs, starting at a random point of
+    the catalog and wrapping around. Only as many products as needed are read, whatever the
+    catalog size.
+    """
+  products = registry.products() if registry else None
+  if products is not None:
+    sale_products: list[tuple[str, list[str]]] = []
+    start = random.randrange(len(products)) if products else 0
+    # From the random start to the end, then from the first product (a spilled registry is read
+    # sequentially)
+    for id, _, variants in chain(islice(products, start, None), islice(products, start)):
+      # variant_id and sale_price of every variant summary
+      sale_variants = [variant[0] for variant in variants if variant[4] > 0]
+      if sale_variants:
+        sale_products.append((id, sale_variants))
+        if len(sale_products) >= count:
+          break
+    return sale_products
+
+  pivot = random_pivot(cur)
+  if pivot is None:
+    return []
+
+  # [pivot, end] first, then wrap around to [start, pivot)
+  cur.execute(SALE_PRODUCTS_STMT.format(condition="p.id >= %s"), [pivot, count])
+  sale_products = [(row[0], list(row[1])) for row in cur.fetchall()]
+  if len(sale_products) < count:
+    cur.execute(SALE_PRODUCTS_STMT.format(condition="p.id < %s"),
+                [pivot, count - len(sale_products)])
+    sale_products.extend((row[0], list(row[1])) for row in cur.fetchall())
+  return sale_products
+
+
+def add_slider_products(slider, products: list[tuple[str, list[str]]]):
+  for (product_id, variant_ids) in products:
+    product_item = HeroProductListItem()
+    product_item.id = product_id
+    product_item.variant_id = random.choice(variant_ids)
+    slider.products.append(product_item)
+
+
+def seed_hero_products(con: connection, cfg: Config, registry: SeedRegistry | None = None):
   stmt = """
     INSERT INTO hero_products(id, products_data, created_at) VALUES(%s, %s, %s)
     """
+  checkpoint = Checkpoint(con, 'hero_products', cfg)
+  if checkpoint.already_completed():
+    return
+  if cfg.seeding.top_up:
+    with con.cursor() as cur:
+      if count_rows(cur, 'hero_products'):
+        print("Top-up: hero products exist, skipping seed_hero_products")
+        return
 
   try:
     with con.cursor() as cur:
       # Create sample hero products data
       hero_product_data = HeroProductData()
+      sliders_cfg = cfg.seeding.hero_products
+      wanted = sliders_cfg.category_slider + sliders_cfg.welcome_deals_slider
 
-      products = get_products(cur)
-      sale_products: list[ProductIDAndOffer] = []
-      for pro in products:
-        if len(sale_products) > 20:
-          break
-        for (_, variant) in pro.offer.offer.items():
-          if variant.sale_price:
-            sale_products.append(pro)
+      sale_products = sale_products_candidates(cur, registry, wanted)
+      if len(sale_products) < wanted:
+        raise SeedingError(
+            f"Found {len(sale_products)} products on sale, {wanted} are needed for the hero sliders")
 
       # Build Category Slider
       category_slider = CategorySlider()
       category_slider.title = "Fashion Party"
       category_slider.subtitle = "Shop the latest trends"
       category_slider.button_text = "View All"
-
-      # Add products to category slider
-      products_idx = 0
-      for _ in range(4):
-        (variant_id, variant) = random.choice(list(sale_products[products_idx].offer.offer.items()))
-        product_item = HeroProductListItem()
-        product_item.id = sale_products[products_idx].id
-        product_item.variant_id = variant_id
-        category_slider.products.append(product_item)
-        products_idx += 1
+      add_slider_products(category_slider, sale_products[:sliders_cfg.category_slider])
 
       welcome_deals = WelcomeDealsSlider()
       welcome_deals.title = "Welcome Deals"
       welcome_deals.subtitle = "Special offers for new customers"
       welcome_deals.button_text = "Shop Now"
-
-      for _ in range(4):
-        (variant_id, variant) = random.choice(list(sale_products[products_idx].offer.offer.items()))
-        product_item = HeroProductListItem()
-        product_item.id = sale_products[products_idx].id
-        product_item.variant_id = variant_id
-        welcome_deals.products.append(product_item)
-        products_idx += 1
+      add_slider_products(welcome_deals, sale_products[sliders_cfg.category_slider:])
 
       hero_product_data.category_slider.CopyFrom(category_slider)
       hero_product_data.welcome_deals_slider.CopyFrom(welcome_deals)
@@ -77,7 +143,13 @@ def seed_hero_products(con: connection):
           preserving_proto_field_name=True,  # keeps snake_case!
           indent=2,
           use_integers_for_enums=False)
-      cur.execute(stmt, [str(ULID()), data_json, get_time_miliseconds()])
+
+    row = (str(ULID()), data_json, get_time_miliseconds())
+    if FileSink.enabled():
+      FileSink.write('hero_products', ('id', 'products_data', 'created_at'), [row])
+      checkpoint.complete('done')
+    else:
+      checkpoint.complete('done', write=lambda cur: cur.execute(stmt, row))
     con.commit()
 
   except Psycopg2Error as e:
@@ -1,56 +1,137 @@
 import json
+from typing import Iterator
 
-from faker import Faker
-from google.protobuf import json_format
-from products.v1.product_pb2 import ProductOffer
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, cursor
 from psycopg2 import Error as Psycopg2Error
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
+from general_utils.db import PreparedStatement, keyset_pages, sql_now_ms, sql_ulid
 from general_utils.general import get_time_miliseconds
+from general_utils.ids import UniqueIds
+from general_utils.isolation import write_isolated
+from general_utils.pipeline import StatementPipeline
+from general_utils.sinks import FileSink
 from models.app import SeedingError
+from models.config import Config
+from seeders.registry import SeedRegistry
+
+
+INVENTORY_ITEM_COLUMNS = ('id', 'product_id', 'variant_id', 'sku', 'quantity_available',
+                          'quantity_reserved', 'quantity_total', 'location_id', 'metadata',
+                          'created_at')
+
+INSERT_INVENTORY_ITEM_STMT = PreparedStatement(
+    'seed_insert_inventory_item', """
+  INSERT INTO inventory_items (
+    id, product_id, variant_id, sku, quantity_available,
+    quantity_reserved, quantity_total, location_id, metadata, created_at
+  ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+""")
+
+# Quantity of a variant `v` of an offer, converted like seed_inventory does: missing is 0 and a
+# value that is not an integer is 100
+SQL_QUANTITY = r"""CASE
+    WHEN jsonb_typeof(v.value->'quantity') = 'number'
+      THEN trunc((v.value->>'quantity')::NUMERIC)::INT8
+    WHEN COALESCE(v.value->>'quantity', '') = '' THEN 0
+    WHEN v.value->>'quantity' ~ '^\s*[-+]?[0-9]+\s*$' THEN trim(v.value->>'quantity')::INT8
+    ELSE 100
+  END"""
+
+# Restricts a products query to products without inventory, used when resuming or topping up
+WITHOUT_INVENTORY = """
+  NOT EXISTS (SELECT 1 FROM inventory_items AS i WHERE i.product_id = p.id)
+"""
+
+
+def stream_products(cur: cursor, cfg: Config) -> Iterator[tuple]:
+  """(id, title, offer) of the products, read with keyset pagination on the primary key"""
+  stmt = 'SELECT id, title, offer FROM products AS p WHERE {after}'
+  if cfg.seeding.resume or cfg.seeding.top_up:
+    stmt += f" AND {WITHOUT_INVENTORY}"
+  try:
+    for page in keyset_pages(cur, stmt, page_size=cfg.seeding.batch_size, key='p.id'):
+      yield from page
+  except Psycopg2Error as e:
+    raise SeedingError(f"DB SELECT failed while fetching products for inventory. Error: {e}") from e
+
 
-fake = Faker()
+def offer_variants(offer: dict | None) -> Iterator[tuple]:
+  """(variant_id, sku, quantity) of the variants of a products.offer document"""
+  for variant_id, variant in ((offer or {}).get('offer') or {}).items():
+    yield variant_id, variant.get('sku'), variant.get('quantity')
 
 
-def seed_inventory(conn: connection):
+def run_inventory(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
+  if cfg.seeding.server_side_generation:
+    seed_inventory_server_side(conn, cfg, registry)
+  else:
+    seed_inventory(conn, cfg, registry)
+
+
+def seed_inventory(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
   """
     Seeds inventory items based on product variants defined in the 'products' table,
     using consistent error handling.
+    Products published to the registry in this run are used instead of re-reading the table.
+    When resuming or topping up, only products that have no inventory item yet are processed.
     """
-  products_data = []
-
-  try:
-    with conn.cursor() as cur:
-      cur.execute('SELECT id, offer FROM products')
-      products_data = cur.fetchall()
-
-      if not products_data:
-        print("⚠️ Skipping seed_inventory: No products found to create inventory.")
-        return
-
-  except Psycopg2Error as e:
-    raise SeedingError(f"DB SELECT failed while fetching products for inventory. Error: {e}") from e
-  except Exception as e:
-    raise SeedingError(f"Unexpected error while fetching products for inventory: {e}") from e
-
-  for product_row in products_data:
-    product_id = product_row[0]
-    offer_json_raw = product_row[1]
-
+  checkpoint = Checkpoint(conn, 'inventory', cfg)
+  if checkpoint.already_completed():
+    return
+
+  # (product_id, (variant_id, sku, quantity) of its variants) of every product
+  products = registry.products() if registry else None
+  read_cur = None
+  if products is not None:
+    products_data = ((product_id, [(v[0], v[1], v[5]) for v in variants])
+                     for product_id, _, variants in products)
+  else:
+    # Streamed a page at a time, so memory does not grow with the products table
+    read_cur = conn.cursor()
+    products_data = ((product_id, offer_variants(offer))
+                     for product_id, _, offer in stream_products(read_cur, cfg))
+
+  # inventory_items rows of the products generated since the last write, grouped by product
+  held: list[list[tuple]] = []
+
+  def insert(cur: cursor, products: list[list[tuple]]):
+    with StatementPipeline(cur, cfg.seeding.pipeline_statements) as pipeline:
+      for product_rows in products:
+        for row in product_rows:
+          pipeline.execute(INSERT_INVENTORY_ITEM_STMT, row)
+
+  def write(cur: cursor):
+    if FileSink.enabled():
+      FileSink.write('inventory_items', INVENTORY_ITEM_COLUMNS,
+                     [row for product_rows in held for row in product_rows])
+      return
+    # A product is accepted or rejected with all its variants
+    held[:] = write_isolated(cur, held, insert, 'inventory',
+                             lambda product_rows: {
+                                 'product_id': product_rows[0][1],
+                                 'variants': [row[2] for row in product_rows]
+                             })
+
+  def written():
+    if registry:
+      for product_rows in held:
+        for row in product_rows:
+          # id, product_id, variant_id, quantity_available, quantity_reserved
+          registry.publish_inventory(row[0], row[1], row[2], row[4], row[5])
+    held.clear()
+
+  product_number = 0
+  for product_number, (product_id, variants) in enumerate(products_data, start=1):
+    product_rows = []
     try:
-      offer = ProductOffer()
-
-      if offer_json_raw:
-        # json.dumps converts the psycopg2 JSON/dict object into a string for parsing
-        json_format.Parse(json.dumps(offer_json_raw), offer)
-
-      for variant_id, variant_data in offer.offer.items():
+      for variant_id, sku, quantity in variants:
 
-        sku = variant_data.sku or fake.unique.bothify(text='SKU-#####')
+        sku = sku or UniqueIds.next('sku')
 
         try:
-          quantity_total = int(variant_data.quantity)
+          quantity_total = int(quantity or 0)
         except (ValueError, TypeError):
           quantity_total = 100
           print(
@@ -59,27 +140,90 @@ def seed_inventory(conn: connection):
 
         quantity_reserved = 0
         quantity_available = quantity_total - quantity_reserved
-
-        with conn.cursor() as cur:
-          cur.execute(
-              """INSERT INTO inventory_items (
-                            id, product_id, variant_id, sku, quantity_available, 
-                            quantity_reserved, quantity_total, location_id, metadata, created_at
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""", [
-                  str(ULID()), product_id, variant_id, sku, quantity_available, quantity_reserved,
-                  quantity_total, None,
-                  json.dumps({
-                      'source': 'seed',
-                      'auto_generated': True
-                  }),
-                  get_time_miliseconds()
-              ])
-
-    except Psycopg2Error as e:
-      print(f"❌ DB INSERT failed for inventory_items (Product: {product_id}). Error: {e}")
-      continue
+        product_rows.append((str(ULID()), product_id, variant_id, sku, quantity_available,
+                             quantity_reserved, quantity_total, None,
+                             json.dumps({
+                                 'source': 'seed',
+                                 'auto_generated': True
+                             }), get_time_miliseconds()))
+
+      if product_rows:
+        held.append(product_rows)
     except Exception as e:
       print(f"❌ DATA PROCESSING failed for Product {product_id}. Error: {e}")
       continue
 
-  print(f" Successfully seeded inventory for {len(products_data)} products.")
+    # Written at product boundaries, so a resumed run never sees half a product
+    if checkpoint.advance(product_number, rows=len(product_rows), write=write):
+      written()
+
+  if read_cur:
+    read_cur.close()
+  if not product_number:
+    print("⚠️ Skipping seed_inventory: No products found to create inventory.")
+    return
+  checkpoint.complete(product_number, write=write)
+  written()
+  print(f" Successfully seeded inventory for {product_number} products.")
+
+
+def seed_inventory_server_side(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
+  """
+    Set-based variant of seed_inventory: expands every product offer into its variants with
+    jsonb_each and inserts all inventory_items rows in a single INSERT ... SELECT.
+    The rows are not read back, seed_orders loads them from the table a window at a time.
+    """
+  checkpoint = Checkpoint(conn, 'inventory', cfg)
+  if checkpoint.already_completed():
+    return
+  condition = f"AND {WITHOUT_INVENTORY}" if cfg.seeding.resume or cfg.seeding.top_up else ''
+  variants = f"""
+      FROM products AS p, jsonb_each(p.offer->'offer') AS v(key, value)
+     WHERE TRUE {condition}
+  """
+  count_stmt = f"SELECT count(*) {variants} AND NULLIF(v.value->>'sku', '') IS NULL"
+
+  def insert_stmt(missing_skus: int) -> str:
+    # Variants without a SKU are numbered 1..missing_skus and rendered from the next values of
+    # the allocator the client-side path draws from, so SKUs never repeat
+    sku = UniqueIds.sql('sku', missing_skus, 'v.n') if missing_skus else 'NULL'
+    return f"""
+      WITH variants AS (
+        SELECT p.id AS product_id,
+               v.key AS variant_id,
+               NULLIF(v.value->>'sku', '') AS sku,
+               row_number() OVER (PARTITION BY NULLIF(v.value->>'sku', '') IS NULL
+                                  ORDER BY p.id, v.key) AS n,
+               {SQL_QUANTITY} AS quantity
+        {variants}
+      )
+      INSERT INTO inventory_items (
+        id, product_id, variant_id, sku, quantity_available,
+        quantity_reserved, quantity_total, location_id, metadata, created_at
+      )
+      SELECT {sql_ulid('v.variant_id')},
+             v.product_id,
+             v.variant_id,
+             COALESCE(v.sku, {sku}),
+             v.quantity,
+             0,
+             v.quantity,
+             NULL,
+             '{{"source": "seed", "auto_generated": true}}'::JSONB,
+             {sql_now_ms()}
+        FROM variants AS v
+    """
+
+  inserted = 0
+
+  def write(cur: cursor):
+    nonlocal inserted
+    try:
+      cur.execute(count_stmt)
+      cur.execute(insert_stmt(int(cur.fetchone()[0])))
+      inserted = cur.rowcount
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB INSERT ... SELECT failed for inventory_items. Error: {e}") from e
+
+  checkpoint.complete('done', write=write)
+  print(f" Successfully seeded {inserted} inventory items (server-side).")
@@ -1,398 +1,616 @@
 import json
+import threading
 import time
-from random import choice, randint
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from random import randint
+from typing import Any, Dict, Iterable, Sized
 
-from faker import Faker
-from orders.v1.order_line_items_pb2 import OrderLineItem
-from products.v1.product_pb2 import ProductOffer
-from psycopg2 import Error as Psycopg2Error
+import numpy as np
 from psycopg2.extensions import connection, cursor
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
+from general_utils.copy_writer import CopyWriter
+from general_utils.db import DatabasePool, PreparedStatement
+from general_utils.isolation import write_isolated
+from general_utils.pipeline import StatementPipeline
+from general_utils.sinks import FileSink
+from general_utils.value_pools import ValuePools
 from general_utils.general import get_time_miliseconds
 from models.app import SeedingError
 from models.config import Config
-from seeders.orders import create_successful_payment, get_products, get_user_ids
+from seeders.catalog import (
+    NO_PRICE,
+    SHIPPING_CENTS,
+    InMemoryProducts,
+    PricedLines,
+    ProductCatalog,
+    ProductSource,
+    ProductStream,
+    SpilledProducts,
+    price_order_batch,
+)
+from seeders.inventory_ledger import InventoryEntry, InventoryLedger
+from seeders.orders import count_customers, create_successful_payment, get_user_ids
+from seeders.registry import SeedRegistry
+from seeders.top_up import count_rows, with_existing
+
+rng = np.random.default_rng()
+
+
+def seed_rng(seed: int | None):
+  """Makes the quantities and discounts picked for orders reproducible, done when the stage starts"""
+  global rng
+  rng = np.random.default_rng(seed)
+
+
+# Column lists used by the final-state writer, parents first (see CopyWriter)
+ORDER_TABLE_COLUMNS: Dict[str, tuple[str, ...]] = {
+    'orders': (
+        'id', 'user_id', 'currency_code', 'subtotal_cents', 'shipping_cents', 'tax_cents',
+        'discount_cents', 'total_cents', 'payment_provider', 'payment_transaction_id',
+        'payment_status', 'payment_provider_response', 'payment_fee_cents',
+        'inventory_reservation_status', 'product_source', 'shipping_address', 'billing_address',
+        'metadata', 'status', 'created_at', 'updated_at', 'deleted_at'
+    ),
+    'order_idempotency_keys': (
+        'id', 'idempotency_key', 'user_id', 'order_id', 'status', 'created_at', 'updated_at',
+        'expires_at'
+    ),
+    'inventory_reservations': (
+        'id', 'reservation_token', 'order_id', 'status', 'expires_at', 'created_at', 'updated_at'
+    ),
+    'order_line_items': (
+        'id', 'order_id', 'product_id', 'variant_id', 'sku', 'title', 'attributes', 'quantity',
+        'unit_price_cents', 'list_price_cents', 'sale_price_cents', 'discount_cents', 'tax_cents',
+        'total_cents', 'applied_offer_ids', 'product_snapshot', 'status', 'shipping_cents',
+        'created_at', 'updated_at', 'estimated_delivery_date'
+    ),
+    'inventory_reservation_items': (
+        'id', 'reservation_id', 'inventory_item_id', 'quantity', 'created_at'
+    ),
+    'order_events': ('id', 'order_id', 'event_type', 'event_payload', 'created_at'),
+}
+
+
+def insert_stmt(table: str) -> PreparedStatement:
+  columns = ORDER_TABLE_COLUMNS[table]
+  return PreparedStatement(
+      f"seed_insert_{table}",
+      f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})")
+
+
+# Statements of the workflow replay, prepared once per connection
+INSERT_ORDER_STMT = insert_stmt('orders')
+INSERT_IDEMPOTENCY_KEY_STMT = insert_stmt('order_idempotency_keys')
+INSERT_INVENTORY_RESERVATION_STMT = insert_stmt('inventory_reservations')
+INSERT_ORDER_LINE_ITEM_STMT = insert_stmt('order_line_items')
+INSERT_RESERVATION_ITEM_STMT = insert_stmt('inventory_reservation_items')
+INSERT_ORDER_EVENT_STMT = insert_stmt('order_events')
+UPDATE_ORDER_PAYMENT_STMT = PreparedStatement(
+    'seed_update_order_payment',
+    'UPDATE orders SET payment_status = %s, status = %s, updated_at = %s WHERE id = %s')
+UPDATE_IDEMPOTENCY_KEY_STMT = PreparedStatement(
+    'seed_update_order_idempotency_key',
+    'UPDATE order_idempotency_keys SET order_id = %s, status = %s, updated_at = %s '
+    'WHERE idempotency_key = %s')
+
+
+def seed_orders(con: connection, cfg: Config, registry: SeedRegistry | None = None):
+  """
+    Seeds orders by creating all related records for each customer, with robust error handling.
 
-fake = Faker()
+    seeding.order_write_mode selects how an order reaches the database:
+      - workflow_replay: replays the checkout flow step by step (inserts followed by status updates)
+      - final_state: every row is written once, already in its final status, in batches
 
+    With seeding.workers > 1 the customers are split into partitions, each seeded on its own
+    pooled connection and transaction. Every partition owns a disjoint set of products (and
+    therefore inventory_items rows), so workers never contend on the same rows. The current
+    transaction on `con` is committed first so the workers can see the users and products.
 
-def seed_orders(con: connection, cfg: Config):
-  """
-    Seeds orders by creating all related records for each customer, with robust error handling.
+    Customers, products and inventory published to the registry in this run are used instead of
+    reading them back from the database.
+
+    Every partition keeps its own checkpoint (the number of its orders already written), so a
+    resumed run must use the same number of workers as the interrupted one.
     """
+  if cfg.seeding.seed is not None:
+    seed_rng(cfg.seeding.seed)
   with con.cursor() as cur:
     try:
-      user_ids = get_user_ids(cur, cfg)
-      products = get_products(cur)
-      if not user_ids or not products:
-        print(f"⚠️ Skipping seed_orders: Found {len(user_ids)} users and {len(products)} products.")
+      user_ids = get_user_ids(cur, cfg, registry)
+      customers = count_customers(cur, cfg, user_ids)
+      products = registry.products() if registry else None
+      inventory = registry.inventory() if registry else None
+      if isinstance(products, list) and isinstance(inventory, list):
+        source = InMemoryProducts(ProductCatalog.from_summaries(products),
+                                  InventoryLedger.from_records(inventory))
+      elif products is not None and inventory is not None:
+        # Spilled by the registry, read back a window at a time
+        source = SpilledProducts(products, inventory, cfg.seeding.catalog_window)
+      else:
+        source = ProductStream.count(cur, cfg.seeding.catalog_window)
+      if not customers or not source.total:
+        print(f"⚠️ Skipping seed_orders: Found {customers} users and {source.total} products.")
         return
+      # A top-up continues the product cycle after the orders already there
+      existing_orders = count_rows(cur, 'orders') if cfg.seeding.top_up else 0
     except Exception as e:
-      print(f"❌ FATAL ERROR: Could not fetch initial data (users/products). Error: {e}")
+      print(f"❌ FATAL ERROR: Could not fetch initial data (users/products/inventory). Error: {e}")
       return
 
-    product_idx = 0
-
-    for user_id in user_ids:
-      for _ in range(cfg.seeding.number_of_orders_per_customer):
-        order_id = str(ULID())
-        try:
-          # Logic to cycle through products
-          if (product_idx + 1) >= len(products):
-            product_idx = 0
-          else:
-            product_idx += 1
-
-          # Gather key data
-          now_ms = get_time_miliseconds()
-          offer = products[product_idx].offer
-          product_id = products[product_idx].id
-          product_title = products[product_idx].title
-
-          # --- Step 1: Insert Idempotency Key ---
-          idempotency_key = 'idem_' + str(ULID())
-          insert_idempotency_key(cur, user_id, 'IN_PROGRESS', idempotency_key)
-
-          # --- Step 2: Get Line Items
-          items = get_order_line_items(cur, offer, product_id, product_title, order_id, now_ms)
-          order_line_items: list[Dict[str, Any]] = items['items']
-          subtotal_cents = items['subtotal_cents']
-          total_discount_cents = items['total_discount_cents']
-          total_tax_cents = items['total_tax_cents']
-          total_shipping_cents = items['total_shipping_cents']
-          total_cents = subtotal_cents - total_discount_cents + total_tax_cents + total_shipping_cents
-
-          # --- Step 3: Insert Order ---
-          insert_order(cur, order_id, user_id, total_cents, subtotal_cents, total_shipping_cents,
-                       total_tax_cents, total_discount_cents, total_cents)
-
-          # --- Step 4: Insert Inventory Reservation ---
-          reservation_id = str(ULID())
-          reservation_token = f"res_{str(ULID())}"
-          insert_inventory_reservation(cur, reservation_id, reservation_token, order_id)
-
-          # --- Step 5: Insert Order Line Items ---
-          for order_line_item in order_line_items:
-            inventory_id = order_line_item['inventory_item_id']
-            item: OrderLineItem = order_line_item['order_line_item']
-            insert_order_line_item(cur, item.id, order_id, item.product_id, item.variant_id,
-                                   item.sku, item.title, item.quantity, item.unit_price_cents,
-                                   item.list_price_cents, item.sale_price_cents,
-                                   item.discount_cents, item.tax_cents, item.total_cents,
-                                   item.shipping_cents)
-            insert_inventory_reservation_item(cur, reservation_id, inventory_id, item.quantity)
-
-          # --- Step 6: Insert Order Events (CREATED) ---
-          event_payload = json.dumps({
-              'reservation_token': reservation_token,
-              'subtotal_cents': subtotal_cents,
-              'total_cents': total_cents,
-          })
-          insert_order_event(cur, order_id, 'CREATED', event_payload)
-
-          # --- Step 7: Update Order Status/Payment ---
-          update_order_payment_succeeded(cur, 'CAPTURED', 'CONFIRMED', order_id)
-
-          # --- Step 8: Update Idempotency Key Status ---
-          update_order_idempotency_key(cur, order_id, 'CONFIRMED', idempotency_key)
-
-          # --- Step 9: Insert Order Events (PAYMENT_CAPTURED) ---
-          event_payload = json.dumps({
-              'provider': 'stripe',
-          })
-          insert_order_event(cur, order_id, 'PAYMENT_CAPTURED', event_payload)
-        except Exception as e:
-          # Log the error and move to the next iteration
-          print(f"❌ ERROR processing Order ID {order_id} for User ID {user_id}. Details: {e}")
-          # If this is inside a larger transaction (which is typical for seeding),
-          # the transaction will eventually fail unless you explicitly handle savepoints/rollbacks.
-          continue
+    # Every concurrently running stage holds a pooled connection already
+    workers = min(cfg.seeding.workers, customers, source.total,
+                  DatabasePool.max_connections() - max(1, cfg.seeding.parallel_stages))
+    progress = OrderProgress(
+        max(0, customers * cfg.seeding.number_of_orders_per_customer - existing_orders))
 
+    if workers <= 1:
+      checkpoint = Checkpoint(con, 'orders', cfg)
+      if checkpoint.already_completed():
+        return
+      seed_orders_partition(cur, cfg, user_ids, source, progress, checkpoint, existing_orders)
+      progress.report()
+      return
 
-def insert_idempotency_key(
-    cur: cursor,
-    user_id: str,
-    status: str,
-    idempotency_key: str,
-):
-  try:
-    cur.execute(
-        """INSERT INTO order_idempotency_keys (
-                id, idempotency_key, user_id, order_id, status, created_at, updated_at, expires_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)""", [
-            str(ULID()), idempotency_key, user_id, None, status,
-            get_time_miliseconds(), None,
-            get_time_miliseconds() + (60 * 1000)
-        ])
-  except Psycopg2Error as e:
-    raise SeedingError(f"DB INSERT failed for order_idempotency_keys. Error: {e}") from e
-
-
-def update_order_idempotency_key(cur: cursor, order_id: str, status: str, idempotency_key: str):
-  stmt = """
-        UPDATE order_idempotency_keys SET order_id = %s, status = %s, updated_at = %s WHERE idempotency_key = %s
-    """
+  con.commit()
+  print(f"Seeding orders with {workers} partitions")
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    futures = []
+    for partition in range(workers):
+      futures.append(
+          executor.submit(run_orders_partition, partition, workers, cfg, user_ids, customers,
+                          source.partition(partition, workers), progress,
+                          existing_orders // workers))
+
+    failed_partitions = 0
+    for future in futures:
+      try:
+        future.result()
+      except Exception as e:
+        failed_partitions += 1
+        print(f"❌ ORDER PARTITION FAILED. Details: {e}")
+
+  progress.report()
+  if failed_partitions:
+    raise SeedingError(f"{failed_partitions} of {workers} order partitions failed")
+
+
+def run_orders_partition(partition: int, workers: int, cfg: Config, user_ids: Iterable[str],
+                         customers: int, products: ProductSource, progress: 'OrderProgress',
+                         first_product: int = 0):
+  """Seeds one partition on its own pooled connection and commits it independently"""
+  conn = DatabasePool.get_conn()
   try:
-    cur.execute(stmt, [order_id, status, get_time_miliseconds(), idempotency_key])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB UPDATE failed for order_idempotency_keys. Token: {idempotency_key}, Error: {e}") from e
+    conn.autocommit = False
+    checkpoint = Checkpoint(conn, f"orders.{partition + 1}of{workers}", cfg)
+    if checkpoint.already_completed():
+      return
+    with conn.cursor() as cur:
+      if isinstance(user_ids, list):
+        partition_users = user_ids[partition::workers]
+      elif isinstance(user_ids, Sized):
+        # Spilled by the registry, every partition reads the file
+        partition_users = islice(user_ids, partition, None, workers)
+      else:
+        # Every partition streams the customers on its own connection and keeps its share
+        partition_users = islice(get_user_ids(cur, cfg), partition, None, workers)
+      seed_orders_partition(cur, cfg, partition_users, products, progress, checkpoint,
+                            first_product)
+    conn.commit()
+    print(f"✅ Order partition {partition} committed "
+          f"({len(range(partition, customers, workers))} customers)")
+  except Exception as e:
+    conn.rollback()
+    raise SeedingError(f"Order partition {partition} rolled back. Error: {e}") from e
+  finally:
+    DatabasePool.release_conn(conn)
+
+
+def seed_orders_partition(cur: cursor, cfg: Config, user_ids: Iterable[str],
+                          products: ProductSource, progress: 'OrderProgress',
+                          checkpoint: Checkpoint, first_product: int = 0):
+  mode = cfg.seeding.order_write_mode
+  # A product may only appear once per priced batch, see price_order_batch
+  batch_size = max(1, min(cfg.seeding.batch_size, products.total))
+  writer = CopyWriter(ORDER_TABLE_COLUMNS, cfg.seeding.copy_max_rows, cfg.seeding.copy_max_bytes)
+  order_users = (user_id for user_id in user_ids
+                 for _ in range(cfg.seeding.number_of_orders_per_customer))
+  if cfg.seeding.top_up:
+    # Customers only get the orders they lack
+    counted = with_existing(cur, user_ids, 'orders', 'user_id', batch_size)
+    order_users = (user_id for user_id, existing in counted
+                   for _ in range(cfg.seeding.number_of_orders_per_customer - existing))
+  # Orders already committed by an interrupted run are skipped, products keep cycling from there
+  done = checkpoint.start()
+  order_users = islice(order_users, done, None)
+  product_idx = (first_product + done) % products.total
+  # Products (with their inventory) the orders are currently taken from, see ProductStream
+  window = None
+
+  # With commit_every every chunk is a transaction that may be restarted, so everything it wrote
+  # (replayed orders, COPY buffers, reservations) is held until the chunk committed
+  chunked = bool(checkpoint.commit_every)
+  # Orders not durable yet: replayed orders wait for the next write, final-state orders stay
+  # while their rows sit in the COPY buffers, so that failing orders can be isolated
+  held_orders: list[Dict[str, Any]] = []
+  # Exported orders go to the files at every write, nothing is buffered for COPY
+  exporting = FileSink.enabled()
+
+  def replay_orders(cur: cursor, orders: list[Dict[str, Any]]):
+    # Every step of every order is sent without waiting for the previous one
+    with StatementPipeline(cur, cfg.seeding.pipeline_statements) as pipeline:
+      for order in orders:
+        replay_order_workflow(pipeline, order)
+
+  def copy_orders(cur: cursor, orders: list[Dict[str, Any]]):
+    subset = CopyWriter(ORDER_TABLE_COLUMNS, cfg.seeding.copy_max_rows,
+                        cfg.seeding.copy_max_bytes)
+    for order in orders:
+      subset.add_rows(final_state_rows(order))
+    subset.write(cur)
+
+  def drop_rejected(accepted: list[Dict[str, Any]]):
+    """Gives the stock of rejected orders back, the next ledger write corrects the DB too"""
+    kept = {id(order) for order in accepted}
+    for order in held_orders:
+      if id(order) in kept:
+        continue
+      progress.add_failed()
+      for item in order['line_items']:
+        entry = ledger.get(item['product_id'], item['variant_id'])
+        if entry:
+          ledger.release(entry, item['quantity'])
+    held_orders[:] = accepted
+
+  def write_held(cur: cursor, with_copy: bool):
+    if exporting:
+      export_orders(held_orders)
+    elif mode != 'final_state':
+      drop_rejected(write_isolated(cur, held_orders, replay_orders, 'orders', describe_order))
+    elif with_copy:
+      accepted = write_isolated(cur, held_orders, copy_orders, 'orders', describe_order,
+                                write_all=writer.write)
+      if len(accepted) < len(held_orders):
+        # A restarted chunk must not COPY the rejected rows again
+        writer.reset()
+        for order in accepted:
+          writer.add_rows(final_state_rows(order))
+      drop_rejected(accepted)
+    ledger.write(cur)
+
+  def write_batch(cur: cursor):
+    write_held(cur, with_copy=chunked)
+
+  def release_held(with_copy: bool):
+    if mode != 'final_state' or with_copy or exporting:
+      held_orders.clear()
+    ledger.mark_written()
+    if with_copy:
+      writer.release()
+
+  while True:
+    # Cycle through products, starting with the second one like the per-order loop used to
+    first = (product_idx + 1) % products.total
+    if window is None or not window.covers(first):
+      if window is not None:
+        # The reservations of the products leaving memory are written before they are dropped
+        checkpoint.commit(done, write=lambda cur: write_held(cur, with_copy=True))
+        release_held(with_copy=True)
+      window = products.window(cur, first)
+      catalog, ledger = window.catalog, window.ledger
+      entries, available = catalog.bind_inventory(ledger)
+      missing = int((available < 0).sum())
+      if missing:
+        print(f"⚠️ {missing} variants have no inventory item, this should not happen")
+
+    # A batch never runs past the window
+    batch_users = list(islice(order_users, min(batch_size, window.end - first)))
+    if not batch_users:
+      break
+
+    product_indices = first + np.arange(len(batch_users))
+    product_idx = int(product_indices[-1])
+    lines = price_order_batch(catalog, available, product_indices - window.start, rng)
+
+    line_starts = np.searchsorted(lines.order, np.arange(len(batch_users) + 1))
+    for i, user_id in enumerate(batch_users):
+      order_id = str(ULID())
+      try:
+        line_items = order_line_items(catalog, entries, ledger, lines, line_starts[i],
+                                      line_starts[i + 1],
+                                      int(product_indices[i]) - window.start, order_id)
+        order = build_order(order_id, user_id, line_items)
+
+        if mode == 'final_state' and not exporting:
+          writer.add_rows(final_state_rows(order))
+        held_orders.append(order)
+      except Exception as e:
+        # Log the error and move to the next iteration
+        print(f"❌ ERROR processing Order ID {order_id} for User ID {user_id}. Details: {e}")
+        progress.add_failed()
+        continue
 
+    done += len(batch_users)
+    progress.add(len(batch_users))
 
-def insert_inventory_reservation(cur: cursor, id: str, token: str, order_id: str):
-  try:
-    cur.execute(
-        """INSERT INTO inventory_reservations (id, reservation_token, order_id, status, expires_at, created_at, updated_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)""", [
-            id, token, order_id, 'RESERVED',
-            get_time_miliseconds() + (60 * 1000),
-            get_time_miliseconds(), None
-        ])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB INSERT failed for inventory_reservations. Order ID: {order_id}, Error: {e}") from e
-
-
-def insert_order(cur: cursor, id: str, user_id: str, payment_amount: int, subtotal_cents: int,
-                 shipping_cents: int, tax_cents: int, discount_cents: int, total_cents: int):
-
-  currency = fake.currency_code()
-  try:
-    payment = create_successful_payment(payment_amount, currency)
-  except Exception as e:
-    raise SeedingError(f"Failed to create payment object for Order ID {id}. Error: {e}") from e
+    if not chunked and writer.should_flush():
+      write_held(cur, with_copy=True)
+      release_held(with_copy=True)
+    if checkpoint.advance(done, len(batch_users), write=write_batch):
+      release_held(with_copy=chunked)
+    elif chunked and writer.should_flush():
+      # The COPY buffers are full before commit_every orders, commit the chunk early
+      checkpoint.commit(done, write=write_batch)
+      release_held(with_copy=True)
 
-  try:
-    cur.execute(
-        """INSERT INTO orders (
-                id, user_id, currency_code, subtotal_cents, shipping_cents, tax_cents, discount_cents,
-                total_cents, payment_provider, payment_transaction_id, payment_status, 
-                payment_provider_response, payment_fee_cents, inventory_reservation_status, 
-                product_source, shipping_address, billing_address, metadata, status, created_at, 
-                updated_at, deleted_at
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-        [
-            id, user_id, currency, subtotal_cents, shipping_cents, tax_cents, discount_cents,
-            total_cents, payment['payment_provider'], payment['payment_transaction_id'],
-            payment['payment_status'], payment['payment_provider_response'],
-            payment['payment_fee_cents'], 'RESERVED', 'product-service-v1.0.0',
-            json.dumps({'address': fake.address()}),
-            json.dumps({'address': fake.address()}),
-            json.dumps({'source': 'seed_data'}), 'CREATED',
-            int(get_time_miliseconds()), None, None
-        ])
-  except Psycopg2Error as e:
-    raise SeedingError(f"DB INSERT failed for orders. Order ID: {id}, Error: {e}") from e
-
-
-def update_order_payment_succeeded(cur: cursor, payment_status: str, status: str, order_id: str):
-  stmt = 'UPDATE orders SET payment_status = %s, status = %s, updated_at = %s WHERE id = %s'
-  try:
-    cur.execute(stmt, [payment_status, status, get_time_miliseconds(), order_id])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB UPDATE failed for orders (payment status). Order ID: {order_id}, Error: {e}") from e
+  checkpoint.complete(done, write=lambda cur: write_held(cur, with_copy=True))
+  release_held(with_copy=True)
 
 
-def insert_order_line_item(cur: cursor, id: str, order_id: str, product_id: str, variant_id: str,
-                           sku: str, title: str, quantity: int, unit_price_cents: int,
-                           list_price_cents: int | None, sale_price_cents: int | None,
-                           discount_cents: int, tax_cents: int, total_cents: int,
-                           shipping_cents: int):
-  try:
-    cur.execute(
-        """INSERT INTO order_line_items (
-                id, order_id, product_id, variant_id, sku, title, attributes, quantity, unit_price_cents,
-                list_price_cents, sale_price_cents, discount_cents, tax_cents, total_cents, 
-                applied_offer_ids, product_snapshot, status, shipping_cents, created_at, updated_at, estimated_delivery_date
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
-        [
-            id, order_id, product_id, variant_id, sku, title,
-            json.dumps({}), quantity, unit_price_cents, list_price_cents, sale_price_cents,
-            discount_cents, tax_cents, total_cents, [], None, 'CREATED', shipping_cents,
-            get_time_miliseconds(), None,
-            int(time.time() * 1000) + randint(2 * 24 * 60 * 60 * 1000, 7 * 24 * 60 * 60 * 1000)
-        ])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB INSERT failed for order_line_items. Order ID: {order_id}, Variant: {variant_id}, Error: {e}"
-    ) from e
-
-
-def insert_order_event(cur: cursor, order_id: str, event_type: str, event_payload: str):
-  try:
-    cur.execute(
-        """INSERT INTO order_events (id, order_id, event_type, event_payload, created_at)
-            VALUES (%s, %s, %s, %s, %s)""",
-        [str(ULID()), order_id, event_type, event_payload,
-         get_time_miliseconds()])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB INSERT failed for order_events. Order ID: {order_id}, Type: {event_type}, Error: {e}"
-    ) from e
-
-
-def get_order_line_items(cur: cursor, offer: ProductOffer, product_id: str, product_title,
-                         order_id: str, now_ms: int) -> Dict[str, Any]:
-  items: list[Dict[str, Any]] = []
-  subtotal_cents = 0
-  total_discount_cents = 0
-  total_tax_cents = 0
-  total_shipping_cents = 0
+def export_orders(orders: list[Dict[str, Any]]):
+  """Final-state rows of the orders to the export files, parents first like the COPY writer"""
+  tables: Dict[str, list[tuple]] = {table: [] for table in ORDER_TABLE_COLUMNS}
+  for order in orders:
+    for table, rows in final_state_rows(order).items():
+      tables[table].extend(rows)
+  for table, rows in tables.items():
+    FileSink.write(table, ORDER_TABLE_COLUMNS[table], rows)
 
-  for (variant_id, variant) in offer.offer.items():
-    try:
-      # --- Key data conversion/parsing risk ---
-      price_cents_db = int(float(variant.price) * 100)
-      list_price_db = int(float(variant.list_price) * 100) if variant.list_price else None
-      sale_price_db = int(float(variant.sale_price) * 100) if variant.sale_price else None
-
-      inventory_item = get_inventory_item(cur, product_id, variant_id)
-      if inventory_item is None:
-        print("Inventory item is not exists, this should not happen")
-        continue
 
-      # Check inventory availability before calculating quantity
-      quantity_available = int(inventory_item.get('quantity_available', 0))
-      quantity = int(quantity_available * 0.20)
-      if quantity > 6:
-        quantity = fake.random_int(min=1, max=5)
+def describe_order(order: Dict[str, Any]) -> Dict[str, Any]:
+  return {
+      'order_id': order['id'],
+      'user_id': order['user_id'],
+      'line_items': len(order['line_items']),
+  }
 
-      if quantity_available < quantity or quantity == 0:
-        continue
 
-      update_inventory_item(cur, inventory_item['id'], quantity)
-      unit_price = sale_price_db if sale_price_db else price_cents_db
-      line_subtotal = unit_price * quantity
-      discount_cents = int(line_subtotal * 0.05) if choice([True, False]) else 0
-      tax_cents = 0
-      shipping_cents = 223
-      line_total = line_subtotal - discount_cents + tax_cents + shipping_cents
-
-      subtotal_cents += line_subtotal
-      total_discount_cents += discount_cents
-      total_tax_cents += tax_cents
-      total_shipping_cents += shipping_cents
-
-      item: Dict[str, Any] = {
-          "inventory_item_id":
-          inventory_item['id'],
-          "order_line_item":
-          OrderLineItem(id=str(ULID()),
-                        product_id=product_id,
-                        variant_id=variant_id,
-                        order_id=order_id,
-                        sku=variant.sku,
-                        title=product_title,
-                        status='CREATED',
-                        attributes={
-                            'source': 'seed',
-                            'auto_generated': "true"
-                        },
-                        quantity=quantity,
-                        unit_price_cents=price_cents_db,
-                        list_price_cents=list_price_db,
-                        sale_price_cents=sale_price_db,
-                        discount_cents=discount_cents,
-                        tax_cents=tax_cents,
-                        total_cents=line_total,
-                        applied_offer_ids=[],
-                        product_snapshot=None,
-                        shipping_cents=shipping_cents,
-                        created_at=now_ms)
-      }
-
-      items.append(item)
-    except ValueError as e:
-      # Catch errors when converting Protobuf string fields (price, etc.) to int/float
-      raise SeedingError(
-          f"DATA PARSING ERROR in get_order_line_items. Product ID: {product_id}, Variant: {variant_id}, Data: {variant}, Error: {e}"
-      ) from e
-    except SeedingError:
-      # Re-raise any specific errors from nested functions (like get_inventory_item)
-      raise
-    except Exception as e:
-      # Catch all other unexpected errors
-      raise SeedingError(
-          f"UNEXPECTED ERROR in get_order_line_items. Product ID: {product_id}, Variant: {variant_id}, Error: {e}"
-      ) from e
+class OrderProgress:
+  """Order counters shared by all partitions"""
+
+  def __init__(self, planned: int):
+    self._lock = threading.Lock()
+    self.planned = planned
+    self.written = 0
+    self.failed = 0
+
+  def add(self, orders: int):
+    with self._lock:
+      self.written += orders
+      written = self.written
+    if orders:
+      print(f"  - Orders processed: {written}/{self.planned}")
+
+  def add_failed(self):
+    with self._lock:
+      self.failed += 1
+
+  def report(self):
+    print(f"✅ Processed {self.written} of {self.planned} planned orders ({self.failed} failed)")
+
+
+def order_line_items(catalog: ProductCatalog, entries: list[InventoryEntry | None],
+                     ledger: InventoryLedger, lines: PricedLines, start: int, end: int,
+                     product: int, order_id: str) -> list[Dict[str, Any]]:
+  """Turns the priced lines [start, end) of one order into line item dicts and reserves them"""
+  now_ms = get_time_miliseconds()
+  items: list[Dict[str, Any]] = []
+
+  for variant, quantity, discount_cents, total_cents, subtotal_cents in zip(
+      lines.variant[start:end].tolist(), lines.quantity[start:end].tolist(),
+      lines.discount_cents[start:end].tolist(), lines.total_cents[start:end].tolist(),
+      lines.subtotal_cents[start:end].tolist()):
+    inventory_item = entries[variant]
+    if inventory_item is None or not ledger.reserve(inventory_item, quantity):
+      continue
+
+    list_price = int(catalog.list_price_cents[variant])
+    sale_price = int(catalog.sale_price_cents[variant])
+    items.append({
+        'id': str(ULID()),
+        'inventory_item_id': inventory_item.id,
+        'product_id': catalog.product_ids[product],
+        'variant_id': catalog.variant_ids[variant],
+        'sku': catalog.skus[variant],
+        'title': catalog.product_titles[product],
+        'quantity': quantity,
+        'unit_price_cents': int(catalog.price_cents[variant]),
+        'list_price_cents': list_price if list_price != NO_PRICE else None,
+        'sale_price_cents': sale_price if sale_price != NO_PRICE else None,
+        'subtotal_cents': subtotal_cents,
+        'discount_cents': discount_cents,
+        'tax_cents': 0,
+        'shipping_cents': SHIPPING_CENTS,
+        'total_cents': total_cents,
+        'created_at': now_ms,
+    })
+
+  return items
+
+
+def build_order(order_id: str, user_id: str, line_items: list[Dict[str, Any]]) -> Dict[str, Any]:
+  """Computes everything an order needs (totals, payment, addresses) without touching the DB"""
+  now_ms = get_time_miliseconds()
+  subtotal_cents = sum(item['subtotal_cents'] for item in line_items)
+  total_discount_cents = sum(item['discount_cents'] for item in line_items)
+  total_tax_cents = sum(item['tax_cents'] for item in line_items)
+  total_shipping_cents = sum(item['shipping_cents'] for item in line_items)
+  total_cents = subtotal_cents - total_discount_cents + total_tax_cents + total_shipping_cents
+
+  currency = ValuePools.draw('currency_code')
+  try:
+    payment = create_successful_payment(total_cents, currency)
+  except Exception as e:
+    raise SeedingError(f"Failed to create payment object for Order ID {order_id}. Error: {e}") from e
 
   return {
-      'items': items,
+      'id': order_id,
+      'user_id': user_id,
+      'idempotency_key_id': str(ULID()),
+      'idempotency_key': 'idem_' + str(ULID()),
+      'reservation_id': str(ULID()),
+      'reservation_token': f"res_{str(ULID())}",
+      'line_items': line_items,
       'subtotal_cents': subtotal_cents,
       'total_discount_cents': total_discount_cents,
       'total_tax_cents': total_tax_cents,
-      'total_shipping_cents': total_shipping_cents
+      'total_shipping_cents': total_shipping_cents,
+      'total_cents': total_cents,
+      'currency': currency,
+      'payment': payment,
+      'shipping_address': json.dumps({'address': ValuePools.draw('address')}),
+      'billing_address': json.dumps({'address': ValuePools.draw('address')}),
+      'created_at': now_ms,
   }
 
 
-def get_inventory_item(cur: cursor, product_id: str, variant_id: str):
-  try:
-    cur.execute(
-        """SELECT id, product_id, variant_id, sku, quantity_available, 
-                    quantity_reserved, quantity_total, location_id, metadata, 
-                    created_at, updated_at 
-               FROM inventory_items 
-               WHERE product_id = %s AND variant_id = %s""", [product_id, variant_id])
-
-    row = cur.fetchone()
-    if not row:
-      return None
-
-    return {
-        'id': row[0],
-        'product_id': row[1],
-        'variant_id': row[2],
-        'sku': row[3],
-        'quantity_available': row[4],
-        'quantity_reserved': row[5],
-        'quantity_total': row[6],
-        'location_id': row[7],
-        'metadata': row[8],
-        'created_at': row[9],
-        'updated_at': row[10]
-    }
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB SELECT failed for inventory_items. Product ID: {product_id}, Variant: {variant_id}, Error: {e}"
-    ) from e
-
-
-def update_inventory_item(cur: cursor, id: str, quantity: int):
-  stmt = """
-    UPDATE inventory_items 
-			SET 
-					quantity_reserved = quantity_reserved + %s,
-					quantity_available = quantity_available - %s,
-					updated_at = %s
-			WHERE id = %s AND quantity_available >= %s
-  """
-  try:
-    cur.execute(stmt, [quantity, quantity, get_time_miliseconds(), id, quantity])
-  except Psycopg2Error as e:
-    raise SeedingError(f"DB UPDATE failed for inventory quantity_item. Error: {e}") from e
+def replay_order_workflow(cur: StatementPipeline, order: Dict[str, Any]):
+  """Writes an order the way the checkout flow does: insert in initial status, then update"""
+  order_id = order['id']
+
+  # --- Step 1: Insert Idempotency Key ---
+  insert_idempotency_key(cur, order['idempotency_key_id'], order['user_id'], 'IN_PROGRESS',
+                         order['idempotency_key'])
+
+  # --- Step 2: Insert Order ---
+  insert_order(cur, order_row(order, 'CREATED', None))
+
+  # --- Step 3: Insert Inventory Reservation ---
+  insert_inventory_reservation(cur, order['reservation_id'], order['reservation_token'], order_id)
+
+  # --- Step 4: Insert Order Line Items ---
+  for item in order['line_items']:
+    insert_order_line_item(cur, order_line_item_row(order_id, item))
+    insert_inventory_reservation_item(cur, order['reservation_id'], item['inventory_item_id'],
+                                      item['quantity'])
+
+  # --- Step 5: Insert Order Events (CREATED) ---
+  insert_order_event(cur, order_id, 'CREATED', order_created_event_payload(order))
+
+  # --- Step 6: Update Order Status/Payment ---
+  update_order_payment_succeeded(cur, 'CAPTURED', 'CONFIRMED', order_id)
+
+  # --- Step 7: Update Idempotency Key Status ---
+  update_order_idempotency_key(cur, order_id, 'CONFIRMED', order['idempotency_key'])
+
+  # --- Step 8: Insert Order Events (PAYMENT_CAPTURED) ---
+  insert_order_event(cur, order_id, 'PAYMENT_CAPTURED', json.dumps({'provider': 'stripe'}))
+
+
+def final_state_rows(order: Dict[str, Any]) -> Dict[str, list[tuple]]:
+  """Rows of every order table as they look once the checkout flow has completed"""
+  order_id = order['id']
+  created_at = order['created_at']
+  updated_at = get_time_miliseconds()
+  expires_at = created_at + (60 * 1000)
+
+  return {
+      'orders': [order_row(order, 'CONFIRMED', updated_at)],
+      'order_idempotency_keys': [(order['idempotency_key_id'], order['idempotency_key'],
+                                  order['user_id'], order_id, 'CONFIRMED', created_at, updated_at,
+                                  expires_at)],
+      'inventory_reservations': [(order['reservation_id'], order['reservation_token'], order_id,
+                                  'RESERVED', expires_at, created_at, None)],
+      'order_line_items': [order_line_item_row(order_id, item) for item in order['line_items']],
+      'inventory_reservation_items': [(str(ULID()), order['reservation_id'],
+                                       item['inventory_item_id'], item['quantity'], created_at)
+                                      for item in order['line_items']],
+      'order_events': [
+          (str(ULID()), order_id, 'CREATED', order_created_event_payload(order), created_at),
+          (str(ULID()), order_id, 'PAYMENT_CAPTURED', json.dumps({'provider': 'stripe'}),
+           updated_at),
+      ],
+  }
+
+
+def order_created_event_payload(order: Dict[str, Any]) -> str:
+  return json.dumps({
+      'reservation_token': order['reservation_token'],
+      'subtotal_cents': order['subtotal_cents'],
+      'total_cents': order['total_cents'],
+  })
+
+
+def insert_idempotency_key(
+    cur: StatementPipeline,
+    id: str,
+    user_id: str,
+    status: str,
+    idempotency_key: str,
+):
+  cur.execute(INSERT_IDEMPOTENCY_KEY_STMT, [
+      id, idempotency_key, user_id, None, status,
+      get_time_miliseconds(), None,
+      get_time_miliseconds() + (60 * 1000)
+  ])
+
+
+def update_order_idempotency_key(cur: StatementPipeline, order_id: str, status: str,
+                                 idempotency_key: str):
+  cur.execute(UPDATE_IDEMPOTENCY_KEY_STMT,
+              [order_id, status, get_time_miliseconds(), idempotency_key])
+
+
+def insert_inventory_reservation(cur: StatementPipeline, id: str, token: str, order_id: str):
+  cur.execute(INSERT_INVENTORY_RESERVATION_STMT, [
+      id, token, order_id, 'RESERVED',
+      get_time_miliseconds() + (60 * 1000),
+      get_time_miliseconds(), None
+  ])
+
+
+def order_row(order: Dict[str, Any], status: str, updated_at: int | None) -> tuple:
+  payment = order['payment']
+  return (
+      order['id'], order['user_id'], order['currency'], order['subtotal_cents'],
+      order['total_shipping_cents'], order['total_tax_cents'], order['total_discount_cents'],
+      order['total_cents'], payment['payment_provider'], payment['payment_transaction_id'],
+      payment['payment_status'], payment['payment_provider_response'],
+      payment['payment_fee_cents'], 'RESERVED', 'product-service-v1.0.0',
+      order['shipping_address'], order['billing_address'],
+      json.dumps({'source': 'seed_data'}), status, order['created_at'], updated_at, None
+  )
+
+
+def insert_order(cur: StatementPipeline, row: tuple):
+  cur.execute(INSERT_ORDER_STMT, row)
+
+
+def update_order_payment_succeeded(cur: StatementPipeline, payment_status: str, status: str,
+                                   order_id: str):
+  cur.execute(UPDATE_ORDER_PAYMENT_STMT,
+              [payment_status, status, get_time_miliseconds(), order_id])
+
+
+def order_line_item_row(order_id: str, item: Dict[str, Any]) -> tuple:
+  return (
+      item['id'], order_id, item['product_id'], item['variant_id'], item['sku'], item['title'],
+      json.dumps({}), item['quantity'], item['unit_price_cents'], item['list_price_cents'],
+      item['sale_price_cents'], item['discount_cents'], item['tax_cents'], item['total_cents'], [],
+      None, 'CREATED', item['shipping_cents'], item['created_at'], None,
+      int(time.time() * 1000) + randint(2 * 24 * 60 * 60 * 1000, 7 * 24 * 60 * 60 * 1000)
+  )
+
+
+def insert_order_line_item(cur: StatementPipeline, row: tuple):
+  cur.execute(INSERT_ORDER_LINE_ITEM_STMT, row)
+
+
+def insert_order_event(cur: StatementPipeline, order_id: str, event_type: str, event_payload: str):
+  cur.execute(INSERT_ORDER_EVENT_STMT,
+              [str(ULID()), order_id, event_type, event_payload, get_time_miliseconds()])
 
 
 def insert_inventory_reservation_item(
-    cur: cursor,
+    cur: StatementPipeline,
     reservation_id: str,
     inventory_item_id: str,
     quantity: int,
 ):
-  stmt = """
-    INSERT INTO inventory_reservation_items (
-			id, 
-			reservation_id, 
-			inventory_item_id, 
-			quantity, 
-			created_at
-		) VALUES (%s, %s, %s, %s, %s)
-  """
-  try:
-    cur.execute(stmt,
-                [str(ULID()), reservation_id, inventory_item_id, quantity,
-                 get_time_miliseconds()])
-  except Psycopg2Error as e:
-    raise SeedingError(f"DB INSERT failed for inventory_reservation_items. Error: {e}") from e
+  cur.execute(INSERT_RESERVATION_ITEM_STMT,
+              [str(ULID()), reservation_id, inventory_item_id, quantity,
+               get_time_miliseconds()])
@@ -1,96 +1,246 @@
-from faker import Faker
+from itertools import islice
+
 from psycopg2 import Error as Psycopg2Error
 from psycopg2.extensions import connection, cursor
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
+from general_utils.db import PreparedStatement, sql_now_ms, sql_ulid
+from general_utils.fake import SharedFaker
 from general_utils.general import time_in_milies
+from general_utils.isolation import write_isolated
+from general_utils.pipeline import StatementPipeline
+from general_utils.sinks import FileSink
+from general_utils.value_pools import ValuePools
 from models.app import SeedingError
 from models.config import Config
 from seeders.orders import get_user_ids
+from seeders.registry import SeedRegistry
+from seeders.top_up import with_existing
+
+
+PAYMENT_TYPES = ['card', 'paypal', 'apple', 'google']
+CARDS_DATA = [
+    {
+        'last_four': '4242',
+        'expiry': '12/25'
+    },
+    {
+        'last_four': '5555',
+        'expiry': '08/26'
+    },
+    {
+        'last_four': '3782',
+        'expiry': '11/24'
+    },
+    {
+        'last_four': '6011',
+        'expiry': '03/27'
+    },
+]
+
+PAYMENT_METHOD_COLUMNS = ('id', 'user_id', 'type', 'name', 'last_four', 'expiry_date', 'token',
+                          'is_default', 'created_at')
+
+INSERT_PAYMENT_METHOD_STMT = PreparedStatement(
+    'seed_insert_payment_method', """
+    INSERT INTO payment_methods (
+      id, user_id, type, name, last_four, expiry_date, token, is_default, created_at
+    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+  """)
+
+# Number of distinct first names handed to the server-side generator for PayPal method names
+PAYPAL_NAMES_POOL_SIZE = 200
+
+WITHOUT_PAYMENT_METHODS = """
+  WHERE NOT EXISTS (SELECT 1 FROM payment_methods AS m WHERE m.user_id = u.id)
+"""
 
-fake = Faker()
 
+def run_payment_methods(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
+  if cfg.seeding.server_side_generation:
+    seed_payment_methods_server_side(conn, cfg)
+  else:
+    seed_payment_methods(conn, cfg, registry)
 
-def seed_payment_methods(conn: connection, cfg: Config):
+
+def seed_payment_methods(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
   """
   Seeds payment methods for users by creating card payment records.
   Each customer gets between 1-3 payment methods with one marked as default.
+  The checkpoint position is the number of customers already processed.
   """
-  with conn.cursor() as cur:
+  checkpoint = Checkpoint(conn, 'payment_methods', cfg)
+  if checkpoint.already_completed():
+    return
+
+  # Customers are streamed from the database a page at a time when the registry lacks them
+  read_cur = conn.cursor()
+  user_ids = get_user_ids(read_cur, cfg, registry)
+
+  # Payment methods generated since the last write, grouped by customer
+  held: list[list[tuple]] = []
+
+  def insert(cur: cursor, customers: list[list[tuple]]):
+    with StatementPipeline(cur, cfg.seeding.pipeline_statements) as pipeline:
+      for user_methods in customers:
+        for method in user_methods:
+          insert_payment_method(pipeline, *method)
+
+  def write(cur: cursor):
+    if FileSink.enabled():
+      created_at = int(time_in_milies())
+      FileSink.write('payment_methods', PAYMENT_METHOD_COLUMNS,
+                     [method + (created_at,) for user_methods in held for method in user_methods])
+      return
+    # A customer is accepted or rejected with all its payment methods
+    held[:] = write_isolated(cur, held, insert, 'payment_methods',
+                             lambda user_methods: {
+                                 'user_id': user_methods[0][1],
+                                 'methods': len(user_methods)
+                             })
+
+  start = checkpoint.start()
+  customers = islice(user_ids, start, None)
+  if cfg.seeding.top_up:
+    # Only the customers without payment methods get some
+    counted = with_existing(read_cur, customers, 'payment_methods', 'user_id',
+                            cfg.seeding.batch_size)
+    customers = (user_id for user_id, existing in counted if not existing)
+  fake = SharedFaker.get()
+  customer_number = start
+  for customer_number, user_id in enumerate(customers, start=start + 1):
+    user_methods = []
     try:
-      user_ids = get_user_ids(cur, cfg)
-      if not user_ids:
-        print(f"⚠️ Skipping seed_payment_methods: No users found.")
-        return
+      # Generate 1-3 payment methods per user
+      num_methods = fake.random_int(min=1, max=3)
+      is_first = True
+
+      for i in range(num_methods):
+        payment_type = PAYMENT_TYPES[i % len(PAYMENT_TYPES)]
+
+        if payment_type == 'card':
+          card_data = CARDS_DATA[i % len(CARDS_DATA)]
+          name = f"Card ending in {card_data['last_four']}"
+          last_four = card_data['last_four']
+          expiry_date = card_data['expiry']
+          # Mock token (in production, this would be a tokenized/encrypted value from payment processor)
+          token = f"tok_card_{fake.random_int(100000, 999999)}"
+        elif payment_type == 'paypal':
+          name = f"{ValuePools.draw('first_name')}'s PayPal"
+          last_four = None
+          expiry_date = None
+          token = f"tok_paypal_{fake.random_int(100000, 999999)}"
+        elif payment_type == 'apple':
+          name = "Apple Pay"
+          last_four = None
+          expiry_date = None
+          token = f"tok_apple_{fake.random_int(100000, 999999)}"
+        else:  # google
+          name = "Google Pay"
+          last_four = None
+          expiry_date = None
+          token = f"tok_google_{fake.random_int(100000, 999999)}"
+
+        user_methods.append((str(ULID()), user_id, payment_type, name, last_four, expiry_date,
+                             token, is_first))
+        is_first = False
+
+      held.append(user_methods)
     except Exception as e:
-      print(f"❌ FATAL ERROR: Could not fetch users. Error: {e}")
-      return
+      print(f"❌ ERROR processing payment methods for User ID {user_id}. Details: {e}")
+      continue
+
+    if checkpoint.advance(customer_number, rows=len(user_methods), write=write):
+      held.clear()
+
+  read_cur.close()
+  if not customer_number:
+    print(f"⚠️ Skipping seed_payment_methods: No users need payment methods.")
+    return
+  checkpoint.complete(customer_number, write=write)
+  print(f"✅ Successfully seeded payment methods for {customer_number} users")
+
+
+def seed_payment_methods_server_side(conn: connection, cfg: Config):
+  """
+  Set-based variant of seed_payment_methods: the 1-3 methods per customer are expanded with
+  generate_series and inserted with a single INSERT ... SELECT.
+  """
+  checkpoint = Checkpoint(conn, 'payment_methods', cfg)
+  if checkpoint.already_completed():
+    return
+  # A top-up only gives payment methods to the customers that have none
+  condition = WITHOUT_PAYMENT_METHODS if cfg.seeding.top_up else ''
+
+  stmt = f"""
+    WITH customers AS (
+      SELECT id, 1 + floor(random() * 3)::INT8 AS methods
+        FROM (SELECT id
+                FROM users
+               WHERE user_type = %(user_type)s AND roles && %(roles)s
+               ORDER BY created_at, id
+               LIMIT %(limit)s) AS u
+      {condition}
+    ), methods AS (
+      SELECT c.id AS user_id,
+             g.i AS idx,
+             (%(payment_types)s::TEXT[])[(g.i %% %(payment_types_len)s) + 1] AS type,
+             (%(last_fours)s::TEXT[])[(g.i %% %(cards_len)s) + 1] AS last_four,
+             (%(expiries)s::TEXT[])[(g.i %% %(cards_len)s) + 1] AS expiry_date,
+             (%(paypal_names)s::TEXT[])[1 + floor(random() * %(paypal_names_len)s)::INT8] AS first_name
+        FROM customers AS c, generate_series(0, c.methods - 1) AS g(i)
+    )
+    INSERT INTO payment_methods (
+      id, user_id, type, name, last_four, expiry_date, token, is_default, created_at
+    )
+    SELECT {sql_ulid('m.user_id')},
+           m.user_id,
+           m.type,
+           CASE m.type
+             WHEN 'card' THEN 'Card ending in ' || m.last_four
+             WHEN 'paypal' THEN m.first_name || '''s PayPal'
+             WHEN 'apple' THEN 'Apple Pay'
+             ELSE 'Google Pay'
+           END,
+           CASE WHEN m.type = 'card' THEN m.last_four END,
+           CASE WHEN m.type = 'card' THEN m.expiry_date END,
+           'tok_' || m.type || '_' || (100000 + floor(random() * 900000)::INT8)::TEXT,
+           m.idx = 0,
+           {sql_now_ms()}
+      FROM methods AS m
+  """
+
+  paypal_names = ValuePools.sample('first_name', PAYPAL_NAMES_POOL_SIZE)
+  args = {
+      'user_type': 'customer',
+      'roles': ['customer'],
+      'limit': cfg.seeding.number_of_customers_have_orders,
+      'payment_types': PAYMENT_TYPES,
+      'payment_types_len': len(PAYMENT_TYPES),
+      'last_fours': [card['last_four'] for card in CARDS_DATA],
+      'expiries': [card['expiry'] for card in CARDS_DATA],
+      'cards_len': len(CARDS_DATA),
+      'paypal_names': paypal_names,
+      'paypal_names_len': len(paypal_names),
+  }
+
+  inserted = 0
+
+  def write(cur: cursor):
+    nonlocal inserted
+    try:
+      cur.execute(stmt, args)
+      inserted = cur.rowcount
+    except Psycopg2Error as e:
+      raise SeedingError(f"DB INSERT ... SELECT failed for payment_methods. Error: {e}") from e
 
-    payment_types = ['card', 'paypal', 'apple', 'google']
-    cards_data = [
-        {
-            'last_four': '4242',
-            'expiry': '12/25'
-        },
-        {
-            'last_four': '5555',
-            'expiry': '08/26'
-        },
-        {
-            'last_four': '3782',
-            'expiry': '11/24'
-        },
-        {
-            'last_four': '6011',
-            'expiry': '03/27'
-        },
-    ]
-
-    for user_id in user_ids:
-      try:
-        # Generate 1-3 payment methods per user
-        num_methods = fake.random_int(min=1, max=3)
-        is_first = True
-
-        for i in range(num_methods):
-          payment_type = payment_types[i % len(payment_types)]
-
-          if payment_type == 'card':
-            card_data = cards_data[i % len(cards_data)]
-            name = f"Card ending in {card_data['last_four']}"
-            last_four = card_data['last_four']
-            expiry_date = card_data['expiry']
-            # Mock token (in production, this would be a tokenized/encrypted value from payment processor)
-            token = f"tok_card_{fake.random_int(100000, 999999)}"
-          elif payment_type == 'paypal':
-            name = f"{fake.first_name()}'s PayPal"
-            last_four = None
-            expiry_date = None
-            token = f"tok_paypal_{fake.random_int(100000, 999999)}"
-          elif payment_type == 'apple':
-            name = "Apple Pay"
-            last_four = None
-            expiry_date = None
-            token = f"tok_apple_{fake.random_int(100000, 999999)}"
-          else:  # google
-            name = "Google Pay"
-            last_four = None
-            expiry_date = None
-            token = f"tok_google_{fake.random_int(100000, 999999)}"
-
-          insert_payment_method(cur, str(ULID()), user_id, payment_type, name, last_four,
-                                expiry_date, token, is_first)
-          is_first = False
-
-      except Exception as e:
-        print(f"❌ ERROR processing payment methods for User ID {user_id}. Details: {e}")
-        continue
-
-    print(f"✅ Successfully seeded payment methods for {len(user_ids)} users")
+  checkpoint.complete('done', write=write)
+  print(f"✅ Successfully seeded {inserted} payment methods (server-side)")
 
 
 def insert_payment_method(
-    cur: cursor,
+    cur: StatementPipeline,
     id: str,
     user_id: str,
     type_: str,
@@ -100,17 +250,7 @@ def insert_payment_method(
     token: str,
     is_default: bool,
 ):
-  stmt = """
-    INSERT INTO payment_methods (
-      id, user_id, type, name, last_four, expiry_date, token, is_default, created_at
-    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-  """
-  try:
-    cur.execute(
-        stmt,
-        [id, user_id, type_, name, last_four, expiry_date, token, is_default,
-         time_in_milies()])
-  except Psycopg2Error as e:
-    raise SeedingError(
-        f"DB INSERT failed for payment_methods. User ID: {user_id}, Type: {type_}, Error: {e}"
-    ) from e
+  cur.execute(
+      INSERT_PAYMENT_METHOD_STMT,
+      [id, user_id, type_, name, last_four, expiry_date, token, is_default,
+       time_in_milies()])
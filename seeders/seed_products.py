@@ -4,33 +4,84 @@ import random
 from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Tuple
 
-from faker import Faker
 from minio import Minio
 from psycopg2 import Error as Psycopg2Error
 from psycopg2.extras import Json, RealDictCursor
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
+from general_utils.db import PreparedStatement
+from general_utils.fake import SharedFaker
 from general_utils.general import get_time_miliseconds
+from general_utils.isolation import write_isolated
+from general_utils.pipeline import StatementPipeline
+from general_utils.sinks import FileSink
+from general_utils.value_pools import ValuePools
 from models.app import SeedingError
 from models.config import Config
+from seeders.orders import stream_user_ids
 from seeders.product_title import generate_product_title
 from seeders.products import (
     generate_bullet_points_list,
     generate_fashion_product_id_info,
 )
-
-fake = Faker()
+from seeders.registry import SeedRegistry
+from seeders.top_up import with_existing
+
+PRODUCT_COLUMNS = ('id', 'user_id', 'title', 'category', 'subcategory', 'has_variations',
+                   'brand_name', 'has_brand_name', 'product_id', 'has_product_id',
+                   'product_id_type', 'description', 'bullet_points', 'currency_code',
+                   'fulfillment_type', 'processing_time', 'details', 'media', 'offer', 'safety',
+                   'tags', 'metadata', 'ar_enabled', 'slug', 'status', 'version', 'schema_version',
+                   'created_at', 'published_at', 'updated_at')
+
+INSERT_PRODUCT_STMT = PreparedStatement(
+    'seed_insert_product', """
+  INSERT INTO products (
+      id, user_id, title, category, subcategory, has_variations, brand_name,
+      has_brand_name, product_id, has_product_id, product_id_type, description,
+      bullet_points, currency_code, fulfillment_type, processing_time, details,
+      media, offer, safety, tags, metadata, ar_enabled, slug, status, version,
+      schema_version, created_at, published_at, updated_at
+  )
+  VALUES (
+      %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
+  )
+""")
+
+# Lengths of the free text of attributes without a Str rule (like Faker's text(100)) and of the
+# descriptions (like Faker's paragraph())
+DEFAULT_TEXT_MIN_CHARS, DEFAULT_TEXT_MAX_CHARS = 25, 100
+DESCRIPTION_MIN_CHARS, DESCRIPTION_MAX_CHARS = 40, 180
 
 FULFILLMENT_TYPE = ['megacommerce', 'supplier']
 STATUS = ['pending', 'published']
 OFFERING_CONDITION = ['new', 'used']
+FASHION_BRANDS = [
+    "Zara", "H&M", "Gucci", "Louis Vuitton", "Chanel", "Nike", "Adidas", "Prada", "Hermès",
+    "Dior", "Burberry", "Versace", "Armani", "Calvin Klein", "Ralph Lauren", "Tommy Hilfiger",
+    "Balenciaga", "Fendi", "Dolce & Gabbana", "Yves Saint Laurent"
+]
+
+
+def placeholder_media(attachment_id: str) -> Dict[str, Any]:
+  return {
+      "format": "JPEG",
+      "url": f"https://placeholder.com/{attachment_id}.jpg",
+      "size": random.randint(50000, 2000000)
+  }
 
 
 class ProductGenerator:
-  def __init__(self, cfg: Config):
+  def __init__(self, cfg: Config, connect_storage: bool = True):
+    """connect_storage=False skips MinIO (offline benchmarks), media then falls back to placeholders"""
     self.cfg = cfg
-    self.used_variant_names = set()
     self.executor = ThreadPoolExecutor(max_workers=self.cfg.minio.max_upload_workers)  # Initialize thread pool
+    self.minio_bucket: str = cfg.minio.amazon_s3_bucket
+    self.minio_client: Minio | None = None
+    if not connect_storage:
+      return
+
     try:
       # First, let's test the connection to MinIO
       print(f"Connecting to MinIO at: {cfg.minio.amazon_s3_endpoint}")
@@ -40,7 +91,6 @@ class ProductGenerator:
                                 access_key=cfg.minio.amazon_s3_access_key_id,
                                 secret_key=cfg.minio.amazon_s3_secret_access_key,
                                 secure=False)
-      self.minio_bucket: str = cfg.minio.amazon_s3_bucket
       self.ensure_bucket()
     except Exception as e:
       raise SeedingError(f"Failed to initialize MinIO client or ensure bucket: {e}") from e
@@ -69,11 +119,7 @@ class ProductGenerator:
     except Exception as e:
       # Log failure but continue with placeholder
       print(f"⚠️ Warning: MinIO upload failed for {image_path}. Using placeholder. Error: {e}")
-      return {
-          "format": "JPEG",
-          "url": f"https://placeholder.com/{attachment_id}.jpg",
-          "size": random.randint(50000, 2000000)
-      }
+      return placeholder_media(attachment_id)
 
 
 
@@ -175,11 +221,7 @@ class ProductGenerator:
               elif rule['type'] == 1:  # STRING_RULE_TYPE_MAX
                 max_len = int(rule['value'])
 
-            text = fake.text(max_nb_chars=max_len)
-            while len(text) < min_len:
-              text += " " + fake.word()
-            text = text[:max_len].strip()
-            return self._serialize_string_value(text)
+            return self._serialize_string_value(ValuePools.text(min_len, max_len))
 
           elif 'Numeric' in rule_data:
             # ... existing numeric rule logic ...
@@ -207,10 +249,11 @@ class ProductGenerator:
             return self._serialize_string_value(f"{value:.2f}")
 
         # Default string generation
-        return self._serialize_string_value(fake.text(max_nb_chars=100).strip())
+        return self._serialize_string_value(
+            ValuePools.text(DEFAULT_TEXT_MIN_CHARS, DEFAULT_TEXT_MAX_CHARS))
 
       # Fallback
-      return self._serialize_string_value(fake.word())
+      return self._serialize_string_value(SharedFaker.get().word())
     except Exception as e:
       raise SeedingError(
           f"Failed to generate attribute value for config {attribute_config.get('id', 'N/A')}. Error: {e}"
@@ -243,9 +286,11 @@ class ProductGenerator:
     except Exception as e:
       raise SeedingError(f"Failed to serialize int value '{value}': {e}") from e
 
-  # ... (generate_variant_name remains unchanged as it contains no external calls/complex parsing)
-  def generate_variant_name(self, subcategory_id: str, variant_data: Dict) -> str:
-    # ... (unchanged) ...
+  def generate_variant_name(self,
+                            subcategory_id: str,
+                            variant_data: Dict,
+                            used_names: set[str] | None = None) -> str:
+    """A name unique among `used_names`, the names of the variants of the same product"""
     name_parts = []
 
     size_attrs = ['size', 'dimension', 'weight', 'capacity']
@@ -288,17 +333,21 @@ class ProductGenerator:
         types = ['chain', 'beaded', 'cuff', 'hoop']
         name_parts = [random.choice(materials), random.choice(types)]
       else:
+        fake = SharedFaker.get()
         name_parts = [fake.color_name().lower(), fake.word().lower()]
 
     variant_name = '-'.join(name_parts[:2])
 
+    if used_names is None:
+      return variant_name
     base_name = variant_name
     counter = 1
-    while variant_name in self.used_variant_names:
+    # At most 4 variants per product, the walk stays short
+    while variant_name in used_names:
       variant_name = f"{base_name}-{counter}"
       counter += 1
 
-    self.used_variant_names.add(variant_name)
+    used_names.add(variant_name)
     return variant_name
 
   def generate_product_details(self, subcategory: Dict,
@@ -324,6 +373,7 @@ class ProductGenerator:
       details = {}
       subcategory_id = subcategory.get('id', 'unknown')
       variants_ids: list[str] = []
+      used_names: set[str] = set()
       main_variant_id = str(ULID())  # Ensure a default main variant ID
 
       if has_variants:
@@ -335,7 +385,7 @@ class ProductGenerator:
           for attr_id, attr_config in variant_attrs.items():
             variant_data[attr_id] = self.generate_any_value(attr_config)
 
-          variant_name = self.generate_variant_name(subcategory_id, variant_data)
+          variant_name = self.generate_variant_name(subcategory_id, variant_data, used_names)
           details[variant_id] = {"variant_name": variant_name, "variant_data": variant_data}
 
         main_variant_id = variants_ids[0]  # First variant is main
@@ -463,6 +513,11 @@ class ProductGenerator:
 
           for img_file in selected_images:
             attachment_id = str(ULID())
+            if self.minio_client is None:
+              # Offline generator, nothing to upload
+              images_map[attachment_id] = placeholder_media(attachment_id)
+              continue
+
             image_path = os.path.join(attachments_path,
                                       img_file) if os.path.exists(attachments_path) else img_file
 
@@ -479,11 +534,7 @@ class ProductGenerator:
               images_map[attachment_id] = image_info
             except Exception as e:
               print(f"❌ Error uploading image for attachment ID {attachment_id}: {e}")
-              images_map[attachment_id] = {
-                  "format": "JPEG",
-                  "url": f"https://placeholder.com/{attachment_id}.jpg",
-                  "size": random.randint(50000, 2000000)
-              }
+              images_map[attachment_id] = placeholder_media(attachment_id)
 
         except Exception as e:
           raise SeedingError(
@@ -526,33 +577,33 @@ class ProductGenerator:
     pass
 
 
-def seed_products(conn, cfg: Config):
-  """Main function to seed products for suppliers"""
+def seed_products(conn, cfg: Config, registry: SeedRegistry | None = None):
+  """
+    Main function to seed products for suppliers.
+    The checkpoint position is the number of (supplier, product) slots already processed.
+    """
+  checkpoint = Checkpoint(conn, 'products', cfg)
+  if checkpoint.already_completed():
+    return
+  start = checkpoint.start()
+
   try:
     generator = ProductGenerator(cfg)
   except SeedingError as e:
     print(f"❌ FATAL ERROR: Generator initialization failed. Cannot seed products. Error: {e}")
     return
 
-  fashion_brands = [
-      "Zara", "H&M", "Gucci", "Louis Vuitton", "Chanel", "Nike", "Adidas", "Prada", "Hermès",
-      "Dior", "Burberry", "Versace", "Armani", "Calvin Klein", "Ralph Lauren", "Tommy Hilfiger",
-      "Balenciaga", "Fendi", "Dolce & Gabbana", "Yves Saint Laurent"
-  ]
-
-  try:
-    with conn.cursor(cursor_factory=RealDictCursor) as cur:
-      # --- Fetch Supplier IDs ---
-      stmt = "SELECT id FROM users WHERE user_type = 'supplier' AND roles && %s ORDER BY created_at LIMIT %s"
-      cur.execute(stmt, (
-          ['supplier_admin'],
-          cfg.seeding.number_of_suppliers_have_products,
-      ))
-      rows_ids = cur.fetchall()
-      supplier_ids: list[str] = [row['id'] for row in rows_ids]
-  except Psycopg2Error as e:
-    print(f"❌ DB ERROR: Failed to fetch supplier IDs. Error: {e}")
-    return
+  supplier_ids = None
+  if registry:
+    supplier_ids = registry.user_ids('supplier', 'supplier_admin',
+                                     cfg.seeding.number_of_suppliers_have_products)
+  read_cur = None
+  if supplier_ids is None:
+    # --- Stream Supplier IDs, a page at a time ---
+    read_cur = conn.cursor()
+    supplier_ids = stream_user_ids(read_cur, 'supplier', 'supplier_admin',
+                                   cfg.seeding.number_of_suppliers_have_products,
+                                   cfg.seeding.batch_size)
 
   try:
     with conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -570,100 +621,63 @@ def seed_products(conn, cfg: Config):
     print(f"❌ DB/CATEGORY ERROR: Failed to fetch category data. Error: {e}")
     return
 
-  # Prepare for sequential subcategory selection
-  subcategory_cycle = []
-  for supplier_id in supplier_ids:
-    for _ in range(cfg.seeding.number_of_products_per_supplier):
-      subcategory_idx = (len(subcategory_cycle)) % len(subcategories)
-      subcategory_cycle.append(subcategories[subcategory_idx])
+  # Products generated since the last write: (insert args, title, offer), kept until written
+  held: list[tuple[tuple, str, Dict[str, Any]]] = []
+
+  def insert(cur, products: list[tuple[tuple, str, Dict[str, Any]]]):
+    with StatementPipeline(cur, cfg.seeding.pipeline_statements) as pipeline:
+      for args, _, _ in products:
+        pipeline.execute(INSERT_PRODUCT_STMT, args)
+
+  def write(cur):
+    if FileSink.enabled():
+      FileSink.write('products', PRODUCT_COLUMNS, [args for args, _, _ in held])
+      return
+    # Rejected products are dropped, a restarted transaction only replays the accepted ones
+    held[:] = write_isolated(cur, held, insert, 'products',
+                             lambda product: {
+                                 'id': product[0][0],
+                                 'supplier_id': product[0][1],
+                                 'title': product[1]
+                             })
+
+  def written():
+    if registry:
+      for args, title, offer in held:
+        registry.publish_product(args[0], title, offer)
+    held.clear()
 
   product_index = 0
+  suppliers = ((supplier_id, 0) for supplier_id in supplier_ids)
+  if cfg.seeding.top_up:
+    # The slots of the products a supplier already has are skipped, so the new products get the
+    # subcategories a full run would have given them
+    read_cur = read_cur or conn.cursor()
+    suppliers = with_existing(read_cur, supplier_ids, 'products', 'user_id', cfg.seeding.batch_size)
 
   # Generate products for each supplier
-  for supplier_id in supplier_ids:
+  for supplier_id, existing in suppliers:
     print(f"Generating products for supplier {supplier_id}")
-    for _ in range(cfg.seeding.number_of_products_per_supplier):
+    for slot in range(cfg.seeding.number_of_products_per_supplier):
+      if product_index < start or slot < existing:
+        product_index += 1
+        continue
+
       product_ulid = str(ULID())  # Assign ULID early for error reporting
 
       try:
         # Get next subcategory in sequence
-        subcategory = subcategory_cycle[product_index]
+        subcategory = subcategories[product_index % len(subcategories)]
         product_index += 1
 
-        subcategory_id = subcategory.get('id')
-        has_variants = random.random() < 0.65
-        has_brand = random.random() > 0.4
-        has_product_id, product_id, product_id_type = generate_fashion_product_id_info()
-        description = fake.paragraph()
-        fulfillment_type = random.choice(FULFILLMENT_TYPE)
-        procesing_time = random.randint(1, 9)
-        bullet_points = generate_bullet_points_list()
-        status = random.choice(STATUS)
-        title = generate_product_title(subcategory.get('id', 'general'))
-        current_time = get_time_miliseconds()
-
-        # --- Data Generation Steps (wrapped by nested try/except in methods) ---
-        details, variant_data = generator.generate_product_details(subcategory, has_variants)
-        offer = generator.generate_product_offer(has_variants, variant_data['main_variant'],
-                                                 variant_data['variants_ids'])
-        media = generator.generate_product_media(has_variants=True,
-                                                 main_variant_id=variant_data['main_variant'],
-                                                 variant_ids=variant_data['variants_ids'],
-                                                 subcategory_id=subcategory_id)
-        safety = generator.generate_product_safety(subcategory)
-
-        # --- Prepare INSERT Arguments ---
-        args = (
-            product_ulid,  # 1 - id
-            supplier_id,  # 2
-            title,  # 3
-            'fashion',  # 4
-            subcategory_id,  # 5
-            has_variants,  # 6
-            random.choice(fashion_brands) if has_brand else None,  # 7 - brand_name
-            has_brand,  # 8 - has_brand_name
-            product_id,  # 9
-            has_product_id,  # 10
-            product_id_type,  # 11
-            description,  # 12
-            Json(bullet_points),  # 13
-            'USD',  # 14
-            fulfillment_type,  # 15
-            procesing_time,  # 16
-            Json(details),  # 17
-            Json(media),  # 18
-            Json(offer),  # 19
-            Json(safety),  # 20
-            Json([]),  # 21 - tags
-            Json({"source": "manual_entry"}),  # 22 - metadata
-            False,  # 23 - ar_enabled
-            title.replace(' ', '-').lower(),  # 24 - slug
-            status,  # 25
-            1,  # 26 - version
-            1,  # 27 - schema_version
-            current_time,  # 28 - created_at
-            None if status == 'pending' else current_time,  # 29 - published_at
-            None if status == 'pending' else current_time  # 30 - updated_at
-        )
+        args, title, offer = product_row(generator, supplier_id, subcategory, product_ulid)
 
-        # --- Execute INSERT ---
-        with conn.cursor() as cur:
-          cur.execute(
-              """
-                        INSERT INTO products (
-                            id, user_id, title, category, subcategory, has_variations, brand_name,
-                            has_brand_name, product_id, has_product_id, product_id_type, description,
-                            bullet_points, currency_code, fulfillment_type, processing_time, details,
-                            media, offer, safety, tags, metadata, ar_enabled, slug, status, version,
-                            schema_version, created_at, published_at, updated_at
-                        )
-                        VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                        )
-                    """, args)
+        # --- Hold the row until the checkpoint writes it ---
+        held.append((args, title, offer))
 
+        has_variants = args[5]
         print(
-            f"  - Created product {product_ulid} with {'variants' if has_variants else 'no variants'} for subcategory {subcategory.get('id')}"
+            f"  - Generated product {product_ulid} with {'variants' if has_variants else 'no variants'} for subcategory {subcategory.get('id')}"
         )
 
       except SeedingError as e:
@@ -671,11 +685,82 @@ def seed_products(conn, cfg: Config):
             f"❌ PRODUCT SEEDING FAILED for ID {product_ulid} (Supplier: {supplier_id}). Details: {e}"
         )
         continue  # Continue to the next product
-      except Psycopg2Error as e:
-        print(f"❌ DB INSERT FAILED for ID {product_ulid} (Supplier: {supplier_id}). Error: {e}")
-        continue  # Continue to the next product
       except Exception as e:
         print(
             f"❌ UNEXPECTED ERROR while generating product {product_ulid} (Supplier: {supplier_id}). Error: {e}"
         )
         continue  # Continue to the next product
+
+      if checkpoint.advance(product_index, write=write):
+        written()
+
+  if read_cur:
+    read_cur.close()
+  checkpoint.complete(product_index, write=write)
+  written()
+
+
+def product_row(generator: ProductGenerator, supplier_id: str, subcategory: Dict[str, Any],
+                product_ulid: str) -> tuple[tuple, str, Dict[str, Any]]:
+  """
+    Generates one product of `subcategory` for the supplier.
+    Returns the insert args (in PRODUCT_COLUMNS order), the title and the offer.
+    Raises SeedingError when a part of the product cannot be generated.
+    """
+  subcategory_id = subcategory.get('id')
+  has_variants = random.random() < 0.65
+  has_brand = random.random() > 0.4
+  has_product_id, product_id, product_id_type = generate_fashion_product_id_info()
+  description = ValuePools.text(DESCRIPTION_MIN_CHARS, DESCRIPTION_MAX_CHARS)
+  fulfillment_type = random.choice(FULFILLMENT_TYPE)
+  procesing_time = random.randint(1, 9)
+  bullet_points = generate_bullet_points_list()
+  status = random.choice(STATUS)
+  title = generate_product_title(subcategory.get('id', 'general'))
+  current_time = get_time_miliseconds()
+
+  # --- Data Generation Steps (wrapped by nested try/except in methods) ---
+  details, variant_data = generator.generate_product_details(subcategory, has_variants)
+  offer = generator.generate_product_offer(has_variants, variant_data['main_variant'],
+                                           variant_data['variants_ids'])
+  media = generator.generate_product_media(has_variants=True,
+                                           main_variant_id=variant_data['main_variant'],
+                                           variant_ids=variant_data['variants_ids'],
+                                           subcategory_id=subcategory_id)
+  safety = generator.generate_product_safety(subcategory)
+
+  # --- Prepare INSERT Arguments ---
+  args = (
+      product_ulid,  # 1 - id
+      supplier_id,  # 2
+      title,  # 3
+      'fashion',  # 4
+      subcategory_id,  # 5
+      has_variants,  # 6
+      random.choice(FASHION_BRANDS) if has_brand else None,  # 7 - brand_name
+      has_brand,  # 8 - has_brand_name
+      product_id,  # 9
+      has_product_id,  # 10
+      product_id_type,  # 11
+      description,  # 12
+      Json(bullet_points),  # 13
+      'USD',  # 14
+      fulfillment_type,  # 15
+      procesing_time,  # 16
+      Json(details),  # 17
+      Json(media),  # 18
+      Json(offer),  # 19
+      Json(safety),  # 20
+      Json([]),  # 21 - tags
+      Json({"source": "manual_entry"}),  # 22 - metadata
+      False,  # 23 - ar_enabled
+      title.replace(' ', '-').lower(),  # 24 - slug
+      status,  # 25
+      1,  # 26 - version
+      1,  # 27 - schema_version
+      current_time,  # 28 - created_at
+      None if status == 'pending' else current_time,  # 29 - published_at
+      None if status == 'pending' else current_time  # 30 - updated_at
+  )
+
+  return args, title, offer
@@ -1,12 +1,19 @@
 from enum import Enum
 import random
 
-from faker import Faker
-from psycopg2.extensions import connection
+from psycopg2.extensions import connection, cursor
 from ulid import ULID
 
+from general_utils.checkpoint import Checkpoint
+from general_utils.db import PreparedStatement
 from general_utils.general import password_hash, time_in_milies
+from general_utils.isolation import write_isolated
+from general_utils.pipeline import StatementPipeline
+from general_utils.sinks import FileSink
+from general_utils.value_pools import ValuePools
 from models.config import Config
+from seeders.registry import SeedRegistry
+from seeders.top_up import user_numbers
 
 
 class UserType(str, Enum):
@@ -23,62 +30,111 @@ class RoleId(str, Enum):
   CUSTOMER = "customer"
 
 
-stmt = """
+# Supplier moderators are not seeded for now
+SUPPLIER_ROLES = [
+    [RoleId.SUPPLIER_ADMIN.value],
+    [RoleId.SUPPLIER_VENDOR_MANAGER.value],
+]
+CUSTOMER_ROLES = [[RoleId.CUSTOMER.value]]
+
+USER_COLUMNS = ('id', 'username', 'first_name', 'last_name', 'email', 'user_type', 'membership',
+                'is_email_verified', 'password', 'roles', 'created_at')
+
+stmt = PreparedStatement(
+    'seed_insert_user', """
     INSERT INTO users(
         id, username, first_name, last_name, email, user_type, membership, 
         is_email_verified, password, roles, created_at
     )
     VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-"""
-
-
-def seed_users(conn: connection, cfg: Config):
-  insert_users(conn, cfg.seeding.number_of_suppliers, UserType.SUPPLIER)
-  insert_users(conn, cfg.seeding.number_of_customers, UserType.CUSTOMER)
-
-
-def insert_users(conn: connection, count: int, user_type: UserType):
-  fake = Faker()
-  user_email_counter = 0
-
-  # Define available roles for each user type
-  supplier_roles = [
-      [RoleId.SUPPLIER_ADMIN.value],
-      [RoleId.SUPPLIER_VENDOR_MANAGER.value],
-      # [RoleId.SUPPLIER_MODERATOR.value],
-  ]
-
-  customer_roles = [[RoleId.CUSTOMER.value]]
+""")
+
+
+def seed_users(conn: connection, cfg: Config, registry: SeedRegistry | None = None):
+  for user_type, count in ((UserType.SUPPLIER, cfg.seeding.number_of_suppliers),
+                           (UserType.CUSTOMER, cfg.seeding.number_of_customers)):
+    after = 0
+    if cfg.seeding.top_up:
+      with conn.cursor() as cur:
+        existing, after = user_numbers(cur, user_type.value)
+      count = max(0, count - existing)
+      print(f"Top-up: {existing} {user_type.value} users exist, adding {count}")
+    insert_users(conn, count, user_type, Checkpoint(conn, f"users.{user_type.value}", cfg),
+                 registry, cfg.seeding.pipeline_statements, after)
+
+
+def insert_users(conn: connection,
+                 count: int,
+                 user_type: UserType,
+                 checkpoint: Checkpoint,
+                 registry: SeedRegistry | None = None,
+                 pipeline_statements: int = 1,
+                 after: int = 0):
+  """
+    Inserts `count` users numbered supplier1@test.com, supplier2@test.com, ... starting after
+    number `after` (the last one already in the database when topping up).
+    The checkpoint position is the last email number written, resuming continues after it.
+    """
+  if checkpoint.already_completed():
+    return
+  start = checkpoint.start(after)
 
   password, err = password_hash("password")
   if err:
     raise RuntimeError("failed to hash a password, insert_users", err)
 
-  with conn.cursor() as cur:
-    for _ in range(count):
-      user_email_counter += 1
-      # Choose roles based on user type
-      if user_type == UserType.SUPPLIER:
-        roles = random.choice(supplier_roles)
-      else:
-        roles = random.choice(customer_roles)
-
-      email_prefix = "supplier" if user_type == UserType.SUPPLIER else "customer"
-      email = f"{email_prefix}{user_email_counter}@test.com"
-      try:
-        args = (
-            str(ULID()),
-            fake.user_name(),
-            fake.first_name(),
-            fake.last_name(),
-            email,
-            user_type.value,
-            "free",
-            True,
-            password,
-            roles,
-            time_in_milies(),
-        )
-        cur.execute(stmt, args)
-      except Exception as e:
-        raise RuntimeError("failed to insert a user in db", e)
+  # Rows generated since the last write, kept until the checkpoint wrote them
+  held: list[tuple] = []
+  stage = f"users.{user_type.value}"
+
+  def insert(cur: cursor, rows: list[tuple]):
+    with StatementPipeline(cur, pipeline_statements) as pipeline:
+      for args in rows:
+        pipeline.execute(stmt, args)
+
+  def write(cur: cursor):
+    if FileSink.enabled():
+      FileSink.write('users', USER_COLUMNS, held)
+      return
+    # Rejected rows are dropped, a restarted transaction only replays the accepted ones
+    held[:] = write_isolated(cur, held, insert, stage, lambda args: args[:6])
+
+  def written():
+    if registry:
+      for args in held:
+        registry.publish_user(user_type.value, args[0], args[9])
+    held.clear()
+
+  for user_email_counter in range(start + 1, after + count + 1):
+    held.append(user_row(user_type, user_email_counter, password))
+
+    if checkpoint.advance(user_email_counter, write=write):
+      written()
+
+  checkpoint.complete(after + count, write=write)
+  written()
+
+
+def user_row(user_type: UserType, number: int, password: str) -> tuple:
+  """Insert args (in USER_COLUMNS order) of the user with email <user_type><number>@test.com"""
+  # Choose roles based on user type
+  if user_type == UserType.SUPPLIER:
+    roles = random.choice(SUPPLIER_ROLES)
+  else:
+    roles = random.choice(CUSTOMER_ROLES)
+
+  return (
+      str(ULID()),
+      # Pooled names repeat, the suffix of the email makes the username unique
+      f"{ValuePools.draw('user_name')}_{user_type.value}{number}",
+      ValuePools.draw('first_name'),
+      ValuePools.draw('last_name'),
+      f"{user_type.value}{number}@test.com",
+      user_type.value,
+      "free",
+      True,
+      password,
+      roles,
+      # Whole milliseconds, the text formats (COPY, exported files) reject a fraction in INT8
+      int(time_in_milies()),
+  )
@@ -0,0 +1,82 @@
+from general_utils.db import DatabasePool
+from general_utils.scheduler import Stage, StageEntry
+from models.config import Config
+from seeders.registry import SeedRegistry
+
+
+# Every stage with the stages whose rows it reads, in the order they used to run one by one.
+# Stage modules are only imported when the stage runs
+STAGES = [
+    Stage('users', StageEntry('seeders.seed_users', 'seed_users')),
+    Stage('products', StageEntry('seeders.seed_products', 'seed_products'), ('users',)),
+    Stage('inventory', StageEntry('seeders.seed_inventory', 'run_inventory'), ('products',)),
+    Stage('orders', StageEntry('seeders.seed_orders', 'seed_orders'), ('users', 'inventory')),
+    Stage('hero_products', StageEntry('seeders.seed_hero_products', 'seed_hero_products'),
+          ('products', 'inventory')),
+    Stage('payment_methods', StageEntry('seeders.seed_payment_methods', 'run_payment_methods'),
+          ('users',)),
+]
+
+
+def run_on_pooled_connection(stage: Stage, cfg: Config, registry: SeedRegistry | None = None):
+  """Runs a stage in its own transaction, committed as soon as the stage is done"""
+  conn = DatabasePool.get_conn()
+  try:
+    conn.autocommit = False
+    stage.run(conn, cfg, registry)
+    conn.commit()
+  except Exception:
+    conn.rollback()
+    raise
+  finally:
+    DatabasePool.release_conn(conn)
+
+
+# Averages of the generators, used to plan row counts: 65% of the products have 2-4 variants
+# (seed_products), customers get 1-3 payment methods, suppliers get one of two roles
+VARIANTS_PER_PRODUCT = 0.65 * 3 + 0.35 * 1
+PAYMENT_METHODS_PER_CUSTOMER = 2
+SUPPLIER_ADMIN_SHARE = 0.5
+
+
+def planned_rows(cfg: Config, stage_names: list[str]) -> dict[str, tuple[int, bool]]:
+  """Rows each selected stage should write per table, as (rows, exact)"""
+  seeding = cfg.seeding
+  suppliers_with_products = min(seeding.number_of_suppliers_have_products,
+                                round(seeding.number_of_suppliers * SUPPLIER_ADMIN_SHARE))
+  products = suppliers_with_products * seeding.number_of_products_per_supplier
+  customers_with_orders = min(seeding.number_of_customers_have_orders,
+                              seeding.number_of_customers)
+  orders = customers_with_orders * seeding.number_of_orders_per_customer
+  line_items = round(orders * VARIANTS_PER_PRODUCT)
+
+  tables = {
+      'users': {
+          'users': (seeding.number_of_suppliers + seeding.number_of_customers, True)
+      },
+      'products': {
+          'products': (products, False)
+      },
+      'inventory': {
+          'inventory_items': (round(products * VARIANTS_PER_PRODUCT), False)
+      },
+      'orders': {
+          'orders': (orders, True),
+          'order_idempotency_keys': (orders, True),
+          'inventory_reservations': (orders, True),
+          'order_line_items': (line_items, False),
+          'inventory_reservation_items': (line_items, False),
+          'order_events': (orders * 2, True),
+      },
+      'hero_products': {
+          'hero_products': (1, True)
+      },
+      'payment_methods': {
+          'payment_methods': (customers_with_orders * PAYMENT_METHODS_PER_CUSTOMER, False)
+      },
+  }
+
+  plan: dict[str, tuple[int, bool]] = {}
+  for name in stage_names:
+    plan.update(tables[name])
+  return plan
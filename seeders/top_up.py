@@ -0,0 +1,60 @@
+"""
+Rows already in the database, counted by --top-up so that every stage only generates the
+shortfall against the configured counts.
+"""
+import re
+from itertools import islice
+from typing import Iterable, Iterator
+
+from psycopg2 import Error as Psycopg2Error
+from psycopg2.extensions import cursor
+
+from models.app import SeedingError
+
+
+def user_numbers(cur: cursor, user_type: str) -> tuple[int, int]:
+  """
+    Number of users of the type and the highest number of their seeded emails
+    (<type><number>@test.com, see user_row), new users are numbered after it.
+    """
+  pattern = f"^{re.escape(user_type)}([0-9]+)@test\\.com$"
+  try:
+    cur.execute(
+        "SELECT count(*), max(substring(email, %s)::INT8) FROM users WHERE user_type = %s",
+        (pattern, user_type))
+    count, last_number = cur.fetchone()
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to count the existing {user_type} users. Error: {e}") from e
+  return int(count), int(last_number or 0)
+
+
+def count_rows(cur: cursor, table: str) -> int:
+  try:
+    cur.execute(f"SELECT count(*) FROM {table}")
+    return int(cur.fetchone()[0])
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to count the existing {table} rows. Error: {e}") from e
+
+
+def existing_counts(cur: cursor, table: str, column: str, ids: list[str]) -> dict[str, int]:
+  """Number of rows of `table` referencing each of `ids` through `column`"""
+  try:
+    cur.execute(
+        f"SELECT {column}, count(*) FROM {table} WHERE {column} = ANY(%s) GROUP BY {column}",
+        (ids,))
+    return {row[0]: int(row[1]) for row in cur.fetchall()}
+  except Psycopg2Error as e:
+    raise SeedingError(f"Failed to count the existing {table} rows. Error: {e}") from e
+
+
+def with_existing(cur: cursor, ids: Iterable[str], table: str, column: str,
+                  page_size: int) -> Iterator[tuple[str, int]]:
+  """Every id with its number of rows in `table`, looked up a page of ids at a time"""
+  ids = iter(ids)
+  while True:
+    page = list(islice(ids, page_size))
+    if not page:
+      return
+    counts = existing_counts(cur, table, column, page)
+    for id in page:
+      yield id, counts.get(id, 0)
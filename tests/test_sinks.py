@@ -0,0 +1,48 @@
+import os
+
+from psycopg2.extras import Json
+
+from general_utils.sinks import TableFiles
+
+
+def read_copy_csv(path: str) -> list[list[str | None]]:
+  """Records as COPY ... WITH (FORMAT csv) reads them: only an unquoted empty field is NULL"""
+  records = []
+  with open(path, newline='') as f:
+    for line in f.read().splitlines():
+      fields, value, quoted, in_quotes, i = [], '', False, False, 0
+      while i < len(line):
+        char = line[i]
+        if in_quotes:
+          if char == '"' and line[i + 1:i + 2] == '"':
+            value += '"'
+            i += 1
+          elif char == '"':
+            in_quotes = False
+          else:
+            value += char
+        elif char == '"':
+          in_quotes = quoted = True
+        elif char == ',':
+          fields.append(value if quoted or value else None)
+          value, quoted = '', False
+        else:
+          value += char
+        i += 1
+      fields.append(value if quoted or value else None)
+      records.append(fields)
+  return records
+
+
+def test_csv_keeps_null_apart_from_empty_string(tmp_path):
+  files = TableFiles(str(tmp_path), 'items', ('a', 'b', 'c', 'd', 'e', 'f'), 'csv', 10)
+  files.write([
+      ('x', None, 5, '', 'say "hi", bye', Json({'k': None})),
+      (None, True, None, ['a', 'b'], None, None),
+  ])
+  files.close()
+
+  assert read_copy_csv(os.path.join(str(tmp_path), files.files[0])) == [
+      ['x', None, '5', '', 'say "hi", bye', '{"k": null}'],
+      [None, 't', None, '{"a","b"}', None, None],
+  ]